@@ -31,6 +31,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'bookland.profiling.QueryProfileMiddleware',  # первым - время ответа с учётом остальных middleware
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -42,6 +43,13 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'apps.urls'
 
+# Профилирование SQL по запросам (bookland.profiling): сводка - /__stats__/,
+# отчёт по файлу BOOKLAND_PROFILE_LOG - python manage.py bookland_profile
+BOOKLAND_PROFILING = False
+BOOKLAND_SLOW_REQUEST_MS = 500  # запросы дольше попадают в буфер медленных вместе с SQL
+BOOKLAND_PROFILE_BUFFER = 50
+BOOKLAND_PROFILE_LOG = BASE_DIR / 'profile.jsonl'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -64,10 +72,19 @@ WSGI_APPLICATION = 'apps.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# bookland.sqlite - SQLite с WAL, busy_timeout и BEGIN IMMEDIATE (см. bookland/sqlite/base.py);
+# сравнение со стандартным бэкендом: python manage.py sqlite_contention
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'bookland.sqlite',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 600,  # постоянные соединения (PRAGMA применяются один раз на соединение)
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,  # с, ожидание блокировки записи
+            'transaction_mode': 'IMMEDIATE',
+            # 'pragmas': {'mmap_size': 0},  # переопределение bookland.sqlite.base.DEFAULT_PRAGMAS
+        },
     }
 }
 
@@ -108,6 +125,48 @@ USE_TZ = False
 
 STATIC_URL = 'static/'
 
+# Загружаемые файлы (аудио, торренты, обложки, доп. файлы)
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Хранилище загрузок с дедупликацией: одинаковые файлы лежат на диске один раз
+# (блоб в MEDIA_ROOT/.blobs, имена - жёсткие ссылки), см. bookland/storage.py и manage.py media_dedup
+STORAGES = {
+    'default': {
+        'BACKEND': 'bookland.storage.DedupFileSystemStorage',
+        'OPTIONS': {'blob_dir': '.blobs'},
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# Отдача MEDIA веб-сервером (bookland.media): None - сам Django (Range, ETag, sendfile),
+# 'x-accel' - nginx (X-Accel-Redirect на MEDIA_ACCEL_PREFIX + путь), 'x-sendfile' - Apache/lighttpd
+MEDIA_OFFLOAD = None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+
+# Процессов для построения уменьшенных копий обложек (bookland.thumbnails); 0 - строить сразу при сохранении
+THUMBNAIL_WORKERS = 2
+
+# Кэш. LocMemCache - в памяти процесса, вытеснение LRU по MAX_ENTRIES. Общий для
+# нескольких процессов кэш на диске с ограничением объёма (LRU) - bookland.cache_backends:
+#     'BACKEND': 'bookland.cache_backends.LRUFileBasedCache',
+#     'LOCATION': BASE_DIR / 'cache',
+#     'OPTIONS': {'MAX_SIZE': 256 * 1024 * 1024, 'MAX_ENTRIES': 100000},
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bookland',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+BOOKLAND_CACHE = 'default'  # Алиас кэша для bookland.cache
+BOOKLAND_CACHE_TIMEOUT = 3600
+
+# Готовые шарды карты сайта (bookland.sitemaps) - перестраиваются только изменившиеся
+BOOKLAND_SITEMAP_DIR = BASE_DIR / 'sitemaps'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
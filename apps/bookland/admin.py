@@ -1,14 +1,16 @@
 # D:\Python\myProject\Bookland\apps\bookland\admin.py
 
 
-from django.contrib.admin.sites import site
-from django.contrib import admin
-from django.core.checks import messages
-from django.core.exceptions import ObjectDoesNotExist
-from django.core.files.storage import default_storage
+from django.contrib import admin, messages
+from django.db.models import OuterRef, Subquery
 from django.utils.html import format_html
-from django.utils.safestring import mark_safe
-from .models import *
+from .models import (
+    AdditionalFile, AudioFile, Author, BookImage, Cycle, ModelBooks, ModelCategories, ModelSubcategories, Reader,
+    SocialMediaLink, SocialMediaPlatform, StoredFile, TorrentFile,
+)
+from .search import search_queryset
+from .signals import touch_books
+from .thumbnails import thumbnail_url
 
 
 class SubCategoriesInline(admin.TabularInline):
@@ -21,7 +23,7 @@ class SubCategoriesInline(admin.TabularInline):
 
 @admin.register(ModelCategories)
 class ModelCategoriesAdmin(admin.ModelAdmin):
-    list_display = ("name", "slug", "description")
+    list_display = ("name", "slug", "published_books", "total_books", "description")
     prepopulated_fields = {"slug": ("name",)}
     search_fields = ("name",)
     ordering = ("name",)  # сортируем по имени категории
@@ -30,12 +32,13 @@ class ModelCategoriesAdmin(admin.ModelAdmin):
 
 @admin.register(ModelSubcategories)
 class ModelSubcategoriesAdmin(admin.ModelAdmin):
-    list_display = ("category", "name", "slug", "description")
+    list_display = ("category", "name", "slug", "published_books", "total_books", "description")
     list_display_links = ("name", "slug")  # поля-ссылки на экземпляр модели
     prepopulated_fields = {"slug": ("name",)}
-    # search_fields = ('name', 'category__name')
+    search_fields = ("name", "category__name")  # в т.ч. для autocomplete жанров на странице книги
     ordering = ("category", "name")  # порядок сортировки
     list_filter = ("category",)
+    list_select_related = ("category",)
 
 
 @admin.register(Cycle)
@@ -45,14 +48,6 @@ class CycleAdmin(admin.ModelAdmin):
     prepopulated_fields = {"slug": ("name",)}
     ordering = ("name",)  # Сортируем по названию цикла
 
-    def get_search_results(self, request, queryset, search_term):
-        queryset, use_distinct = super().get_search_results(
-            request, queryset, search_term
-        )
-        if "autocomplete" in request.GET:
-            queryset = queryset.filter(name__icontains=search_term)
-        return queryset, use_distinct
-
 
 # @admin.register(TorrentFile)
 # class TorrentFileAdmin(admin.ModelAdmin):
@@ -62,26 +57,23 @@ class CycleAdmin(admin.ModelAdmin):
 class TorrentFileInline(admin.TabularInline):
     model = TorrentFile
     # form = TorrentFileForm
-    extra = 1
+    extra = 0  # пустые строки добавляет кнопка "Добавить ещё" на стороне браузера
+    readonly_fields = ("info_hash", "total_size")
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("reader")  # str(torrent) - без запроса на строку
 
     def get_formset(self, request, obj=None, **kwargs):
         FormSet = super().get_formset(request, obj, **kwargs)
-
-        class WrapperFormSet(FormSet):
-            def __init__(self, *args, **kwargs):
-                super().__init__(*args, **kwargs)
-                for form in self.forms:
-                    form.fields["reader"].queryset = (
-                        obj.readers.all() if obj else Reader.objects.none()
-                    )
-
-        return WrapperFormSet
+        # Чтецы - только этой книги, в т.ч. в шаблоне новой строки (empty_form), а не все чтецы каталога
+        FormSet.form.base_fields["reader"].queryset = obj.readers.all() if obj else Reader.objects.none()
+        return FormSet
 
 
 @admin.register(BookImage)
 class BookImageAdmin(admin.ModelAdmin):
     list_display = ("book_title", "image_preview", "image_filename")
-    list_filter = ("book",)
+    list_select_related = ("book",)
     search_fields = ("book__title",)
     raw_id_fields = ("book",)
 
@@ -92,7 +84,10 @@ class BookImageAdmin(admin.ModelAdmin):
 
     def image_preview(self, obj):
         if obj.image:
-            return format_html('<img src="{}" width="50" height="50" />', obj.image.url)
+            return format_html(
+                '<img src="{}" width="50" height="50" style="object-fit: contain" loading="lazy" />',
+                thumbnail_url(obj, 'thumb'),
+            )
         return "Нет изображения"
 
     image_preview.short_description = "Предпросмотр"
@@ -114,20 +109,24 @@ class BookImageInline(admin.TabularInline):
     """Отображение дополнительных файлов картинок на странице книги"""
 
     model = BookImage
-    extra = 1  # Количество пустых дополнительных файлов для добавления
+    extra = 0  # Пустые строки - кнопкой "Добавить ещё", без лишних форм при открытии книги
     image = ("image",)  # Поля для отображения
 
 
 @admin.register(AudioFile)
 class AudioFileAdmin(admin.ModelAdmin):
     list_display = ("book", "order", "duration", "file")
-    list_filter = ("book",)
     search_fields = ("book__title",)
+    autocomplete_fields = ("book",)
     ordering = ("book", "order")
 
-    fieldsets = ((None, {"fields": ("book", "file", "order", "duration")}),)
+    fieldsets = ((None, {"fields": ("book", "file", "order", "duration", "bitrate", "codec")}),)
+
+    readonly_fields = ("duration", "bitrate", "codec")  # заполняет manage.py audio_metadata
 
-    readonly_fields = ("duration",)
+    def get_queryset(self, request):
+        # Авторы книг (для str(book)) - одним дополнительным запросом на страницу
+        return super().get_queryset(request).prefetch_related("book__authors")
 
     def get_readonly_fields(self, request, obj=None):
         if obj:  # если это существующий объект
@@ -139,7 +138,7 @@ class AudioFileInline(admin.TabularInline):
     """Отображение аудиофайлов на странице книги"""
 
     model = AudioFile
-    extra = 1  # Количество пустых аудиофайлов для добавления
+    extra = 0  # Пустые строки - кнопкой "Добавить ещё" (много частей - bookland.audio_ingest)
     # fields = ('file', 'order', 'duration')  # Поля для отображения
     # readonly_fields = ('duration',)  # Поле только для чтения (длительность)
 
@@ -147,7 +146,8 @@ class AudioFileInline(admin.TabularInline):
 @admin.register(AdditionalFile)
 class AdditionalFileAdmin(admin.ModelAdmin):
     list_display = ("book_title", "file_name", "file_type", "file_size", "file_link")
-    list_filter = ("book", "file_type")
+    list_filter = ("file_type",)
+    list_select_related = ("book",)
     search_fields = ("book__title", "file__name", "file_type")
     raw_id_fields = ("book",)
 
@@ -161,22 +161,23 @@ class AdditionalFileAdmin(admin.ModelAdmin):
 
     file_name.short_description = "Имя файла"
 
+    def get_queryset(self, request):
+        # Размер и наличие файла - из таблицы сканера хранилища (bookland.integrity), без stat на строку
+        stored = StoredFile.objects.filter(path=OuterRef("file"))
+        return super().get_queryset(request).annotate(
+            stored_size=Subquery(stored.values("size")[:1]),
+            stored_exists=Subquery(stored.values("exists")[:1]),
+        )
+
     def file_size(self, obj):
-        try:
-            return f"{obj.file.size / 1024 / 1024:.2f} MB"
-        except (ObjectDoesNotExist, FileNotFoundError):
+        if obj.stored_exists is None:
+            return "Не проверен"
+        if not obj.stored_exists:
             return "Файл не найден"
+        return f"{obj.stored_size / 1024 / 1024:.2f} MB"
 
     file_size.short_description = "Размер файла"
 
-    def file_link(self, obj):
-        try:
-            return format_html('<a href="{}" target="_blank">Скачать</a>', obj.file.url)
-        except (ObjectDoesNotExist, FileNotFoundError):
-            return "Файл не найден"
-
-    file_link.short_description = "Ссылка"
-
     def file_link(self, obj):
         return format_html('<a href="{}" target="_blank">Скачать</a>', obj.file.url)
 
@@ -194,8 +195,10 @@ class AdditionalFileAdmin(admin.ModelAdmin):
             file_extension = obj.file.name.split(".")[-1].lower()
             obj.file_type = file_extension
 
-        # Проверяем существование файла перед сохранением
-        if not default_storage.exists(obj.file.name):
+        # Новый файл сохраняется вместе с записью; для прежнего - данные последнего сканирования хранилища
+        if change and "file" not in form.changed_data and StoredFile.objects.filter(
+            path=obj.file.name, exists=False
+        ).exists():
             self.message_user(
                 request,
                 f"Внимание: файл {obj.file.name} не найден в хранилище.",
@@ -209,14 +212,27 @@ class AdditionalFileInline(admin.TabularInline):
     """Отображение дополнительных файлов на странице книги"""
 
     model = AdditionalFile
-    extra = 1  # Количество пустых дополнительных файлов для добавления
+    extra = 0  # Пустые строки - кнопкой "Добавить ещё"
     fields = ("file",)  # Поля для отображения
 
 
+@admin.register(StoredFile)
+class StoredFileAdmin(admin.ModelAdmin):
+    """Результаты сканирования хранилища (manage.py scan_storage): сироты и пропавшие файлы"""
+
+    list_display = ("path", "size", "mtime", "exists", "referenced", "checked_at")
+    list_filter = ("exists", "referenced")
+    search_fields = ("path",)
+    readonly_fields = ("path", "size", "mtime", "exists", "referenced", "checked_at")
+
+    def has_add_permission(self, request):
+        return False
+
+
 # Инлайн для отображения ссылок на социальные сети внутри админки книги
 class SocialMediaLinkInline(admin.StackedInline):
     model = SocialMediaLink
-    extra = 1  # Одна пустая строка для новой ссылки
+    extra = 0  # Пустая форма ссылки - кнопкой "Добавить ещё"
     fields = ("platform", "url", "video_url", "description", "post_date")
     show_change_link = False  # Убрана ссылка на редактирование отдельно
 
@@ -246,14 +262,18 @@ class ModelBooksAdmin(admin.ModelAdmin):
     list_editable = ("is_published",)  # Редактируемость полей в списке
     search_fields = (
         "title",
-        "cycle",
+        "cycle__name",
     )  # Поля для поиска
     list_filter = ("is_published",)  # Фильтры для админки
+    list_select_related = ("cycle",)  # Цикл в списке - без запроса на каждую строку
     prepopulated_fields = {"slug": ("title",)}  # Автозаполнение поля slug
-    filter_horizontal = (
+    # Жанры, авторы, чтецы и цикл - autocomplete: страница загружает только выбранные значения,
+    # остальные подгружаются постранично по вводу (admin/autocomplete/), а не все записи каталога
+    autocomplete_fields = (
         "book_subcategories",
         "authors",
         "readers",
+        "cycle",
     )
     ordering = (
         "cycle",
@@ -283,6 +303,30 @@ class ModelBooksAdmin(admin.ModelAdmin):
         SocialMediaLinkInline,
     ]
 
+    def get_queryset(self, request):
+        # Строка авторов для str(book) - аннотацией (в т.ч. для autocomplete-виджетов файлов)
+        return super().get_queryset(request).with_authors_str()
+
+    def save_formset(self, request, form, formset, change):
+        if formset.model is not AudioFile:
+            return super().save_formset(request, form, formset, change)
+        # Перестановка частей (изменён только номер) - одним bulk_update, а не UPDATE на каждую часть
+        instances = formset.save(commit=False)
+        for obj in formset.deleted_objects:
+            obj.delete()
+        reordered = [obj for obj, fields in formset.changed_objects if fields == ['order']]
+        if reordered:
+            AudioFile.objects.bulk_update(reordered, ['order'])
+            touch_books([form.instance.pk])
+        for obj in instances:
+            if obj not in reordered:
+                obj.save()
+        formset.save_m2m()
+
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по полнотекстовому индексу (название, авторы, чтецы, цикл, описание) вместо LIKE '%...%'
+        return search_queryset(queryset, search_term), False
+
     # def get_inline_instances(self, request, obj=None):
     #     inline_instances = super().get_inline_instances(request, obj)
     #     for inline in inline_instances:
@@ -0,0 +1,433 @@
+# D:\Python\myProject\Bookland\apps\bookland\api.py
+
+'''Публичный JSON API каталога (только чтение).
+
+GET /api/books/, /api/authors/, /api/readers/, /api/cycles/, /api/categories/,
+/api/subcategories/ - списки; детальные страницы - по тем же слагам, что и
+get_absolute_url моделей (/api/books/<slug>/, /api/categories/<cat>/<subcat>/ ...).
+
+- Пагинация по ключу (keyset): ?after=<курсор из поля next>&limit=<1..100>.
+  Следующая страница выбирается условием "после последней записи" по индексу,
+  без OFFSET, - стоимость не растёт с номером страницы.
+- Поля ответа: ?fields=title,slug,authors. Связи (авторы, чтецы, жанры)
+  подгружаются prefetch только если запрошены - число запросов на страницу
+  постоянно и не зависит от limit.
+- Книги отдаются со слабым ETag по ключам и time_update (карточка - и с
+  Last-Modified); неизменная страница отвечает 304 после одного запроса ключей.
+  У страниц списка Last-Modified нет: книга, ушедшая со страницы (удалена, снята
+  с публикации, сдвинута сортировкой), меняет страницу, но не max(time_update).
+  Остальные ресурсы - слабый ETag по хешу тела ответа.
+
+Карточки книг, страницы авторов, чтецов, циклов, жанров и дерево жанров
+кэшируются (bookland.cache).
+
+Представления асинхронные (async ORM) - под ASGI запрос не занимает поток
+на время ожидания БД и медленного клиента.
+'''
+
+import base64
+import hashlib
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.http import Http404, HttpResponseNotAllowed, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from . import cache
+from .models import Author, Cycle, ModelBooks, ModelCategories, ModelSubcategories, Reader
+
+API_DEFAULT_LIMIT = 20
+API_MAX_LIMIT = 100
+
+
+class ApiError(Exception):
+    pass
+
+
+# --- Пагинация по ключу ---
+
+class Keyset:
+    ''' Порядок записей и условие "строго после" для курсора.
+    keys - [(поле, по убыванию, может быть NULL)]; NULL всегда в конце.
+    '''
+
+    def __init__(self, *keys):
+        self.keys = keys
+
+    def order_by(self):
+        order = []
+        for field, descending, nullable in self.keys:
+            expression = models.F(field)
+            if nullable:
+                order.append(expression.desc(nulls_last=True) if descending else expression.asc(nulls_last=True))
+            else:
+                order.append(expression.desc() if descending else expression.asc())
+        return order
+
+    def values(self, obj):
+        return [getattr(obj, field) for field, _, _ in self.keys]
+
+    def after(self, values):
+        ''' Q для записей после позиции values (значения ключей последней записи страницы). '''
+        condition = models.Q(pk__in=[])  # после совпадения по всем ключам - ничего
+        for (field, descending, nullable), value in reversed(list(zip(self.keys, values))):
+            if value is None:  # NULL в конце порядка: дальше - только NULL с большими младшими ключами
+                condition = models.Q(**{f"{field}__isnull": True}) & condition
+                continue
+            beyond = models.Q(**{f"{field}__{'lt' if descending else 'gt'}": value})
+            if nullable:
+                beyond |= models.Q(**{f"{field}__isnull": True})
+            condition = beyond | (models.Q(**{field: value}) & condition)
+        return condition
+
+    @staticmethod
+    def encode(values):
+        return base64.urlsafe_b64encode(json.dumps(values, ensure_ascii=False).encode()).decode().rstrip('=')
+
+    def decode(self, cursor, model):
+        ''' Значения ключей из курсора; каждое проверяется полем model (подделанный курсор - 400, а не 500). '''
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        except ValueError:
+            raise ApiError("Неверный курсор after.")
+        if not isinstance(values, list) or len(values) != len(self.keys):
+            raise ApiError("Неверный курсор after.")
+        decoded = []
+        for (field, _, nullable), value in zip(self.keys, values):
+            if value is None and nullable:
+                decoded.append(None)
+                continue
+            if value is None or isinstance(value, (dict, list, bool)):
+                raise ApiError("Неверный курсор after.")
+            try:
+                decoded.append(model._meta.get_field(field).to_python(value))
+            except ValidationError:
+                raise ApiError("Неверный курсор after.")
+        return decoded
+
+
+# --- Ресурсы ---
+
+def _people(people):
+    return [{'slug': person.slug, 'name': str(person)} for person in people]
+
+
+def _links(objects):
+    return [{'slug': obj.slug, 'name': obj.name} for obj in objects]
+
+
+class Resource:
+    ''' Описание ресурса API: queryset, порядок, сериализуемые поля и нужные им prefetch. '''
+    model = None
+    keyset = Keyset(('id', False, False))
+    # Имя поля ответа -> (поля модели для only(), связи: prefetch или '=поле' для select_related,
+    #                    функция сериализации)
+    fields = {}
+    list_fields = ()
+    detail_fields = ()
+
+    def get_queryset(self):
+        return self.model.objects.all()
+
+    def parse_fields(self, request, default):
+        requested = request.GET.get('fields')
+        if not requested:
+            return default
+        names = tuple(dict.fromkeys(name.strip() for name in requested.split(',') if name.strip()))
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ApiError(f"Неизвестные поля: {', '.join(unknown)}. Доступны: {', '.join(self.fields)}.")
+        return names
+
+    def queryset_for(self, names, queryset=None):
+        ''' Запрос только нужных колонок и связей (для каждой связи - один prefetch-запрос). '''
+        queryset = self.get_queryset() if queryset is None else queryset
+        columns = {'pk'} | {field for field, _, _ in self.keyset.keys}
+        related = []
+        for name in names:
+            own, relations, _ = self.fields[name]
+            columns.update(own)
+            related.extend(relations)
+        select = [relation for relation in related if isinstance(relation, str) and relation.startswith('=')]
+        prefetch = [relation for relation in related if relation not in select]
+        queryset = queryset.only(*columns)
+        if select:
+            queryset = queryset.select_related(*(relation[1:] for relation in select))
+        return queryset.prefetch_related(*prefetch) if prefetch else queryset
+
+    def serialize(self, obj, names):
+        return {name: self.fields[name][2](obj) for name in names}
+
+
+class BookResource(Resource):
+    model = ModelBooks
+    keyset = Keyset(('year', True, True), ('title', False, False), ('id', False, False))
+    fields = {
+        'id': ((), (), lambda book: book.pk),
+        'slug': (('slug',), (), lambda book: book.slug),
+        'title': (('title',), (), lambda book: book.title),
+        'work_type': (('work_type',), (), lambda book: book.work_type),
+        'year': (('year',), (), lambda book: book.year),
+        'duration': (('duration',), (), lambda book: book.duration.total_seconds() if book.duration else None),
+        'description': (('description',), (), lambda book: book.description),
+        'cycle': (
+            ('cycle', 'cycle_number'), ('=cycle',),
+            lambda book: {'slug': book.cycle.slug, 'name': book.cycle.name, 'number': book.cycle_number}
+            if book.cycle else None,
+        ),
+        'authors': ((), ('authors',), lambda book: _people(book.authors.all())),
+        'readers': ((), ('readers',), lambda book: _people(book.readers.all())),
+        'subcategories': (
+            (), (models.Prefetch('book_subcategories', ModelSubcategories.objects.select_related('category')),),
+            lambda book: [
+                {'slug': sub.slug, 'name': sub.name, 'category': sub.category.slug}
+                for sub in book.book_subcategories.all()
+            ],
+        ),
+        'updated': (('time_update',), (), lambda book: book.time_update),
+    }
+    list_fields = ('id', 'slug', 'title', 'year', 'authors')
+    detail_fields = tuple(fields)
+
+    def get_queryset(self):
+        return ModelBooks.objects.filter(is_published=True)
+
+
+def _books_field(related_name, *columns):
+    ''' Поле "books" - опубликованные книги автора, чтеца, цикла или поджанра (один prefetch-запрос).
+    columns - колонка обратного ForeignKey, без неё prefetch догружал бы её для каждой книги.
+    '''
+    books = ModelBooks.objects.filter(is_published=True).only('slug', 'title', 'year', *columns)
+    return (
+        (), (models.Prefetch(related_name, books),),
+        lambda obj: [
+            {'slug': book.slug, 'title': book.title, 'year': book.year} for book in getattr(obj, related_name).all()
+        ],
+    )
+
+
+class PersonResource(Resource):
+    keyset = Keyset(('surname_nick', False, False), ('name', False, False), ('id', False, False))
+    fields = {
+        'id': ((), (), lambda person: person.pk),
+        'slug': (('slug',), (), lambda person: person.slug),
+        'surname_nick': (('surname_nick',), (), lambda person: person.surname_nick),
+        'name': (('name',), (), lambda person: person.name),
+        'patronymic': (('patronymic',), (), lambda person: person.patronymic),
+        'description': (('description',), (), lambda person: person.description),
+    }
+    list_fields = ('id', 'slug', 'surname_nick', 'name')
+
+
+class AuthorResource(PersonResource):
+    model = Author
+    fields = {**PersonResource.fields, 'books': _books_field('modelbooks_set')}
+    detail_fields = tuple(fields)
+
+
+class ReaderResource(PersonResource):
+    model = Reader
+    fields = {**PersonResource.fields, 'books': _books_field('books')}
+    detail_fields = tuple(fields)
+
+
+class CycleResource(Resource):
+    model = Cycle
+    keyset = Keyset(('name', False, False), ('id', False, False))
+    fields = {
+        'id': ((), (), lambda cycle: cycle.pk),
+        'slug': (('slug',), (), lambda cycle: cycle.slug),
+        'name': (('name',), (), lambda cycle: cycle.name),
+        'description': (('description',), (), lambda cycle: cycle.description),
+        'books': _books_field('modelbooks_set', 'cycle'),
+    }
+    list_fields = ('id', 'slug', 'name')
+    detail_fields = tuple(fields)
+
+
+class CategoryResource(Resource):
+    model = ModelCategories
+    fields = {
+        'id': ((), (), lambda category: category.pk),
+        'slug': (('slug',), (), lambda category: category.slug),
+        'name': (('name',), (), lambda category: category.name),
+        'description': (('description',), (), lambda category: category.description),
+        'books_count': (('published_books',), (), lambda category: category.published_books),
+        'subcategories': ((), ('subcategories',), lambda category: _links(category.subcategories.all())),
+    }
+    list_fields = ('id', 'slug', 'name', 'books_count', 'subcategories')
+    detail_fields = tuple(fields)
+
+
+class SubcategoryResource(Resource):
+    model = ModelSubcategories
+    fields = {
+        'id': ((), (), lambda sub: sub.pk),
+        'slug': (('slug',), (), lambda sub: sub.slug),
+        'name': (('name',), (), lambda sub: sub.name),
+        'description': (('description',), (), lambda sub: sub.description),
+        'category': (('category',), ('=category',), lambda sub: {'slug': sub.category.slug, 'name': sub.category.name}),
+        'books_count': (('published_books',), (), lambda sub: sub.published_books),
+        'books': _books_field('modelbooks_set'),
+    }
+    list_fields = ('id', 'slug', 'name', 'category', 'books_count')
+    detail_fields = tuple(fields)
+
+
+RESOURCES = {
+    'books': BookResource(),
+    'authors': AuthorResource(),
+    'readers': ReaderResource(),
+    'cycles': CycleResource(),
+    'categories': CategoryResource(),
+    'subcategories': SubcategoryResource(),
+}
+
+
+# --- Ответы ---
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, encoder=DjangoJSONEncoder, json_dumps_params={'ensure_ascii': False})
+
+
+def _etag(*parts):
+    return 'W/"%s"' % hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+
+
+def _not_modified(request, etag, last_modified=None):
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def _with_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def _by_content(request, response):
+    ''' Слабый ETag по хешу тела: 304, если у клиента то же представление. '''
+    etag = _etag(response.content)
+    not_modified = _not_modified(request, etag)
+    return not_modified if not_modified is not None else _with_validators(response, etag)
+
+
+def _limit(request):
+    try:
+        return min(max(int(request.GET.get('limit', API_DEFAULT_LIMIT)), 1), API_MAX_LIMIT)
+    except ValueError:
+        raise ApiError("limit должен быть числом.")
+
+
+def _page(request, resource, objects, names, has_next):
+    data = {'results': [resource.serialize(obj, names) for obj in objects], 'next': None}
+    if has_next:
+        params = request.GET.copy()
+        params['after'] = Keyset.encode(resource.keyset.values(objects[-1]))
+        data['next'] = f"{request.path}?{params.urlencode()}"
+    return data
+
+
+async def _aget_or_404(queryset):
+    try:
+        return await queryset.aget()
+    except queryset.model.DoesNotExist:
+        raise Http404("Запись не найдена")
+
+
+def _api_view(view):
+    ''' Асинхронное представление API: только GET/HEAD, ApiError -> 400.
+    (require_GET в Django 4.2 не поддерживает async-представления.)
+    '''
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return HttpResponseNotAllowed(['GET', 'HEAD'])
+        try:
+            return await view(request, *args, **kwargs)
+        except ApiError as error:
+            return _json({'error': str(error)}, status=400)
+    return wrapper
+
+
+@_api_view
+async def api_list(request, resource_name):
+    ''' Список ресурса resource_name с пагинацией по ключу. '''
+    resource = RESOURCES.get(resource_name)
+    if resource is None:
+        raise Http404("Нет такого ресурса")
+    names = resource.parse_fields(request, resource.list_fields)
+    limit = _limit(request)
+    queryset = resource.get_queryset().order_by(*resource.keyset.order_by())
+    if request.GET.get('after'):
+        queryset = queryset.filter(resource.keyset.after(resource.keyset.decode(request.GET['after'], resource.model)))
+
+    if resource_name == 'books':
+        # Сначала только ключи и time_update: неизменная страница отвечает 304 без загрузки связей.
+        # Только ETag (состав страницы) - по Last-Modified не видно ушедших со страницы книг
+        keys = [key async for key in queryset.values_list('pk', 'time_update')[:limit + 1]]
+        has_next = len(keys) > limit
+        keys = keys[:limit]
+        etag = _etag(names, request.GET.get('after'), keys, has_next)
+        not_modified = _not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+        books = resource.queryset_for(names, queryset.filter(pk__in=[pk for pk, _ in keys]))
+        by_pk = {book.pk: book async for book in books}
+        objects = [by_pk[pk] for pk, _ in keys if pk in by_pk]
+        return _with_validators(_json(_page(request, resource, objects, names, has_next)), etag)
+
+    objects = [obj async for obj in resource.queryset_for(names, queryset)[:limit + 1]]
+    has_next = len(objects) > limit
+    return _by_content(request, _json(_page(request, resource, objects[:limit], names, has_next)))
+
+
+@_api_view
+async def api_detail(request, resource_name, slug, cat_slug=None):
+    ''' Одна запись ресурса по слагу (подкатегория - по слагам жанра и поджанра). '''
+    resource = RESOURCES.get(resource_name)
+    if resource is None:
+        raise Http404("Нет такого ресурса")
+    names = resource.parse_fields(request, resource.detail_fields)
+    queryset = resource.get_queryset().filter(slug=slug)
+    if cat_slug is not None:
+        queryset = queryset.filter(category__slug=cat_slug)
+
+    if resource_name == 'books':
+        pk, updated = await _aget_or_404(queryset.values_list('pk', 'time_update'))
+        etag, last_modified = _etag(names, pk, updated), int(updated.timestamp())
+        not_modified = _not_modified(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        payload = await cache.cached(
+            resource_name, cache.book_version(pk, updated), names, _builder(resource, names, queryset)
+        )
+        return _with_validators(_json(payload), etag, last_modified)
+
+    version = await cache.generation(resource_name, slug)
+    key = f"{slug}:{version}" if cat_slug is None else f"{cat_slug}/{slug}:{version}"  # поджанр - в своём жанре
+    payload = await cache.cached(resource_name, key, names, _builder(resource, names, queryset))
+    return _by_content(request, _json(payload))
+
+
+def _builder(resource, names, queryset):
+    async def build():
+        return resource.serialize(await _aget_or_404(resource.queryset_for(names, queryset)), names)
+    return build
+
+
+@_api_view
+async def api_category_tree(request):
+    ''' Все жанры с поджанрами и числом опубликованных книг (из кэша; сбрасывается
+    при изменении жанров и их счётчиков).
+    '''
+    async def build():
+        return await sync_to_async(ModelCategories.tree)()
+
+    tree = await cache.cached(cache.TREE, await cache.generation(cache.TREE, cache.TREE), (), build)
+    return _by_content(request, _json({'results': tree}))
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class BooklandConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'bookland'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+        from . import cache, integrity, signals, sitemaps  # noqa: F401 - подключение обработчиков сигналов
+        from .search import create_search_table
+
+        post_migrate.connect(create_search_table, sender=self)
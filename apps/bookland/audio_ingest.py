@@ -0,0 +1,143 @@
+# D:\Python\myProject\Bookland\apps\bookland\audio_ingest.py
+
+'''Пакетная загрузка частей аудиокниги и смена их порядка.
+
+Части берутся из каталога, архива (zip, tar, tar.gz) или списка загруженных файлов
+и сортируются по именам "естественно" (natural_key: "Часть 2" раньше "Часть 10").
+Номера для всей пачки резервируются одним BookFileNaming.allocate(count=n), файлы
+пишутся в хранилище, а строки AudioFile, задания метаданных, строки сканера
+хранилища (StoredFile) и счётчик книги - одной транзакцией (bulk_create) без
+сохранения по одному файлу. Запись файлов
+идёт до транзакции, чтобы не держать блокировку записи SQLite на время
+копирования; при ошибке записанные файлы удаляются.
+
+reorder_audio сохраняет новый порядок (перетаскивание в админке) одним
+UPDATE ... SET order = CASE id WHEN ... END.
+'''
+
+import os
+import tarfile
+import zipfile
+from contextlib import ExitStack, contextmanager
+
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import models, transaction
+
+from .integrity import record_many
+from .models import AudioFile, AudioMetadataJob, BookFileNaming
+from .signals import change_counter, touch_books
+from .utilities import generate_file_name, natural_key
+
+AUDIO_EXTENSIONS = tuple(AudioFile._meta.get_field('file').validators[0].allowed_extensions)
+
+
+def is_audio(name):
+    return name.rsplit('.', 1)[-1].lower() in AUDIO_EXTENSIONS
+
+
+def _skipped(name):
+    # Служебные файлы архиваторов и ОС: __MACOSX/, ._*, .DS_Store
+    parts = name.replace('\\', '/').split('/')
+    return '__MACOSX' in parts or parts[-1].startswith('.')
+
+
+@contextmanager
+def open_parts(source):
+    ''' Аудиочасти источника: [(имя, файл)] - имена относительные (для сортировки по
+    подкаталогам "CD1/..."), файлы открыты до выхода из блока. source - путь к каталогу
+    или архиву, загруженный архив или список загруженных файлов. Не аудио
+    (обложки, .nfo, .cue) в каталогах и архивах пропускается.
+    '''
+    with ExitStack() as stack:
+        if isinstance(source, (list, tuple)):
+            parts = [(upload.name, upload) for upload in source]
+        elif isinstance(source, (str, os.PathLike)) and os.path.isdir(source):
+            parts = []
+            for root, _, names in os.walk(source):
+                for name in names:
+                    path = os.path.join(root, name)
+                    relative = os.path.relpath(path, source)
+                    if is_audio(name) and not _skipped(relative):
+                        parts.append((relative, stack.enter_context(open(path, 'rb'))))
+        else:
+            parts = _archive_parts(source, stack)
+        yield parts
+
+
+def _archive_parts(source, stack):
+    fileobj = source if hasattr(source, 'read') else stack.enter_context(open(source, 'rb'))
+    if zipfile.is_zipfile(fileobj):
+        archive = stack.enter_context(zipfile.ZipFile(fileobj))
+        return [
+            (info.filename, stack.enter_context(archive.open(info)))
+            for info in archive.infolist()
+            if not info.is_dir() and is_audio(info.filename) and not _skipped(info.filename)
+        ]
+    fileobj.seek(0)
+    try:
+        archive = stack.enter_context(tarfile.open(fileobj=fileobj))
+    except tarfile.TarError:
+        raise ValidationError("Ожидается каталог, архив zip или tar.", code='archive')
+    # Содержимое читается через extractfile, на диск архив не распаковывается
+    return [
+        (member.name, archive.extractfile(member))
+        for member in archive.getmembers()
+        if member.isfile() and is_audio(member.name) and not _skipped(member.name)
+    ]
+
+
+def ingest_audio(book, parts):
+    ''' Добавляет части parts ([(имя, файл)], см. open_parts) в конец книги в естественном
+    порядке имён. Возвращает созданные AudioFile.
+    '''
+    if not parts:
+        raise ValidationError("Нет аудиофайлов для загрузки.", code='empty')
+    wrong = [name for name, _ in parts if not is_audio(name)]
+    if wrong:
+        raise ValidationError(
+            f"Допустимые расширения: {', '.join(AUDIO_EXTENSIONS)}. Не подходят: {', '.join(wrong)}", code='extension'
+        )
+    parts = sorted(parts, key=lambda part: natural_key(part[0]))
+
+    prefix, first = BookFileNaming.allocate(book, 'audio', count=len(parts))
+    upload_to = AudioFile._meta.get_field('file').upload_to
+    saved = []
+    try:
+        files = []
+        for number, (name, content) in enumerate(parts, first):
+            basename = os.path.basename(name.replace('\\', '/'))
+            target = os.path.join(upload_to, generate_file_name(prefix, basename, 'audio', number))
+            saved.append(default_storage.save(target, File(content, name=basename)))
+            files.append(AudioFile(book=book, file=saved[-1], order=number))
+        with transaction.atomic():
+            # bulk_create не шлёт сигналов - их работа (счётчик, задания метаданных, StoredFile,
+            # версия книги) здесь
+            created = AudioFile.objects.bulk_create(files)
+            AudioMetadataJob.objects.bulk_create(AudioMetadataJob(audio_file=audio) for audio in created)
+            record_many(saved)
+            change_counter(AudioFile, book.pk, len(created))
+            touch_books([book.pk])
+    except BaseException:
+        for name in saved:
+            default_storage.delete(name)
+        raise
+    return created
+
+
+def reorder_audio(book, ordered_ids):
+    ''' Новый порядок частей книги: ordered_ids - id всех её аудиофайлов по порядку. '''
+    ids = [int(pk) for pk in ordered_ids]
+    if len(set(ids)) != len(ids) or set(ids) != set(book.audio_files.values_list('pk', flat=True)):
+        raise ValidationError("Порядок должен перечислять все аудиофайлы книги ровно по одному разу.", code='order')
+    if not ids:
+        return 0
+    order = models.Case(
+        *(models.When(pk=pk, then=models.Value(number)) for number, pk in enumerate(ids, 1)),
+        output_field=models.PositiveIntegerField(),
+    )
+    with transaction.atomic():
+        updated = AudioFile.objects.filter(book=book).update(order=order)
+        touch_books([book.pk])
+    return updated
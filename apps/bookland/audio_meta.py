@@ -0,0 +1,218 @@
+# D:\Python\myProject\Bookland\apps\bookland\audio_meta.py
+
+'''Чтение длительности, битрейта и кодека аудиофайлов без декодирования звука.
+
+Файл отображается в память (mmap) и разбираются только заголовки:
+- MP3: тег ID3v2, заголовок первого фрейма, таблицы Xing/Info/VBRI (VBR);
+  без них длительность считается по битрейту (CBR);
+- M4B/M4A: атомы moov/mvhd (timescale, duration) и stsd (кодек);
+- AAC (ADTS): переход по заголовкам фреймов (1024 сэмпла на фрейм);
+- WAV: чанки fmt и data.
+
+Модуль не зависит от Django - функции выполняются в пуле процессов (audio_worker).
+'''
+
+import mmap
+import os
+import struct
+from collections import namedtuple
+
+AudioMetadata = namedtuple('AudioMetadata', ['duration', 'bitrate', 'codec'])  # секунды, кбит/с, кодек
+
+_MP3_BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MP3_SAMPLE_RATES = {1: (44100, 48000, 32000), 2: (22050, 24000, 16000), 25: (11025, 12000, 8000)}
+_MP3_VERSIONS = {3: 1, 2: 2, 0: 25}  # биты версии -> MPEG-1, MPEG-2, MPEG-2.5
+_MP3_LAYERS = {3: 1, 2: 2, 1: 3}
+
+_ADTS_SAMPLE_RATES = (96000, 88200, 64000, 48000, 44100, 32000, 24000, 22050, 16000, 12000, 11025, 8000, 7350)
+
+_MP4_CONTAINERS = {b'moov', b'trak', b'mdia', b'minf', b'stbl'}
+_MP4_CODECS = {b'mp4a': 'aac', b'alac': 'alac', b'.mp3': 'mp3', b'ac-3': 'ac3'}
+
+MP3_SCAN_LIMIT = 256 * 1024  # Сколько байт после ID3 просматривать в поисках первого фрейма
+
+
+def read_audio_metadata(path):
+    ''' Метаданные файла path. ValueError - формат не распознан или файл повреждён. '''
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            raise ValueError("Пустой файл")
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:4] == b'RIFF' and data[8:12] == b'WAVE':
+                return _wav(data)
+            if data[4:8] == b'ftyp':
+                return _mp4(data)
+            if data[:2] == b'\xff\xf1' or data[:2] == b'\xff\xf9':
+                return _adts(data)
+            return _mp3(data)
+
+
+def extract(path):
+    ''' Обёртка для пула процессов: (metadata, размер файла, ошибка) без исключений. '''
+    try:
+        return read_audio_metadata(path), os.path.getsize(path), ''
+    except (OSError, ValueError, struct.error, IndexError) as error:
+        return None, 0, f"{type(error).__name__}: {error}"
+
+
+# --- MP3 ---
+
+def _mp3_frame(data, pos):
+    ''' Разбор 4-байтного заголовка фрейма MPEG audio; None, если по адресу pos не фрейм. '''
+    if pos + 4 > len(data):
+        return None
+    b0, b1, b2, b3 = data[pos:pos + 4]
+    if b0 != 0xFF or b1 & 0xE0 != 0xE0:
+        return None
+    version = _MP3_VERSIONS.get((b1 >> 3) & 3)
+    layer = _MP3_LAYERS.get((b1 >> 1) & 3)
+    bitrate_index, rate_index = b2 >> 4, (b2 >> 2) & 3
+    if version is None or layer is None or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    bitrate = _MP3_BITRATES[(1 if version == 1 else 2, layer)][bitrate_index]
+    sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 1
+    if layer == 1:
+        samples, length = 384, (12 * bitrate * 1000 // sample_rate + padding) * 4
+    elif layer == 3 and version != 1:
+        samples, length = 576, 72 * bitrate * 1000 // sample_rate + padding
+    else:
+        samples, length = 1152, 144 * bitrate * 1000 // sample_rate + padding
+    return {
+        'version': version, 'layer': layer, 'bitrate': bitrate, 'sample_rate': sample_rate,
+        'samples': samples, 'length': length, 'mono': b3 >> 6 == 3,
+    }
+
+
+def _mp3(data):
+    start = 0
+    if data[:3] == b'ID3' and len(data) >= 10:
+        size = (data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | (data[9] & 0x7F)
+        start = 10 + size + (10 if data[5] & 0x10 else 0)
+
+    # Первый фрейм, за которым сразу следует ещё один (защита от ложной синхронизации)
+    pos, limit = start, min(len(data), start + MP3_SCAN_LIMIT)
+    while True:
+        pos = data.find(b'\xff', pos, limit)
+        if pos < 0:
+            raise ValueError("Не найден MPEG-фрейм")
+        frame = _mp3_frame(data, pos)
+        if frame and (pos + frame['length'] >= len(data) or _mp3_frame(data, pos + frame['length'])):
+            break
+        pos += 1
+
+    end = len(data) - (128 if data[-128:-125] == b'TAG' else 0)
+    codec = f"mp{frame['layer']}"
+    frames = _mp3_vbr_frames(data, pos, frame)
+    if frames:
+        duration = frames * frame['samples'] / frame['sample_rate']
+        bitrate = round((end - pos) * 8 / duration / 1000) if duration else frame['bitrate']
+        return AudioMetadata(duration, bitrate, codec)
+    return AudioMetadata((end - pos) * 8 / (frame['bitrate'] * 1000), frame['bitrate'], codec)
+
+
+def _mp3_vbr_frames(data, pos, frame):
+    ''' Число фреймов из заголовка Xing/Info или VBRI (если он есть). '''
+    if frame['version'] == 1:
+        side_info = 17 if frame['mono'] else 32
+    else:
+        side_info = 9 if frame['mono'] else 17
+    xing = pos + 4 + side_info
+    if data[xing:xing + 4] in (b'Xing', b'Info'):
+        flags = struct.unpack('>I', data[xing + 4:xing + 8])[0]
+        if flags & 1:
+            return struct.unpack('>I', data[xing + 8:xing + 12])[0]
+    vbri = pos + 4 + 32
+    if data[vbri:vbri + 4] == b'VBRI':
+        return struct.unpack('>I', data[vbri + 14:vbri + 18])[0]
+    return None
+
+
+# --- MP4 / M4B ---
+
+def _mp4_atoms(data, start, end):
+    ''' Итерация по атомам (type, начало данных, конец атома) в диапазоне [start, end). '''
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack('>I4s', data[pos:pos + 8])
+        header = 8
+        if size == 1:
+            size = struct.unpack('>Q', data[pos + 8:pos + 16])[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            raise ValueError("Повреждённый атом MP4")
+        yield kind, pos + header, min(pos + size, end)
+        pos += size
+
+
+def _mp4(data):
+    duration = codec = None
+
+    def walk(start, end):
+        nonlocal duration, codec
+        for kind, body, atom_end in _mp4_atoms(data, start, end):
+            if kind in _MP4_CONTAINERS:
+                walk(body, atom_end)
+            elif kind == b'mvhd':
+                if data[body] == 1:
+                    timescale, length = struct.unpack('>IQ', data[body + 20:body + 32])
+                else:
+                    timescale, length = struct.unpack('>II', data[body + 12:body + 20])
+                duration = length / timescale if timescale else None
+            elif kind == b'stsd' and codec is None:
+                fmt = data[body + 12:body + 16]
+                codec = _MP4_CODECS.get(fmt, fmt.decode('latin-1').strip())
+
+    walk(0, len(data))
+    if not duration:
+        raise ValueError("Не найден атом mvhd")
+    return AudioMetadata(duration, round(len(data) * 8 / duration / 1000), codec or 'mp4')
+
+
+# --- AAC (ADTS) ---
+
+def _adts(data):
+    pos, frames, sample_rate, size = 0, 0, None, len(data)
+    while pos + 7 <= size:
+        if data[pos] != 0xFF or data[pos + 1] & 0xF6 != 0xF0:
+            break
+        rate_index = (data[pos + 2] >> 2) & 0x0F
+        if rate_index >= len(_ADTS_SAMPLE_RATES):
+            break
+        sample_rate = _ADTS_SAMPLE_RATES[rate_index]
+        length = (data[pos + 3] & 0x03) << 11 | data[pos + 4] << 3 | data[pos + 5] >> 5
+        if length < 7:
+            break
+        frames += (data[pos + 6] & 0x03) + 1
+        pos += length
+    if not frames:
+        raise ValueError("Не найдены ADTS-фреймы")
+    duration = frames * 1024 / sample_rate
+    return AudioMetadata(duration, round(pos * 8 / duration / 1000), 'aac')
+
+
+# --- WAV ---
+
+def _wav(data):
+    byte_rate = data_size = None
+    pos = 12
+    while pos + 8 <= len(data):
+        kind, size = struct.unpack('<4sI', data[pos:pos + 8])
+        if kind == b'fmt ':
+            byte_rate = struct.unpack('<I', data[pos + 16:pos + 20])[0]
+        elif kind == b'data':
+            data_size = min(size, len(data) - pos - 8)
+            break
+        pos += 8 + size + (size & 1)
+    if not byte_rate or data_size is None:
+        raise ValueError("Не найдены чанки fmt/data")
+    return AudioMetadata(data_size / byte_rate, round(byte_rate * 8 / 1000), 'pcm')
@@ -0,0 +1,167 @@
+# D:\Python\myProject\Bookland\apps\bookland\audio_worker.py
+
+'''Фоновое заполнение AudioFile.duration / bitrate / codec и ModelBooks.duration.
+
+Очередь - таблица AudioMetadataJob: задание ставится при создании AudioFile
+(bookland.signals) или командой manage.py audio_metadata --backfill.
+Обработчик забирает пачку заданий, разбирает файлы в пуле процессов
+(bookland.audio_meta, только заголовки через mmap), записывает результаты
+через bulk_update и пересчитывает длительность затронутых книг одним UPDATE.
+Задание в статусе running дольше CLAIM_LEASE (обработчик упал или был убит)
+снова забирается из очереди; результаты упавшего обработчика, если он всё же
+допишет их позже, отбрасываются - задание уже принадлежит другому.
+'''
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery, Sum
+from django.utils import timezone
+
+from .audio_meta import extract
+from .models import AudioFile, AudioMetadataJob, ModelBooks
+
+DEFAULT_BATCH_SIZE = 200
+CLAIM_LEASE = timedelta(minutes=30)
+
+
+def enqueue(audio_ids):
+    ''' Ставит в очередь (в т.ч. повторно - после ошибки) задания для аудиофайлов audio_ids. '''
+    audio_ids = list(audio_ids)
+    AudioMetadataJob.objects.bulk_create(
+        [AudioMetadataJob(audio_file_id=audio_id) for audio_id in audio_ids], ignore_conflicts=True, batch_size=500
+    )
+    for i in range(0, len(audio_ids), 500):
+        AudioMetadataJob.objects.filter(audio_file_id__in=audio_ids[i:i + 500]).exclude(status='pending').update(
+            status='pending', error=''
+        )
+
+
+def enqueue_backfill():
+    ''' Все аудиофайлы без длительности - в очередь. Возвращает число файлов. '''
+    audio_ids = list(AudioFile.objects.filter(duration__isnull=True).values_list('pk', flat=True))
+    enqueue(audio_ids)
+    return len(audio_ids)
+
+
+def enqueue_failed():
+    ''' Повторная постановка в очередь заданий, завершившихся ошибкой. '''
+    return AudioMetadataJob.objects.filter(status='failed').update(status='pending', error='')
+
+
+def claimable(now, lease=CLAIM_LEASE):
+    ''' Условие заданий, которые можно забрать: в очереди или running с истёкшей арендой. '''
+    expired = Q(claimed_at__lt=now - lease) | Q(claimed_at__isnull=True)
+    return Q(status='pending') | Q(expired, status='running')
+
+
+def claim(batch_size, lease=CLAIM_LEASE):
+    ''' Забирает пачку заданий из очереди (-> running, claimed_at = сейчас). Задания, которые
+    между выборкой и UPDATE забрал другой обработчик, не попадают в пачку (claimed_at не совпадёт).
+    '''
+    now = timezone.now()
+    with transaction.atomic():
+        pks = list(
+            AudioMetadataJob.objects.filter(claimable(now, lease)).order_by('pk')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        AudioMetadataJob.objects.filter(claimable(now, lease), pk__in=pks).update(status='running', claimed_at=now)
+    return list(
+        AudioMetadataJob.objects.filter(pk__in=pks, status='running', claimed_at=now).select_related('audio_file')
+    )
+
+
+def rollup_book_durations(book_ids):
+    ''' ModelBooks.duration = сумма длительностей аудиофайлов книги (одним UPDATE).
+    time_update обновляется тем же UPDATE - от него зависят кэш карточки книги и ETag API.
+    '''
+    total = (
+        AudioFile.objects.filter(book=OuterRef('pk')).order_by().values('book')
+        .annotate(total=Sum('duration')).values('total')
+    )
+    return ModelBooks.objects.filter(pk__in=book_ids).update(duration=Subquery(total), time_update=timezone.now())
+
+
+class WorkerStats:
+    ''' Метрики пропускной способности обработчика. '''
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.files = 0
+        self.failed = 0
+        self.bytes = 0
+
+    def report(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return (
+            f"файлов: {self.files} (ошибок: {self.failed}), {self.files / elapsed:.1f} файл/с, "
+            f"{self.bytes / elapsed / 1024 / 1024:.1f} МБ/с, {elapsed:.1f} с"
+        )
+
+
+def process_batch(jobs, map_function=map, stats=None):
+    ''' Разбор файлов пачки (map_function - map пула процессов) и запись результатов. '''
+    paths = []
+    for job in jobs:
+        try:
+            paths.append(job.audio_file.file.path)
+        except (ValueError, NotImplementedError):  # файл не задан или хранилище без локальных путей
+            paths.append('')
+    results = list(map_function(extract, paths))
+
+    now = timezone.now()
+    audio_files = []
+    for job, (metadata, size, error) in zip(jobs, results):
+        job.attempts += 1
+        job.finished_at = now
+        if metadata:
+            audio = job.audio_file
+            audio.duration = timedelta(seconds=round(metadata.duration, 3))
+            audio.bitrate = metadata.bitrate
+            audio.codec = metadata.codec
+            audio_files.append(audio)
+            job.status, job.error = 'done', ''
+        else:
+            job.status, job.error = 'failed', error
+        if stats:
+            stats.files += 1
+            stats.bytes += size
+            stats.failed += not metadata
+
+    with transaction.atomic():
+        # Задания, забранные другим обработчиком после истечения аренды, не трогаем
+        owned = set(
+            AudioMetadataJob.objects.select_for_update()
+            .filter(pk__in=[job.pk for job in jobs], status='running', claimed_at__in={job.claimed_at for job in jobs})
+            .values_list('pk', 'claimed_at')
+        )
+        jobs = [job for job in jobs if (job.pk, job.claimed_at) in owned]
+        audio_files = [job.audio_file for job in jobs if job.status == 'done']
+        AudioFile.objects.bulk_update(audio_files, ['duration', 'bitrate', 'codec'], batch_size=500)
+        AudioMetadataJob.objects.bulk_update(jobs, ['status', 'attempts', 'error', 'finished_at'], batch_size=500)
+        rollup_book_durations({audio.book_id for audio in audio_files})
+    return len(audio_files)
+
+
+def run(workers=None, batch_size=DEFAULT_BATCH_SIZE, loop=False, poll_interval=5.0, stats=None):
+    ''' Обработка очереди. workers=0 - без пула процессов (в текущем процессе). '''
+    stats = stats or WorkerStats()
+    workers = os.cpu_count() if workers is None else workers
+    executor = ProcessPoolExecutor(max_workers=workers) if workers else None
+    map_function = (lambda function, items: executor.map(function, items, chunksize=8)) if executor else map
+    try:
+        while True:
+            jobs = claim(batch_size)
+            if jobs:
+                process_batch(jobs, map_function, stats)
+            elif loop:
+                time.sleep(poll_interval)
+            else:
+                break
+    finally:
+        if executor:
+            executor.shutdown()
+    return stats
@@ -0,0 +1,358 @@
+# D:\Python\myProject\Bookland\apps\bookland\benchmarks.py
+
+'''Набор замеров горячих путей bookland (см. manage.py bookland_bench).
+
+Замеры идут на временной базе с синтетическим каталогом (generate_catalogue):
+книги с кириллическими названиями, авторы, чтецы, циклы, жанры, аудиофайлы и
+оценки в заданных количествах, с фиксированным seed - прогоны сравнимы между
+коммитами. Для каждого замера - число SQL-запросов, p50/p95 времени операции и
+пиковая память (tracemalloc); результат пишется в JSON (--output). Замер, которому
+не хватает данных каталога (например, --books 0), пропускается с пояснением.
+'''
+
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .models import (
+    AudioFile, Author, BookFileNaming, BookRating, BookRatingSummary, Cycle, ModelBooks, ModelCategories,
+    ModelSubcategories, Reader,
+)
+from .search import rebuild_index, search_books
+from .sitemaps import SECTIONS, open_shard
+from .utilities import _translit, generate_file_name, translit_re
+
+DEFAULT_COUNTS = {
+    'books': 2000,
+    'authors': 300,
+    'readers': 100,
+    'cycles': 150,
+    'categories': 10,
+    'subcategories': 5,  # в каждом жанре
+    'audio': 5,  # аудиофайлов на книгу
+    'ratings': 5000,
+}
+
+WORDS = (
+    "тень", "ветер", "город", "море", "звезда", "ночь", "зима", "сердце", "дорога", "память", "остров", "тайна",
+    "солнце", "лес", "огонь", "река", "война", "мир", "дом", "сон", "часы", "ключ", "зеркало", "песня", "берег",
+    "последний", "белый", "тёмный", "старый", "далёкий", "золотой", "тихий", "северный", "забытый", "железный",
+)
+SURNAMES = (
+    "Иванов", "Петрова", "Смирнов", "Кузнецова", "Соколов", "Лебедева", "Новиков", "Морозова", "Волков", "Зайцева",
+    "Павлов", "Семёнова", "Голубев", "Виноградова", "Богданов", "Воробьёва", "Фёдоров", "Михайлова", "Беляев", "Тарасова",
+)
+NAMES = ("Анна", "Борис", "Вера", "Глеб", "Дарья", "Егор", "Жанна", "Илья", "Ксения", "Лев", "Мария", "Никита")
+
+
+@contextmanager
+def temporary_database(**overrides):
+    ''' Подмена базы default на пустую временную базу (для всех потоков) с миграциями.
+    overrides - ключи настроек базы поверх текущих (ENGINE, OPTIONS...).
+    '''
+    original = connections.settings[DEFAULT_DB_ALIAS]
+    with tempfile.TemporaryDirectory() as directory:
+        connections[DEFAULT_DB_ALIAS].close()
+        del connections[DEFAULT_DB_ALIAS]
+        connections.settings[DEFAULT_DB_ALIAS] = {
+            **original, 'CONN_MAX_AGE': None, **overrides, 'NAME': os.path.join(directory, 'bench.sqlite3'),
+        }
+        try:
+            call_command('migrate', verbosity=0)
+            yield
+        finally:
+            connections[DEFAULT_DB_ALIAS].close()
+            del connections[DEFAULT_DB_ALIAS]
+            connections.settings[DEFAULT_DB_ALIAS] = original
+
+
+# --- Синтетический каталог ---
+
+def _title(rng):
+    words = rng.sample(WORDS, rng.randint(1, 4))
+    return " ".join(words).capitalize()
+
+
+def _people(model, count, rng):
+    people = []
+    for i in range(count):
+        surname, name = rng.choice(SURNAMES), rng.choice(NAMES)
+        # bulk_create не вызывает save(): слаг задаём сами, номер - для уникальности
+        people.append(model(surname_nick=surname, name=name, slug=f"{translit_re(f'{surname} {name}')}-{i}"))
+    return model.objects.bulk_create(people)
+
+
+def generate_catalogue(counts=None, seed=0):
+    ''' Заполняет пустую базу синтетическим каталогом; возвращает фактические количества. '''
+    counts = {**DEFAULT_COUNTS, **(counts or {})}
+    rng = random.Random(seed)
+
+    authors = _people(Author, counts['authors'], rng)
+    readers = _people(Reader, counts['readers'], rng)
+    cycles = Cycle.objects.bulk_create(
+        Cycle(name=f"Цикл «{_title(rng)}» {i}", slug=f"cycle-{i}") for i in range(counts['cycles'])
+    )
+    categories = ModelCategories.objects.bulk_create(
+        ModelCategories(name=f"Жанр {_title(rng)} {i}", slug=f"genre-{i}") for i in range(counts['categories'])
+    )
+    subcategories = ModelSubcategories.objects.bulk_create(
+        ModelSubcategories(category=category, name=f"{_title(rng)} {j}"[:40], slug=f"subgenre-{category.slug}-{j}")
+        for category in categories for j in range(counts['subcategories'])
+    )
+
+    books = []
+    for i in range(counts['books']):
+        title = _title(rng)
+        cycle = rng.choice(cycles) if cycles and rng.random() < 0.3 else None
+        books.append(ModelBooks(
+            title=title, slug=f"{translit_re(title)}-{i}", year=rng.choice([None, *range(1900, 2025)]),
+            cycle=cycle, cycle_number=str(rng.randint(1, 10)) if cycle else None, is_published=rng.random() < 0.9,
+        ))
+    books = ModelBooks.objects.bulk_create(books, batch_size=500)
+
+    through = ModelBooks.authors.through
+    through.objects.bulk_create((
+        through(modelbooks=book, author=author)
+        for book in books for author in rng.sample(authors, min(len(authors), rng.randint(1, 2)))
+    ), batch_size=1000)
+    through = ModelBooks.readers.through
+    through.objects.bulk_create((
+        through(modelbooks=book, reader=rng.choice(readers)) for book in books if readers
+    ), batch_size=1000)
+    through = ModelBooks.book_subcategories.through
+    through.objects.bulk_create((
+        through(modelbooks=book, modelsubcategories=subcategory)
+        for book in books for subcategory in rng.sample(subcategories, min(len(subcategories), rng.randint(1, 3)))
+    ), batch_size=1000)
+
+    AudioFile.objects.bulk_create((
+        AudioFile(book=book, file=f"uploads/audio_files/{book.slug}-{n:03}.mp3", order=n)
+        for book in books for n in range(1, counts['audio'] + 1)
+    ), batch_size=1000)
+
+    ratings = min(counts['ratings'], len(books) * 50)
+    users = User.objects.bulk_create(User(username=f"bench-{i}") for i in range(max(1, -(-ratings // max(len(books), 1)))))
+    pairs = rng.sample([(user, book) for user in users for book in books], ratings) if books else []
+    BookRating.objects.bulk_create((
+        BookRating(user=user, book=book, overall_score=rng.randint(1, 5), would_recommend=rng.random() < 0.7)
+        for user, book in pairs
+    ), batch_size=1000)
+
+    # Денормализованные данные, которые bulk_create обходит
+    ModelBooks.recount_counters()
+    ModelSubcategories.recount_books()
+    ModelCategories.recount_books()
+    BookRatingSummary.rebuild()
+    rebuild_index()
+    return {
+        'books': len(books), 'authors': len(authors), 'readers': len(readers), 'cycles': len(cycles),
+        'categories': len(categories), 'subcategories': len(subcategories),
+        'audio': AudioFile.objects.count(), 'ratings': len(pairs),
+    }
+
+
+# --- Замеры ---
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def measure(operation, repeat, setup=None):
+    ''' Выполняет operation(arg) repeat раз (arg - результат setup(i) или i) и возвращает
+    {'runs', 'queries' (медиана на операцию), 'p50_ms', 'p95_ms', 'mean_ms', 'peak_kb'}.
+    Подготовка (setup) в замер не входит; пиковая память - отдельным прогоном под
+    tracemalloc, чтобы его накладные расходы не попали во время.
+    '''
+    timings, queries = [], []
+    for i in range(repeat):
+        arg = setup(i) if setup else i
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            operation(arg)
+            timings.append(time.perf_counter() - started)
+        queries.append(len(captured))
+
+    arg = setup(repeat) if setup else repeat
+    tracemalloc.start()
+    try:
+        operation(arg)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        'runs': repeat,
+        'queries': statistics.median(queries),
+        'p50_ms': round(_percentile(timings, 50) * 1000, 3),
+        'p95_ms': round(_percentile(timings, 95) * 1000, 3),
+        'mean_ms': round(statistics.mean(timings) * 1000, 3),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+class SkipBenchmark(Exception):
+    ''' Для замера нет данных в каталоге; сообщение - причина пропуска. '''
+
+
+def _require(items, what):
+    if not items:
+        raise SkipBenchmark(f"в каталоге нет {what}")
+    return items
+
+
+def _book_ids():
+    return _require(list(ModelBooks.objects.order_by('pk').values_list('pk', flat=True)), "книг")
+
+
+def bench_translit(rng, repeat):
+    # Без LRU-кеша translit_re - иначе повторы названий замеряют поиск в кеше, а не транслитерацию
+    titles = _require(list(ModelBooks.objects.order_by('pk').values_list('title', flat=True)[:1000]), "книг")
+    return measure(_translit, repeat, setup=lambda i: titles[i % len(titles)])
+
+
+def bench_book_save(rng, repeat):
+    ids = _book_ids()
+
+    def setup(i):
+        book = ModelBooks.objects.get(pk=rng.choice(ids))
+        book.title = _title(rng)
+        return book
+
+    return measure(lambda book: book.save(), repeat, setup)
+
+
+def bench_generate_file_name(rng, repeat):
+    ids = _book_ids()
+    books = ModelBooks.objects.filter(pk__in=rng.sample(ids, min(100, len(ids))))
+    prefixes = [book.file_name_prefix() for book in books.select_related('cycle').prefetch_related('authors')]
+    return measure(
+        lambda i: generate_file_name(prefixes[i % len(prefixes)], "Глава 1.mp3", 'audio', i + 1), repeat,
+    )
+
+
+def bench_allocate_file_name(rng, repeat):
+    ''' Номер и префикс имени нового аудиофайла из счётчика книги (BookFileNaming). '''
+    ids = _book_ids()
+    return measure(
+        lambda book: BookFileNaming.allocate(book, 'audio'), repeat,
+        setup=lambda i: ModelBooks.objects.get(pk=rng.choice(ids)),
+    )
+
+
+def _changelist(model):
+    def bench(rng, repeat):
+        model_admin = admin.site._registry[model]
+        user = User.objects.filter(is_superuser=True).first() or User.objects.create_superuser('bench-admin')
+        factory = RequestFactory()
+        pages = max(1, -(-model.objects.count() // model_admin.list_per_page))
+
+        def setup(i):
+            request = factory.get('/', {'p': rng.randint(1, pages)})
+            request.user = user
+            return request
+
+        return measure(lambda request: model_admin.changelist_view(request).render(), repeat, setup)
+    return bench
+
+
+def bench_admin_book_change_form(rng, repeat):
+    ''' Страница редактирования книги: формы вложенных файлов и выбор жанров, авторов, чтецов. '''
+    model_admin = admin.site._registry[ModelBooks]
+    user = User.objects.filter(is_superuser=True).first() or User.objects.create_superuser('bench-admin')
+    factory = RequestFactory()
+    ids = _book_ids()
+
+    def setup(i):
+        request = factory.get('/')
+        request.user = user
+        return request, str(rng.choice(ids))
+
+    return measure(lambda args: model_admin.change_view(*args).render(), repeat, setup)
+
+
+def bench_startup(rng, repeat):
+    ''' Запуск Django в новом процессе (django.setup(): приложения, модели, admin.autodiscover). '''
+    command = [sys.executable, '-c', 'import django; django.setup()']
+    environment = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'apps.settings')}
+    # Каждый запуск - секунды, поэтому не больше 5 прогонов
+    return measure(lambda i: subprocess.run(command, env=environment, check=True), min(repeat, 5))
+
+
+def bench_category_delete_guard(rng, repeat):
+    ''' Отказ в удалении жанра, у поджанров которого есть книги. '''
+    categories = _require(list(ModelCategories.objects.filter(total_books__gt=0)), "жанров с книгами")
+
+    def guard(category):
+        try:
+            category.delete()
+        except ValidationError:
+            return
+        raise AssertionError(f"Жанр {category} удалён, хотя у него есть книги")
+
+    return measure(guard, repeat, setup=lambda i: categories[i % len(categories)])
+
+
+def bench_sitemap_after_edit(rng, repeat):
+    ''' Все шарды книг карты сайта после правки одной книги: перестраивается один шард. '''
+    section = SECTIONS['books']
+    ids = _book_ids()
+    shards = _require([row['shard'] for row in section.shards()], "опубликованных книг")
+
+    def setup(i):
+        book = ModelBooks.objects.get(pk=rng.choice(ids))
+        book.title = _title(rng)
+        book.save()
+
+    def build(i):
+        for shard in shards:
+            open_shard(section, shard, 'http://bench')[0].close()
+
+    with tempfile.TemporaryDirectory() as directory, override_settings(BOOKLAND_SITEMAP_DIR=directory):
+        build(0)
+        return measure(build, repeat, setup)
+
+
+def bench_search(rng, repeat):
+    return measure(lambda query: search_books(query, 20), repeat, setup=lambda i: rng.choice(WORDS)[:5])
+
+
+BENCHMARKS = {
+    'translit_re': bench_translit,
+    'book_save': bench_book_save,
+    'generate_file_name': bench_generate_file_name,
+    'allocate_file_name': bench_allocate_file_name,
+    'admin_books_changelist': _changelist(ModelBooks),
+    'admin_audio_changelist': _changelist(AudioFile),
+    'admin_book_change_form': bench_admin_book_change_form,
+    'category_delete_guard': bench_category_delete_guard,
+    'search': bench_search,
+    'sitemap_after_edit': bench_sitemap_after_edit,
+    'startup': bench_startup,
+}
+
+
+def run(names=None, repeat=50, seed=0):
+    ''' Замеры names (по умолчанию - все из BENCHMARKS) на уже заполненной базе.
+    Пропущенный замер - {'skipped': причина}.
+    '''
+    results = {}
+    for name in names or BENCHMARKS:
+        try:
+            results[name] = BENCHMARKS[name](random.Random(seed), repeat)
+        except SkipBenchmark as reason:
+            results[name] = {'skipped': str(reason)}
+    return results
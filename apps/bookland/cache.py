@@ -0,0 +1,245 @@
+# D:\Python\myProject\Bookland\apps\bookland\cache.py
+
+'''Кэш готовых ответов каталога: карточки книг, дерево жанров, страницы авторов,
+чтецов, циклов и поджанров (bookland.api).
+
+Ключи версионные, старые записи не удаляются, а становятся недостижимыми и
+вытесняются кэшем (LRU):
+- книга - по time_update: "bookland:books:<id>:<time_update>:<поля>".
+  time_update меняется при сохранении книги, смене её авторов, чтецов, жанров
+  и файлов (bookland.signals), поэтому отдельная инвалидация не нужна;
+- остальное - по поколению "bookland:gen:<вид>:<слаг>". Поколение - метка
+  времени, её заменяют сигналы ниже; ключ без поколения получает новое, так что
+  вытесненная метка не воскрешает старые записи.
+
+Изменение книги, автора, чтеца, цикла, жанра или файла сбрасывает только
+затронутые ключи. Счётчики попаданий/промахов - stats() (по процессу).
+'''
+
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import Author, Cycle, ModelBooks, ModelCategories, ModelSubcategories, Reader
+
+TREE = 'tree'
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[getattr(settings, 'BOOKLAND_CACHE', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'BOOKLAND_CACHE_TIMEOUT', 3600)
+
+
+def fields_key(names):
+    return hashlib.md5(','.join(names).encode(), usedforsecurity=False).hexdigest()[:10]
+
+
+def _count(kind, outcome):
+    with _stats_lock:
+        _stats[kind, outcome] += 1
+
+
+def stats():
+    ''' Попадания и промахи по видам записей с начала работы процесса. '''
+    with _stats_lock:
+        counts = dict(_stats)
+    result = {}
+    for kind in sorted({kind for kind, _ in counts}):
+        hits, misses = counts.get((kind, 'hit'), 0), counts.get((kind, 'miss'), 0)
+        result[kind] = {'hits': hits, 'misses': misses, 'hit_ratio': round(hits / (hits + misses), 3)}
+    return result
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+# --- Поколения ---
+
+def _generation_key(kind, ident):
+    return f"bookland:gen:{kind}:{ident}"
+
+
+async def generation(kind, ident):
+    cache = get_cache()
+    key = _generation_key(kind, ident)
+    value = await cache.aget(key)
+    if value is None:
+        await cache.aadd(key, time.time_ns(), None)
+        value = await cache.aget(key)
+    return value
+
+
+def invalidate(kind, idents):
+    ''' Новое поколение для записей вида kind (слаги idents) - прежние ключи недостижимы. '''
+    stamp = time.time_ns()
+    get_cache().set_many({_generation_key(kind, ident): stamp for ident in set(idents)}, None)
+
+
+# --- Чтение через кэш ---
+
+async def cached(kind, version, names, build):
+    ''' Значение из кэша или await build() с записью в кэш. version - time_update книги
+    или generation(); names - поля ответа (разные наборы полей - разные ключи).
+    '''
+    cache = get_cache()
+    key = f"bookland:{kind}:{version}:{fields_key(names)}"
+    value = await cache.aget(key)
+    if value is not None:
+        _count(kind, 'hit')
+        return value
+    _count(kind, 'miss')
+    value = await build()
+    await cache.aset(key, value, _timeout())
+    return value
+
+
+def book_version(pk, updated):
+    return f"{pk}:{updated.timestamp()}"
+
+
+# --- Инвалидация ---
+
+# Вид страницы -> (модель, путь от неё к книгам)
+BOOK_PAGES = {
+    'authors': (Author, 'modelbooks'),
+    'readers': (Reader, 'books'),
+    'cycles': (Cycle, 'modelbooks'),
+    'subcategories': (ModelSubcategories, 'modelbooks'),
+}
+# Поля книги, показанные на страницах авторов, чтецов, циклов и жанров
+BOOK_PAGE_FIELDS = ('title', 'slug', 'year', 'is_published', 'cycle_id')
+
+
+def book_pages(book_ids):
+    ''' {вид: слаги} страниц, где показаны книги book_ids - одним запросом. '''
+    pages = {kind: set() for kind in BOOK_PAGES}
+    rows = ModelBooks.objects.filter(pk__in=book_ids).values_list(
+        'authors__slug', 'readers__slug', 'cycle__slug', 'book_subcategories__slug'
+    )
+    for row in rows:
+        for kind, slug in zip(BOOK_PAGES, row):
+            if slug:
+                pages[kind].add(slug)
+    return pages
+
+
+def invalidate_pages(pages):
+    for kind, slugs in pages.items():
+        invalidate(kind, slugs)
+
+
+def _book_state(book):
+    return tuple(book.__dict__.get(field) for field in BOOK_PAGE_FIELDS)
+
+
+@receiver(post_init, sender=ModelBooks)
+def remember_book_state(sender, instance, **kwargs):
+    instance._cached_state = _book_state(instance)
+
+
+@receiver(post_save, sender=ModelBooks)
+def book_saved(sender, instance, created, raw=False, **kwargs):
+    state = _book_state(instance)
+    if not created and not raw and state != instance._cached_state:
+        pages = book_pages([instance.pk])
+        old_cycle = instance._cached_state[-1]
+        if old_cycle and old_cycle != instance.cycle_id:  # книга ушла из цикла
+            pages['cycles'].update(Cycle.objects.filter(pk=old_cycle).values_list('slug', flat=True))
+        invalidate_pages(pages)
+    instance._cached_state = state
+
+
+@receiver(pre_delete, sender=ModelBooks)
+def book_deleting(sender, instance, **kwargs):
+    instance._cached_pages = book_pages([instance.pk])
+
+
+@receiver(post_delete, sender=ModelBooks)
+def book_deleted(sender, instance, **kwargs):
+    invalidate_pages(getattr(instance, '_cached_pages', {}))
+
+
+def _kind(model):
+    return next(kind for kind, (page_model, _) in BOOK_PAGES.items() if page_model is model)
+
+
+@receiver(m2m_changed, sender=ModelBooks.authors.through)
+@receiver(m2m_changed, sender=ModelBooks.readers.through)
+@receiver(m2m_changed, sender=ModelBooks.book_subcategories.through)
+def book_relations_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if reverse:  # изменены книги автора, чтеца или жанра - меняется его страница
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate(_kind(type(instance)), [instance.slug])
+        return
+    kind = _kind(model)
+    if action == 'pre_clear':
+        slugs = model.objects.filter(**{BOOK_PAGES[kind][1]: instance.pk}).values_list('slug', flat=True)
+    elif action in ('post_add', 'post_remove'):
+        slugs = model.objects.filter(pk__in=pk_set).values_list('slug', flat=True)
+    else:
+        return
+    invalidate(kind, slugs)
+
+
+@receiver(post_init, sender=Author)
+@receiver(post_init, sender=Reader)
+@receiver(post_init, sender=Cycle)
+@receiver(post_init, sender=ModelCategories)
+@receiver(post_init, sender=ModelSubcategories)
+def remember_slug(sender, instance, **kwargs):
+    instance._cached_slug = instance.__dict__.get('slug')
+
+
+def _slugs(instance):
+    # Текущий и прежний слаг - страница могла быть закэширована под обоими
+    slugs = {instance.slug, instance._cached_slug} - {None}
+    instance._cached_slug = instance.slug
+    return slugs
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Reader)
+@receiver(post_save, sender=Cycle)
+@receiver(post_save, sender=ModelSubcategories)
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Reader)
+@receiver(post_delete, sender=Cycle)
+@receiver(post_delete, sender=ModelSubcategories)
+def page_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    invalidate(_kind(sender), _slugs(instance))
+    if sender is ModelSubcategories:
+        invalidate('categories', ModelCategories.objects.filter(pk=instance.category_id).values_list('slug', flat=True))
+        invalidate(TREE, [TREE])
+
+
+def invalidate_genres(subcategory_ids):
+    ''' Сброс дерева жанров и страниц жанров после пересчёта счётчиков книг поджанров. '''
+    invalidate(TREE, [TREE])
+    invalidate('categories', ModelCategories.objects.filter(subcategories__in=subcategory_ids).values_list('slug', flat=True))
+
+
+@receiver(post_save, sender=ModelCategories)
+@receiver(post_delete, sender=ModelCategories)
+def category_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    invalidate('categories', _slugs(instance))
+    invalidate(TREE, [TREE])
+    # Страницы поджанров показывают название жанра
+    invalidate('subcategories', ModelSubcategories.objects.filter(category_id=instance.pk).values_list('slug', flat=True))
@@ -0,0 +1,101 @@
+# D:\Python\myProject\Bookland\apps\bookland\cache_backends.py
+
+'''Файловый кэш с ограничением по суммарному размеру и вытеснением LRU.
+
+Стандартный FileBasedCache при переполнении (MAX_ENTRIES) удаляет случайную
+часть записей и не ограничивает объём на диске. Здесь чтение записи обновляет
+mtime файла, а при превышении OPTIONS['MAX_SIZE'] (байт) или MAX_ENTRIES
+удаляются записи с самым старым mtime - давно не читанные - до CULL_TARGET
+от лимита.
+
+Django вызывает _cull() перед каждой записью. Обход каталога (stat каждого
+файла) здесь выполняется только при превышении лимита по оценке или раз в
+RESCAN_INTERVAL секунд: между обходами процесс прибавляет к результату
+последнего обхода размеры своих записей. Перезапись ключа оценку завышает,
+записи других процессов учитывает следующий обход.
+
+    CACHES = {'default': {
+        'BACKEND': 'bookland.cache_backends.LRUFileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'OPTIONS': {'MAX_SIZE': 256 * 1024 * 1024, 'MAX_ENTRIES': 100000},
+    }}
+'''
+
+import os
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+CULL_TARGET = 0.9  # После вытеснения остаётся не больше 90% лимита
+RESCAN_INTERVAL = 60  # с - не реже полный обход каталога (записи других процессов)
+
+_MISSING = object()
+
+
+class LRUFileBasedCache(FileBasedCache):
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self._max_size = int(params.get('OPTIONS', {}).get('MAX_SIZE', DEFAULT_MAX_SIZE))
+        self._usage = None  # (записей, байт): последний обход + записанное этим процессом после него
+        self._scanned_at = 0.0
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        if value is _MISSING:
+            return default
+        try:
+            os.utime(self._key_to_file(key, version))  # запись прочитана - она "свежая" для LRU
+        except OSError:
+            pass
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        super().set(key, value, timeout, version)
+        if self._usage is not None:
+            try:
+                size = os.path.getsize(self._key_to_file(key, version))
+            except OSError:
+                return
+            self._usage = (self._usage[0] + 1, self._usage[1] + size)
+
+    def _within_limits(self, count, total):
+        return total < self._max_size and count < self._max_entries
+
+    def _cull(self):
+        if self._usage is not None and time.monotonic() - self._scanned_at < RESCAN_INTERVAL \
+                and self._within_limits(*self._usage):
+            return
+        entries = []
+        total = 0
+        for fname in self._list_cache_files():
+            try:
+                stat_result = os.stat(fname)
+            except OSError:  # запись удалил другой процесс
+                continue
+            entries.append((stat_result.st_mtime_ns, stat_result.st_size, fname))
+            total += stat_result.st_size
+        self._scanned_at = time.monotonic()
+        count = len(entries)
+        if not self._within_limits(count, total):
+            size_limit = self._max_size * CULL_TARGET
+            count_limit = self._max_entries * CULL_TARGET
+            entries.sort()
+            for _, size, fname in entries:
+                if total <= size_limit and count <= count_limit:
+                    break
+                self._delete(fname)
+                total -= size
+                count -= 1
+        self._usage = (count, total)
+
+    def total_size(self):
+        ''' Текущий объём кэша на диске, байт. '''
+        size = 0
+        for fname in self._list_cache_files():
+            try:
+                size += os.path.getsize(fname)
+            except OSError:
+                pass
+        return size
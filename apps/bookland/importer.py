@@ -0,0 +1,217 @@
+# D:\Python\myProject\Bookland\apps\bookland\importer.py
+
+'''Массовый импорт каталога аудиокниг (CSV / JSONL).
+
+Записи читаются потоком и обрабатываются пачками: на пачку - один запрос подбора
+слагов, по одному запросу на догрузку неизвестных авторов/чтецов/циклов/поджанров
+и bulk_create для книг и строк M2M-связей (плюс пакетная запись в поисковый
+индекс, см. search.py). ModelBooks.save() не вызывается,
+поэтому счётчики файлов у новых книг остаются нулевыми (файлов у них ещё нет).
+Сигналов bulk_create не посылает: счётчики книг затронутых поджанров и жанров
+пересчитываются, а кэш страниц авторов, чтецов, циклов и поджанров сбрасывается
+в конце каждой пачки.
+
+Формат записи (ключи CSV-заголовка или JSON-объекта):
+    title (обязательно), slug, description, work_type, year, is_published,
+    cycle, cycle_number - слаг цикла и номер в нём,
+    authors, readers, subcategories - слаги через "," или ";" (в JSONL можно списком).
+'''
+
+import csv
+import json
+import re
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_slug
+from django.db import IntegrityError, transaction
+
+from . import cache
+from .models import ModelBooks, Author, Reader, Cycle, ModelSubcategories
+from .search import index_books
+from .signals import recount_genres
+from .utilities import SLUG_BASE_LENGTH, book_base_slug
+
+DEFAULT_CHUNK_SIZE = 1000
+SLUG_ATTEMPTS = 3  # Подборов слагов на пачку, если параллельный импорт занял подобранный слаг
+
+_LIST_SPLIT_RE = re.compile(r'[;,]')
+
+# Поле записи -> (модель, M2M-поле ModelBooks или None для ForeignKey)
+RELATIONS = {
+    'authors': (Author, 'authors'),
+    'readers': (Reader, 'readers'),
+    'subcategories': (ModelSubcategories, 'book_subcategories'),
+    'cycle': (Cycle, None),
+}
+# Поле записи -> вид страницы в bookland.cache
+PAGE_KINDS = {'authors': 'authors', 'readers': 'readers', 'subcategories': 'subcategories', 'cycle': 'cycles'}
+
+
+def read_records(file, fmt):
+    ''' Потоковое чтение записей из открытого текстового файла: fmt = "csv" или "jsonl". '''
+    if fmt == 'csv':
+        yield from csv.DictReader(file)
+    elif fmt == 'jsonl':
+        for line in file:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+    else:
+        raise ValueError(f"Неизвестный формат импорта: {fmt}")
+
+
+def _split_slugs(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = _LIST_SPLIT_RE.split(value)
+    return [slug.strip() for slug in value if slug and slug.strip()]
+
+
+def _to_bool(value, default=True):
+    if value in (None, ''):
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'да')
+    return bool(value)
+
+
+class BookImporter:
+    ''' Импорт книг пачками. Карты "слаг -> id" связанных моделей живут всё время
+    импорта, так что каждый автор/чтец/цикл/поджанр запрашивается из БД один раз.
+    '''
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.slug_maps = {name: {} for name in RELATIONS}
+        self.created = 0
+        self.errors = []  # (номер записи, сообщение)
+
+    def run(self, records):
+        records = iter(records)
+        position = 0
+        while True:
+            chunk = list(islice(records, self.chunk_size))
+            if not chunk:
+                break
+            self.import_chunk(chunk, start=position)
+            position += len(chunk)
+        return {'created': self.created, 'errors': self.errors}
+
+    def _resolve(self, chunk):
+        ''' Догружает id для слагов пачки, которых ещё нет в картах. '''
+        for name, (model, _) in RELATIONS.items():
+            slug_map = self.slug_maps[name]
+            missing = {
+                slug
+                for record in chunk
+                for slug in _split_slugs(record.get(name))
+                if slug not in slug_map
+            }
+            if missing:
+                slug_map.update(model.objects.filter(slug__in=missing).values_list('slug', 'id'))
+                # Несуществующие слаги запоминаем, чтобы не запрашивать их повторно
+                slug_map.update((slug, None) for slug in missing if slug not in slug_map)
+
+    def _ids(self, name, record):
+        slug_map = self.slug_maps[name]
+        ids, unknown = [], []
+        for slug in _split_slugs(record.get(name)):
+            if slug_map.get(slug) is None:
+                unknown.append(slug)
+            elif slug_map[slug] not in ids:
+                ids.append(slug_map[slug])
+        return ids, unknown
+
+    def _build_book(self, record):
+        slug = (record.get('slug') or '').strip()
+        if slug:
+            # Явный слаг - как базовый: с суффиксом "-N" должен поместиться в поле
+            validate_slug(slug)
+            if len(slug) > SLUG_BASE_LENGTH:
+                raise ValidationError(f"Слаг длиннее {SLUG_BASE_LENGTH} символов: {slug}")
+        book = ModelBooks(
+            title=(record.get('title') or '').strip(),
+            slug=slug,
+            description=record.get('description') or None,
+            work_type=record.get('work_type') or 'novel',
+            year=int(record['year']) if record.get('year') not in (None, '') else None,
+            is_published=_to_bool(record.get('is_published')),
+        )
+        related = {}
+        for name in RELATIONS:
+            ids, unknown = self._ids(name, record)
+            if unknown:
+                raise ValidationError(f"Не найдены {name}: {', '.join(unknown)}")
+            related[name] = ids
+
+        if book.work_type == 'cycle' and related['cycle']:
+            book.cycle_id = related['cycle'][0]
+            book.cycle_number = str(record.get('cycle_number') or '').strip() or None
+
+        book.clean_fields(exclude=['slug'])
+        return book, related
+
+    def _invalidate_pages(self, books, relations):
+        ''' Сброс кэша страниц, на которых появились книги пачки; слаги - из карт, без запроса. '''
+        slugs = {
+            name: {pk: slug for slug, pk in self.slug_maps[name].items() if pk is not None} for name in PAGE_KINDS
+        }
+        pages = {kind: set() for kind in PAGE_KINDS.values()}
+        for book, related in zip(books, relations):
+            related = {**related, 'cycle': [book.cycle_id] if book.cycle_id else []}
+            for name, kind in PAGE_KINDS.items():
+                pages[kind].update(slugs[name][pk] for pk in related[name])
+        cache.invalidate_pages(pages)
+
+    def import_chunk(self, chunk, start=0):
+        self._resolve(chunk)
+
+        books, relations = [], []
+        for index, record in enumerate(chunk, start=start + 1):
+            try:
+                book, related = self._build_book(record)
+            except (ValidationError, ValueError, TypeError) as error:
+                self.errors.append((index, str(error)))
+                continue
+            books.append(book)
+            relations.append(related)
+
+        # Явно заданные слаги тоже проверяем на уникальность. Подбор - в транзакции вставки;
+        # если параллельный импорт занял тот же слаг раньше нашего INSERT, подбор повторяется
+        bases = [book.slug or book_base_slug(book.title) for book in books]
+        for attempt in range(1, SLUG_ATTEMPTS + 1):
+            try:
+                self._insert(books, relations, bases)
+                break
+            except IntegrityError:
+                for book in books:
+                    book.pk = None
+                taken = ModelBooks.objects.filter(slug__in=[book.slug for book in books]).exists()
+                if attempt == SLUG_ATTEMPTS or not taken:
+                    raise
+        self._invalidate_pages(books, relations)
+
+        self.created += len(books)
+        return books
+
+    def _insert(self, books, relations, bases):
+        with transaction.atomic():
+            for book, slug in zip(books, ModelBooks.allocate_slugs(bases)):
+                book.slug = slug
+            ModelBooks.objects.bulk_create(books, batch_size=self.chunk_size)
+            for name, (_, field_name) in RELATIONS.items():
+                if field_name is None:
+                    continue
+                field = ModelBooks._meta.get_field(field_name)
+                source, target = field.m2m_field_name(), field.m2m_reverse_field_name()
+                rows = [
+                    field.remote_field.through(**{f"{source}_id": book.pk, f"{target}_id": related_id})
+                    for book, related in zip(books, relations)
+                    for related_id in related[name]
+                ]
+                field.remote_field.through.objects.bulk_create(rows, batch_size=self.chunk_size)
+            # bulk_create не посылает сигналов - поисковый индекс пополняем сами
+            index_books([book.pk for book in books])
+            recount_genres({pk for related in relations for pk in related['subcategories']})
@@ -0,0 +1,204 @@
+# D:\Python\myProject\Bookland\apps\bookland\integrity.py
+
+'''Сканер целостности хранилища: таблица StoredFile вместо обращений к диску из админки.
+
+scan() обходит каталоги upload_to четырёх файловых моделей через os.scandir и
+записывает для каждого файла размер, mtime и наличие на диске, а для каждой
+строки - ссылается ли на файл запись модели. Сироты (файл без записи) и
+пропавшие файлы (запись без файла) видны в админке "Файлы хранилища", а
+колонки размера читают StoredFile одним подзапросом.
+
+Повторное сканирование читает только каталоги, у которых изменился mtime
+(файл добавлен, удалён или переименован); изменение файла на месте mtime
+каталога не меняет - его находит полное сканирование (scan(full=True)).
+Сохранение и удаление записей моделей обновляют свою строку сразу (сигналы).
+Запуск - manage.py scan_storage (в т.ч. --loop в фоне).
+'''
+
+import os
+import posixpath
+from collections import defaultdict
+from datetime import datetime
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .media import FILE_FIELDS, media_directories
+from .models import AudioFile, AdditionalFile, BookImage, StorageDirectory, StoredFile, TorrentFile
+from .thumbnails import is_derivative
+
+SKIPPED_SUFFIXES = ('.part', '.tmp', '.dedup')  # недокачанные загрузки, временные файлы производных и дедупликации
+BATCH_SIZE = 500
+
+
+def _skipped(name):
+    return name.endswith(SKIPPED_SUFFIXES) or is_derivative(name)
+
+
+def referenced_names():
+    ''' Имена файлов (в storage), на которые ссылаются записи моделей. '''
+    names = set()
+    for model, field in FILE_FIELDS:
+        names.update(model.objects.exclude(**{field: ''}).values_list(field, flat=True).iterator())
+    return names
+
+
+def _stat(name):
+    try:
+        info = os.stat(default_storage.path(name))
+    except FileNotFoundError:
+        return None
+    return info.st_size, datetime.fromtimestamp(info.st_mtime)
+
+
+def _walk(known_directories, full):
+    ''' Обход каталогов: (mtime всех найденных каталогов, прочитанные каталоги, {имя: (размер, mtime)}). '''
+    children = defaultdict(list)
+    for directory in known_directories:
+        children[posixpath.dirname(directory)].append(directory)
+    seen, listed, found = {}, set(), {}
+    stack = [directory.rstrip('/') for directory in media_directories()]
+    while stack:
+        directory = stack.pop()
+        try:
+            mtime_ns = os.stat(default_storage.path(directory)).st_mtime_ns
+        except FileNotFoundError:
+            continue
+        seen[directory] = mtime_ns
+        if not full and known_directories.get(directory) == mtime_ns:
+            stack.extend(children[directory])  # состав каталога не менялся - подкаталоги из прошлого обхода
+            continue
+        listed.add(directory)
+        with os.scandir(default_storage.path(directory)) as entries:
+            for entry in entries:
+                name = posixpath.join(directory, entry.name)
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(name)
+                elif entry.is_file() and not _skipped(entry.name):
+                    info = entry.stat()
+                    found[name] = (info.st_size, datetime.fromtimestamp(info.st_mtime))
+    return seen, listed, found
+
+
+def scan(full=False):
+    ''' Сканирование хранилища (см. модуль). Возвращает статистику прохода. '''
+    now = timezone.now()
+    known_directories = dict(StorageDirectory.objects.values_list('path', 'mtime_ns'))
+    seen, listed, found = _walk(known_directories, full)
+    vanished = set(known_directories) - set(seen)
+    rescanned = listed | vanished
+    referenced = referenced_names()
+
+    changed, deleted = [], []
+    rows = {}
+    for row in StoredFile.objects.only('path', 'size', 'mtime', 'exists', 'referenced').iterator():
+        rows[row.path] = row
+        state = (row.size, row.mtime, row.exists, row.referenced)
+        if posixpath.dirname(row.path) in rescanned:
+            on_disk = found.get(row.path)
+            row.exists = on_disk is not None
+            if on_disk:
+                row.size, row.mtime = on_disk
+        row.referenced = row.path in referenced
+        if not row.exists and not row.referenced:
+            deleted.append(row.pk)  # удалённый файл без записи - забываем
+        elif (row.size, row.mtime, row.exists, row.referenced) != state:
+            row.checked_at = now
+            changed.append(row)
+
+    created = [
+        StoredFile(path=name, size=size, mtime=mtime, referenced=name in referenced, checked_at=now)
+        for name, (size, mtime) in found.items() if name not in rows
+    ]
+    for name in referenced - rows.keys() - found.keys():
+        on_disk = _stat(name)  # файл вне просмотренных каталогов или в ещё не учтённом
+        size, mtime = on_disk or (None, None)
+        created.append(StoredFile(
+            path=name, size=size, mtime=mtime, exists=on_disk is not None, referenced=True, checked_at=now
+        ))
+
+    with transaction.atomic():
+        StoredFile.objects.bulk_create(created, batch_size=BATCH_SIZE)
+        StoredFile.objects.bulk_update(
+            changed, ['size', 'mtime', 'exists', 'referenced', 'checked_at'], batch_size=BATCH_SIZE
+        )
+        for i in range(0, len(deleted), BATCH_SIZE):
+            StoredFile.objects.filter(pk__in=deleted[i:i + BATCH_SIZE]).delete()
+        StorageDirectory.objects.filter(path__in=vanished).delete()
+        StorageDirectory.objects.bulk_create(
+            [StorageDirectory(path=path, mtime_ns=mtime_ns) for path, mtime_ns in seen.items()],
+            update_conflicts=True, unique_fields=['path'], update_fields=['mtime_ns'], batch_size=BATCH_SIZE,
+        )
+    return {
+        'directories': len(seen),
+        'listed': len(listed),
+        'files': len(found),
+        'created': len(created),
+        'updated': len(changed),
+        'forgotten': len(deleted),
+        'missing': StoredFile.objects.filter(exists=False, referenced=True).count(),
+        'orphans': StoredFile.objects.filter(exists=True, referenced=False).count(),
+    }
+
+
+def record(name, referenced=True):
+    ''' Обновляет строку файла name сразу (одним запросом), не дожидаясь сканирования. '''
+    record_many([name], referenced)
+
+
+def record_many(names, referenced=True):
+    ''' То же для файлов names - запрос на BATCH_SIZE файлов; для записей, созданных
+    в обход сигналов (bulk_create).
+    '''
+    now = timezone.now()
+    rows = []
+    for name in names:
+        on_disk = _stat(name)
+        size, mtime = on_disk or (None, None)
+        rows.append(StoredFile(
+            path=name, size=size, mtime=mtime, exists=on_disk is not None, referenced=referenced, checked_at=now,
+        ))
+    StoredFile.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=['path'],
+        update_fields=['size', 'mtime', 'exists', 'referenced', 'checked_at'], batch_size=BATCH_SIZE,
+    )
+
+
+def _file_name(instance):
+    field = 'image' if isinstance(instance, BookImage) else 'file'
+    return instance.__dict__.get(field) or ''
+
+
+@receiver(post_init, sender=TorrentFile)
+@receiver(post_init, sender=AudioFile)
+@receiver(post_init, sender=BookImage)
+@receiver(post_init, sender=AdditionalFile)
+def remember_file_name(sender, instance, **kwargs):
+    # Имя файла в хранилище на момент загрузки записи - чтобы заметить замену файла
+    instance._stored_name = str(_file_name(instance)) if instance.pk else ''
+
+
+@receiver(post_save, sender=TorrentFile)
+@receiver(post_save, sender=AudioFile)
+@receiver(post_save, sender=BookImage)
+@receiver(post_save, sender=AdditionalFile)
+def file_stored(sender, instance, created, raw=False, **kwargs):
+    name = str(_file_name(instance))
+    if raw or not name or (name == instance._stored_name and not created):
+        return
+    if instance._stored_name and instance._stored_name != name:
+        StoredFile.objects.filter(path=instance._stored_name).update(referenced=False)  # старый файл - сирота
+    record(name)
+    instance._stored_name = name
+
+
+@receiver(post_delete, sender=TorrentFile)
+@receiver(post_delete, sender=AudioFile)
+@receiver(post_delete, sender=BookImage)
+@receiver(post_delete, sender=AdditionalFile)
+def file_unreferenced(sender, instance, **kwargs):
+    if instance._stored_name:
+        StoredFile.objects.filter(path=instance._stored_name).update(referenced=False)
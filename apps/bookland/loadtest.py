@@ -0,0 +1,141 @@
+# D:\Python\myProject\Bookland\apps\bookland\loadtest.py
+
+'''Нагрузочный тест: сколько одновременных медленных скачиваний выдерживает сервер
+под WSGI (фиксированный пул потоков) и под ASGI (uvicorn), см. manage.py loadtest.
+
+Синтетический клиент (asyncio) открывает N соединений к аудиофайлу и читает их
+с ограниченной скоростью - как слушатели на мобильном интернете. Параллельно
+раз в PROBE_INTERVAL секунд запрашивается лёгкая страница: под WSGI каждый
+медленный клиент занимает поток, и пробный запрос ждёт в очереди.
+'''
+
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+PROBE_INTERVAL = 0.2
+CONNECT_TIMEOUT = 10.0
+
+
+# --- WSGI-сервер с ограниченным пулом потоков (как gunicorn --threads N) ---
+
+class PooledWSGIServer(ThreadingMixIn, WSGIServer):
+    threads = 8
+    request_queue_size = 1024
+
+    def server_activate(self):
+        super().server_activate()
+        self.pool = ThreadPoolExecutor(max_workers=self.threads)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def serve_wsgi(host, port, threads):
+    from django.core.wsgi import get_wsgi_application
+
+    server_class = type('PooledWSGIServer', (PooledWSGIServer,), {'threads': threads})
+    with make_server(host, port, get_wsgi_application(), server_class, QuietHandler) as server:
+        server.serve_forever()
+
+
+# --- Синтетический клиент ---
+
+async def _request(host, port, path):
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), CONNECT_TIMEOUT)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode())
+    await writer.drain()
+    return reader, writer
+
+
+async def slow_download(host, port, path, rate, duration, timeout):
+    ''' Скачивание со скоростью rate байт/с в течение duration секунд.
+    Возвращает время до первого байта тела или None, если ответ не начался за timeout.
+    '''
+    started = time.monotonic()
+    writer = None
+    try:
+        reader, writer = await _request(host, port, path)
+        await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout)
+        first = await asyncio.wait_for(reader.read(16 * 1024), timeout)
+        if not first:
+            return None
+        first_byte = time.monotonic() - started
+        block = max(rate // 10, 1)
+        while time.monotonic() - started < duration:
+            if not await reader.read(block):
+                break
+            await asyncio.sleep(block / rate)
+        return first_byte
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+        return None
+    finally:
+        if writer:
+            writer.close()
+
+
+async def probe(host, port, path, timeout):
+    ''' Время полного ответа на лёгкий запрос или None при таймауте. '''
+    started = time.monotonic()
+    writer = None
+    try:
+        reader, writer = await _request(host, port, path)
+        await asyncio.wait_for(reader.read(), timeout)
+        return time.monotonic() - started
+    except (OSError, asyncio.TimeoutError):
+        return None
+    finally:
+        if writer:
+            writer.close()
+
+
+async def run_client(host, port, media_path, probe_path, connections, rate, duration, timeout=None):
+    timeout = timeout or duration
+    downloads = [
+        asyncio.create_task(slow_download(host, port, media_path, rate, duration, timeout))
+        for _ in range(connections)
+    ]
+    probes = []
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        probes.append(asyncio.create_task(probe(host, port, probe_path, timeout)))
+        await asyncio.sleep(PROBE_INTERVAL)
+    return LoadResult(await asyncio.gather(*downloads), await asyncio.gather(*probes))
+
+
+class LoadResult:
+    def __init__(self, first_bytes, probes):
+        self.first_bytes = first_bytes
+        self.probes = probes
+
+    @property
+    def served(self):
+        return sum(value is not None for value in self.first_bytes)
+
+    @staticmethod
+    def _percentile(values, percent):
+        values = sorted(value for value in values if value is not None)
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+    def summary(self):
+        ttfb = [value for value in self.first_bytes if value is not None]
+        probe_ok = [value for value in self.probes if value is not None]
+        return {
+            'connections': len(self.first_bytes),
+            'served': self.served,
+            'ttfb_median': statistics.median(ttfb) if ttfb else None,
+            'probes': len(self.probes),
+            'probes_ok': len(probe_ok),
+            'probe_p50': self._percentile(self.probes, 50),
+            'probe_p95': self._percentile(self.probes, 95),
+        }
@@ -0,0 +1,28 @@
+# D:\Python\myProject\Bookland\apps\bookland\management\commands\audio_metadata.py
+
+from django.core.management.base import BaseCommand
+
+from bookland import audio_worker
+
+
+class Command(BaseCommand):
+    help = "Заполняет длительность, битрейт и кодек аудиофайлов из очереди заданий (в пуле процессов)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--backfill", action="store_true", help="Поставить в очередь все файлы без длительности")
+        parser.add_argument("--retry-failed", action="store_true", help="Повторить задания, завершившиеся ошибкой")
+        parser.add_argument("--workers", type=int, default=None, help="Процессов в пуле (по умолчанию - все ядра)")
+        parser.add_argument("--batch-size", type=int, default=audio_worker.DEFAULT_BATCH_SIZE)
+        parser.add_argument("--loop", action="store_true", help="Не завершаться, ждать новые задания")
+
+    def handle(self, *args, **options):
+        if options["backfill"]:
+            queued = audio_worker.enqueue_backfill()
+            self.stdout.write(f"Поставлено в очередь: {queued}")
+        if options["retry_failed"]:
+            self.stdout.write(f"Повторно в очереди: {audio_worker.enqueue_failed()}")
+
+        stats = audio_worker.run(
+            workers=options["workers"], batch_size=options["batch_size"], loop=options["loop"]
+        )
+        self.stdout.write(self.style.SUCCESS(f"Готово - {stats.report()}"))
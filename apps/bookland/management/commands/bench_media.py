@@ -0,0 +1,65 @@
+# D:\Python\myProject\Bookland\apps\bookland\management\commands\bench_media.py
+
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+from django.views.static import serve
+
+from bookland.media import serve_media
+
+
+class Command(BaseCommand):
+    help = "Сравнение отдачи файлов: django.views.static.serve и bookland.media.serve_media"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size-mb", type=int, default=256, help="Размер тестового файла, МБ")
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def measure(self, view, request, **kwargs):
+        if asyncio.iscoroutinefunction(view):  # serve_media - async, под WSGI отдаёт FileResponse
+            view = async_to_sync(view)
+        tracemalloc.start()
+        started = time.perf_counter()
+        response = view(request, **kwargs)
+        sent = sum(len(chunk) for chunk in response)
+        response.close()
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return response.status_code, sent, elapsed, peak
+
+    def handle(self, *args, **options):
+        size = options["size_mb"] * 1024 * 1024
+        factory = RequestFactory()
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            path = "uploads/audio_files/bench.m4b"
+            os.makedirs(os.path.join(media_root, "uploads/audio_files"))
+            with open(os.path.join(media_root, path), "wb") as file:
+                block = os.urandom(1024 * 1024)
+                for _ in range(options["size_mb"]):
+                    file.write(block)
+
+            # Перемотка к последним 10% файла
+            seek = {"HTTP_RANGE": f"bytes={size - size // 10}-"}
+            cases = [
+                ("static.serve, весь файл", serve, {}, {"document_root": media_root}),
+                ("serve_media, весь файл", serve_media, {}, {}),
+                ("static.serve, перемотка", serve, seek, {"document_root": media_root}),
+                ("serve_media, перемотка", serve_media, seek, {}),
+            ]
+            for title, view, headers, kwargs in cases:
+                best = None
+                for _ in range(options["repeat"]):
+                    result = self.measure(view, factory.get("/media/" + path, **headers), path=path, **kwargs)
+                    best = result if best is None or result[2] < best[2] else best
+                status, sent, elapsed, peak = best
+                self.stdout.write(
+                    f"{title:28} {status}  отдано {sent / 1024 / 1024:8.1f} МБ  "
+                    f"{sent / 1024 / 1024 / elapsed:8.1f} МБ/с  пик памяти {peak / 1024:8.1f} КБ"
+                )
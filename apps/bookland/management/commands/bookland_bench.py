@@ -0,0 +1,86 @@
+# D:\Python\myProject\Bookland\apps\bookland\management\commands\bookland_bench.py
+
+import json
+import platform
+import sqlite3
+import subprocess
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from bookland import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеры горячих путей на временной базе с синтетическим каталогом: "
+        "запросы, p50/p95, пиковая память; результат - JSON для сравнения между коммитами"
+    )
+
+    def add_arguments(self, parser):
+        for name, default in benchmarks.DEFAULT_COUNTS.items():
+            parser.add_argument(f"--{name}", type=int, default=default, help=f"Количество: {name} (по умолчанию {default})")
+        parser.add_argument("--only", nargs="+", choices=list(benchmarks.BENCHMARKS), help="Только эти замеры")
+        parser.add_argument("--repeat", type=int, default=50, help="Повторов каждой операции")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Записать результат в JSON-файл")
+        parser.add_argument("--compare", help="JSON прошлого прогона - показать изменение p50 и числа запросов")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["compare"]:
+            try:
+                with open(options["compare"], encoding="utf-8") as file:
+                    baseline = json.load(file)["results"]
+            except (OSError, ValueError, KeyError) as error:
+                raise CommandError(f"Не удалось прочитать {options['compare']}: {error}")
+
+        counts = {name: options[name] for name in benchmarks.DEFAULT_COUNTS}
+        with benchmarks.temporary_database():
+            started = time.perf_counter()
+            generated = benchmarks.generate_catalogue(counts, options["seed"])
+            self.stdout.write(f"Каталог за {time.perf_counter() - started:.1f} с: {generated}")
+            results = benchmarks.run(options["only"], options["repeat"], options["seed"])
+
+        self.report(results, baseline)
+        if options["output"]:
+            data = {"meta": self.meta(generated, options), "results": results}
+            with open(options["output"], "w", encoding="utf-8") as file:
+                json.dump(data, file, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Результат записан в {options['output']}"))
+
+    def meta(self, generated, options):
+        try:
+            commit = subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            "commit": commit,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "counts": generated,
+            "repeat": options["repeat"],
+            "seed": options["seed"],
+        }
+
+    def report(self, results, baseline):
+        self.stdout.write(f"{'замер':26} {'SQL':>5} {'p50, мс':>10} {'p95, мс':>10} {'память, КБ':>11}")
+        for name, result in results.items():
+            if "skipped" in result:
+                self.stdout.write(f"{name:26} пропущен: {result['skipped']}")
+                continue
+            line = (
+                f"{name:26} {result['queries']:>5g} {result['p50_ms']:>10.3f} {result['p95_ms']:>10.3f} "
+                f"{result['peak_kb']:>11.1f}"
+            )
+            old = (baseline or {}).get(name)
+            if old and "skipped" not in old:
+                change = (result["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100 if old["p50_ms"] else 0
+                line += f"   p50 {change:+.0f}%, SQL {old['queries']:g} -> {result['queries']:g}"
+            self.stdout.write(line)
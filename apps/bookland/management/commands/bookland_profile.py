@@ -0,0 +1,107 @@
+# D:\Python\myProject\Bookland\apps\bookland\management\commands\bookland_profile.py
+
+import json
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+SORT_KEYS = {
+    "total": lambda view: view["wall_total"],
+    "avg": lambda view: view["wall_total"] / view["requests"],
+    "p95": lambda view: view["p95"],
+    "queries": lambda view: view["queries"] / view["requests"],
+    "db": lambda view: view["db_total"],
+}
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Отчёт по профилю запросов (BOOKLAND_PROFILE_LOG, см. bookland.profiling): "
+        "view по времени ответа и SQL, повторяющиеся запросы (N+1), самые медленные запросы"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--file", help="Файл профиля (по умолчанию BOOKLAND_PROFILE_LOG)")
+        parser.add_argument("--sort", choices=list(SORT_KEYS), default="total", help="Порядок view")
+        parser.add_argument("--top", type=int, default=20, help="Сколько view и повторов показать")
+        parser.add_argument("--slow", type=int, default=5, help="Сколько самых медленных запросов показать")
+        parser.add_argument("--clear", action="store_true", help="Очистить файл профиля после отчёта")
+
+    def handle(self, *args, **options):
+        path = options["file"] or getattr(settings, "BOOKLAND_PROFILE_LOG", None)
+        if not path:
+            raise CommandError("Не задан файл профиля: --file или BOOKLAND_PROFILE_LOG")
+        try:
+            with open(path, encoding="utf-8") as log:
+                entries = [json.loads(line) for line in log if line.strip()]
+        except FileNotFoundError:
+            raise CommandError(f"Файл профиля {path} не найден - включите BOOKLAND_PROFILING")
+        if not entries:
+            self.stdout.write("Профиль пуст")
+            return
+
+        self.report_views(entries, options)
+        self.report_duplicates(entries, options["top"])
+        self.report_slow(entries, options["slow"])
+        if options["clear"]:
+            open(path, "w").close()
+
+    def report_views(self, entries, options):
+        views = defaultdict(lambda: {"requests": 0, "wall": [], "wall_total": 0.0, "db_total": 0.0, "queries": 0, "n1": 0})
+        for entry in entries:
+            view = views[entry["view"] or entry["path"]]
+            view["requests"] += 1
+            view["wall"].append(entry["wall_ms"])
+            view["wall_total"] += entry["wall_ms"]
+            view["db_total"] += entry["db_ms"]
+            view["queries"] += entry["queries"]
+            view["n1"] += bool(entry["duplicates"])
+        for view in views.values():
+            view["p95"] = percentile(view["wall"], 95)
+
+        ranked = sorted(views.items(), key=lambda item: SORT_KEYS[options["sort"]](item[1]), reverse=True)
+        self.stdout.write(self.style.MIGRATE_HEADING(f"View по {options['sort']} ({len(entries)} запросов)"))
+        self.stdout.write(f"{'view':40} {'запр.':>6} {'всего, мс':>10} {'средн.':>8} {'p95':>8} {'SQL':>6} {'БД, мс':>8} {'N+1':>5}")
+        for name, view in ranked[:options["top"]]:
+            requests = view["requests"]
+            self.stdout.write(
+                f"{name[:40]:40} {requests:>6} {view['wall_total']:>10.0f} {view['wall_total'] / requests:>8.1f} "
+                f"{view['p95']:>8.1f} {view['queries'] / requests:>6.1f} {view['db_total'] / requests:>8.1f} {view['n1']:>5}"
+            )
+
+    def report_duplicates(self, entries, top):
+        # Повторяющийся SQL: в скольких запросах встречался и сколько раз за запрос (максимум)
+        duplicates = defaultdict(lambda: {"requests": 0, "max": 0, "views": set()})
+        for entry in entries:
+            for sql, count in entry["duplicates"].items():
+                duplicate = duplicates[sql]
+                duplicate["requests"] += 1
+                duplicate["max"] = max(duplicate["max"], count)
+                duplicate["views"].add(entry["view"] or entry["path"])
+        if not duplicates:
+            return
+        self.stdout.write(self.style.MIGRATE_HEADING("\nПовторяющиеся запросы (N+1)"))
+        ranked = sorted(duplicates.items(), key=lambda item: (item[1]["requests"], item[1]["max"]), reverse=True)
+        for sql, duplicate in ranked[:top]:
+            self.stdout.write(
+                f"{duplicate['requests']:>5} запр., до {duplicate['max']} раз; {', '.join(sorted(duplicate['views']))}\n"
+                f"      {sql[:300]}"
+            )
+
+    def report_slow(self, entries, count):
+        if not count:
+            return
+        self.stdout.write(self.style.MIGRATE_HEADING("\nСамые медленные запросы"))
+        for entry in sorted(entries, key=lambda entry: entry["wall_ms"], reverse=True)[:count]:
+            self.stdout.write(
+                f"{entry['wall_ms']:>8.1f} мс  {entry['method']} {entry['path']} -> {entry['status']}, "
+                f"SQL {entry['queries']} за {entry['db_ms']:.1f} мс"
+            )
+            for query in sorted(entry.get("sql", []), key=lambda query: query["ms"], reverse=True)[:3]:
+                self.stdout.write(f"      {query['ms']:>7.1f} мс  {query['sql'][:200]}")
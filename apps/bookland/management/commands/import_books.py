@@ -0,0 +1,35 @@
+# D:\Python\myProject\Bookland\apps\bookland\management\commands\import_books.py
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bookland.importer import BookImporter, DEFAULT_CHUNK_SIZE, read_records
+
+
+class Command(BaseCommand):
+    help = "Массовый импорт аудиокниг из CSV или JSONL (пачками, через bulk_create)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Путь к файлу .csv или .jsonl")
+        parser.add_argument("--format", choices=("csv", "jsonl"), help="Формат файла (по умолчанию - по расширению)")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Записей в одной пачке")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("csv" if path.lower().endswith(".csv") else "jsonl")
+        importer = BookImporter(chunk_size=options["chunk_size"])
+
+        started = time.monotonic()
+        try:
+            with open(path, encoding="utf-8", newline="") as file:
+                result = importer.run(read_records(file, fmt))
+        except OSError as error:
+            raise CommandError(f"Не удалось прочитать {path}: {error}")
+
+        for index, message in result["errors"]:
+            self.stderr.write(f"Запись {index}: {message}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Импортировано книг: {result['created']}, ошибок: {len(result['errors'])}, "
+            f"время: {time.monotonic() - started:.1f} с"
+        ))
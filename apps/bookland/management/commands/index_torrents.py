@@ -0,0 +1,55 @@
+# D:\Python\myProject\Bookland\apps\bookland\management\commands\index_torrents.py
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from bookland.models import TorrentFile
+from bookland.torrent_meta import extract
+
+
+class Command(BaseCommand):
+    help = "Разбирает торрент-файлы библиотеки (info-hash, размер, список файлов) в пуле процессов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Разобрать заново и уже проиндексированные файлы")
+        parser.add_argument("--workers", type=int, default=None, help="Процессов в пуле (0 - без пула)")
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument("--duplicates", action="store_true", help="Показать торренты, загруженные повторно")
+
+    def handle(self, *args, **options):
+        torrents = TorrentFile.objects.order_by("pk").only("pk", "file")
+        if not options["all"]:
+            torrents = torrents.filter(info_hash="")
+        workers = os.cpu_count() if options["workers"] is None else options["workers"]
+        executor = ProcessPoolExecutor(max_workers=workers) if workers else None
+        map_function = (lambda function, items: executor.map(function, items, chunksize=8)) if executor else map
+
+        parsed = failed = 0
+        last_pk = 0
+        try:
+            while True:
+                batch = list(torrents.filter(pk__gt=last_pk)[:options["batch_size"]])
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+                indexed = []
+                for torrent, (metadata, error) in zip(batch, map_function(extract, [t.file.path for t in batch])):
+                    if metadata:
+                        torrent.apply_metainfo(metadata)
+                        indexed.append(torrent)
+                    else:
+                        failed += 1
+                        self.stderr.write(f"{torrent.file.name}: {error}")
+                TorrentFile.objects.bulk_update(indexed, TorrentFile.METAINFO_FIELDS)
+                parsed += len(indexed)
+        finally:
+            if executor:
+                executor.shutdown()
+        self.stdout.write(self.style.SUCCESS(f"Разобрано: {parsed}, ошибок: {failed}"))
+
+        if options["duplicates"]:
+            for info_hash, count in TorrentFile.objects.duplicates():
+                books = TorrentFile.objects.filter(info_hash=info_hash).values_list("book__title", flat=True)
+                self.stdout.write(f"{info_hash}  x{count}: {', '.join(books)}")
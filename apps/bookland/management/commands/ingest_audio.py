@@ -0,0 +1,34 @@
+# D:\Python\myProject\Bookland\apps\bookland\management\commands\ingest_audio.py
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from bookland.audio_ingest import ingest_audio, natural_key, open_parts
+from bookland.models import ModelBooks
+
+
+class Command(BaseCommand):
+    help = "Добавляет части аудиокниги из каталога или архива (zip/tar) в естественном порядке имён"
+
+    def add_arguments(self, parser):
+        parser.add_argument("book", help="Слаг книги")
+        parser.add_argument("source", help="Каталог или архив с частями")
+        parser.add_argument("--dry-run", action="store_true", help="Только показать порядок частей")
+
+    def handle(self, *args, **options):
+        try:
+            book = ModelBooks.objects.get(slug=options["book"])
+        except ModelBooks.DoesNotExist:
+            raise CommandError(f"Книга {options['book']} не найдена")
+        try:
+            with open_parts(options["source"]) as parts:
+                if options["dry_run"]:
+                    for number, (name, _) in enumerate(sorted(parts, key=lambda part: natural_key(part[0])), 1):
+                        self.stdout.write(f"{number:>4}  {name}")
+                    return
+                created = ingest_audio(book, parts)
+        except (OSError, ValidationError) as error:
+            raise CommandError(error)
+        for audio in created:
+            self.stdout.write(f"{audio.order:>4}  {audio.file.name}")
+        self.stdout.write(self.style.SUCCESS(f"Добавлено частей: {len(created)}"))
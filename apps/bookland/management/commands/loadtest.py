@@ -0,0 +1,99 @@
+# D:\Python\myProject\Bookland\apps\bookland\management\commands\loadtest.py
+
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from bookland import loadtest
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнение WSGI (пул потоков) и ASGI (uvicorn) под медленными клиентами: "
+        "сколько скачиваний обслуживается одновременно и как отвечает лёгкая страница"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--servers", nargs="+", choices=["wsgi", "asgi"], default=["wsgi", "asgi"])
+        parser.add_argument("--connections", type=int, default=100, help="Одновременных медленных скачиваний")
+        parser.add_argument("--threads", type=int, default=8, help="Потоков WSGI-сервера")
+        parser.add_argument("--rate", type=int, default=64, help="Скорость клиента, КБ/с")
+        parser.add_argument("--duration", type=float, default=10.0, help="Длительность, с")
+        parser.add_argument("--size-mb", type=int, default=64, help="Размер синтетического аудиофайла, МБ")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--serve-wsgi", action="store_true", help="(внутреннее) запустить только WSGI-сервер")
+
+    def handle(self, *args, **options):
+        host, port = "127.0.0.1", options["port"]
+        if options["serve_wsgi"]:
+            loadtest.serve_wsgi(host, port, options["threads"])
+            return
+
+        name = f"uploads/audio_files/loadtest-{uuid.uuid4().hex}.mp3"
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            block = os.urandom(1024 * 1024)
+            for _ in range(options["size_mb"]):
+                file.write(block)
+        try:
+            for server in options["servers"]:
+                process = self.start_server(server, host, port, options)
+                try:
+                    result = asyncio.run(loadtest.run_client(
+                        host, port, f"/{settings.MEDIA_URL.lstrip('/')}{name}", "/",
+                        options["connections"], options["rate"] * 1024, options["duration"],
+                    ))
+                finally:
+                    process.terminate()
+                    process.wait()
+                self.report(server, result.summary(), options)
+        finally:
+            os.remove(path)
+
+    def start_server(self, server, host, port, options):
+        if server == "wsgi":
+            command = [
+                sys.executable, "manage.py", "loadtest", "--serve-wsgi",
+                "--port", str(port), "--threads", str(options["threads"]),
+            ]
+        else:
+            try:
+                import uvicorn  # noqa: F401
+            except ImportError:
+                raise CommandError("Для ASGI нужен uvicorn: pip install uvicorn")
+            command = [
+                sys.executable, "-m", "uvicorn", "apps.asgi:application",
+                "--host", host, "--port", str(port), "--log-level", "warning", "--no-access-log",
+            ]
+        process = subprocess.Popen(command, cwd=settings.BASE_DIR)
+        deadline = time.monotonic() + 15
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection((host, port), timeout=0.5).close()
+                return process
+            except OSError:
+                if process.poll() is not None:
+                    raise CommandError(f"Сервер {server} не запустился")
+                time.sleep(0.2)
+        process.terminate()
+        raise CommandError(f"Сервер {server} не открыл порт {port}")
+
+    def report(self, server, summary, options):
+        def seconds(value):
+            return f"{value * 1000:.0f} мс" if value is not None else "-"
+
+        title = f"WSGI, {options['threads']} потоков" if server == "wsgi" else "ASGI (uvicorn)"
+        self.stdout.write(
+            f"{title:22} скачиваний обслужено {summary['served']}/{summary['connections']}, "
+            f"TTFB медиана {seconds(summary['ttfb_median'])}; "
+            f"пробные запросы {summary['probes_ok']}/{summary['probes']}, "
+            f"p50 {seconds(summary['probe_p50'])}, p95 {seconds(summary['probe_p95'])}"
+        )
@@ -0,0 +1,42 @@
+# D:\Python\myProject\Bookland\apps\bookland\management\commands\media_dedup.py
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import filesizeformat
+
+from bookland.media import media_directories
+from bookland.storage import GC_GRACE_SECONDS, DedupFileSystemStorage
+
+
+class Command(BaseCommand):
+    help = (
+        "Хранилище с дедупликацией (bookland.storage): сколько места сэкономлено, "
+        "перевод старых файлов на блобы и удаление блобов, на которые не ссылается ни один файл"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--adopt", action="store_true", help="Перевести на блобы файлы, загруженные раньше")
+        parser.add_argument("--gc", action="store_true", help="Удалить блобы без ссылок")
+        parser.add_argument("--grace", type=int, default=GC_GRACE_SECONDS,
+                            help="Не удалять блобы моложе стольких секунд")
+        parser.add_argument("--dry-run", action="store_true", help="Только показать, что удалит --gc")
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, DedupFileSystemStorage):
+            raise CommandError("Хранилище по умолчанию - не bookland.storage.DedupFileSystemStorage (STORAGES)")
+
+        if options["adopt"]:
+            adopted, freed = default_storage.adopt(media_directories())
+            self.stdout.write(f"Переведено на блобы: {adopted}, освобождено {filesizeformat(freed)}")
+        if options["gc"]:
+            removed, freed = default_storage.collect_garbage(options["grace"], dry_run=options["dry_run"])
+            action = "Будет удалено" if options["dry_run"] else "Удалено"
+            self.stdout.write(f"{action} блобов без ссылок: {removed}, {filesizeformat(freed)}")
+
+        usage = default_storage.usage()
+        self.stdout.write(
+            f"Блобов: {usage['blobs']}, файлов-ссылок: {usage['links']}\n"
+            f"На диске: {filesizeformat(usage['stored_bytes'])}, "
+            f"без дедупликации: {filesizeformat(usage['logical_bytes'])}"
+        )
+        self.stdout.write(self.style.SUCCESS(f"Сэкономлено: {filesizeformat(usage['saved_bytes'])}"))
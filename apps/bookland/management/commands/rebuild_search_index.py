@@ -0,0 +1,13 @@
+# D:\Python\myProject\Bookland\apps\bookland\management\commands\rebuild_search_index.py
+
+from django.core.management.base import BaseCommand
+
+from bookland.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Полная пересборка полнотекстового индекса книг (FTS5)"
+
+    def handle(self, *args, **options):
+        total = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Проиндексировано книг: {total}"))
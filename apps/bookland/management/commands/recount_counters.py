@@ -0,0 +1,23 @@
+# D:\Python\myProject\Bookland\apps\bookland\management\commands\recount_counters.py
+
+from django.core.management.base import BaseCommand
+
+from bookland.models import ModelBooks
+
+
+class Command(BaseCommand):
+    help = "Исправляет расхождения счётчиков файлов у книг (торренты, аудио, изображения, файлы)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Только показать книги с расхождениями")
+
+    def handle(self, *args, **options):
+        drifted = list(ModelBooks.counter_drift().values_list("pk", "slug"))
+        for pk, slug in drifted:
+            self.stdout.write(f"Расхождение счётчиков: {slug} (id={pk})")
+
+        if not options["dry_run"]:
+            pks = [pk for pk, _ in drifted]
+            for i in range(0, len(pks), 500):
+                ModelBooks.recount_counters(ModelBooks.objects.filter(pk__in=pks[i:i + 500]))
+        self.stdout.write(self.style.SUCCESS(f"Книг с расхождениями: {len(drifted)}"))
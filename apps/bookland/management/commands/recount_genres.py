@@ -0,0 +1,16 @@
+# D:\Python\myProject\Bookland\apps\bookland\management\commands\recount_genres.py
+
+from django.core.management.base import BaseCommand
+
+from bookland import cache
+from bookland.models import ModelCategories, ModelSubcategories
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает счётчики книг поджанров и жанров (дерево жанров)"
+
+    def handle(self, *args, **options):
+        subcategories = ModelSubcategories.recount_books()
+        categories = ModelCategories.recount_books()
+        cache.invalidate(cache.TREE, [cache.TREE])
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано поджанров: {subcategories}, жанров: {categories}"))
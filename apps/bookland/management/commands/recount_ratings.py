@@ -0,0 +1,13 @@
+# D:\Python\myProject\Bookland\apps\bookland\management\commands\recount_ratings.py
+
+from django.core.management.base import BaseCommand
+
+from bookland.models import BookRatingSummary
+
+
+class Command(BaseCommand):
+    help = "Полный пересчёт сводок оценок книг (BookRatingSummary) из BookRating"
+
+    def handle(self, *args, **options):
+        total = BookRatingSummary.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано сводок: {total}"))
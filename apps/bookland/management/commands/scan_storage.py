@@ -0,0 +1,47 @@
+# D:\Python\myProject\Bookland\apps\bookland\management\commands\scan_storage.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from bookland import integrity
+from bookland.models import StoredFile
+
+
+class Command(BaseCommand):
+    help = (
+        "Сканирует хранилище (bookland.integrity): размеры файлов для админки, "
+        "файлы без записей (сироты) и записи без файлов"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="Прочитать все каталоги, а не только изменённые")
+        parser.add_argument("--loop", action="store_true", help="Не завершаться, повторять сканирование")
+        parser.add_argument("--interval", type=float, default=300, help="Пауза между сканированиями, с")
+        parser.add_argument("--report", type=int, default=0, help="Показать столько пропавших файлов и сирот")
+
+    def handle(self, *args, **options):
+        full = options["full"]
+        while True:
+            stats = integrity.scan(full=full)
+            self.stdout.write(
+                f"Каталогов: {stats['directories']} (прочитано {stats['listed']}), файлов прочитано: {stats['files']}, "
+                f"новых строк: {stats['created']}, изменено: {stats['updated']}, забыто: {stats['forgotten']}"
+            )
+            style = self.style.WARNING if stats["missing"] else self.style.SUCCESS
+            self.stdout.write(style(f"Пропавших файлов: {stats['missing']}, сирот: {stats['orphans']}"))
+            if options["report"]:
+                self.report(options["report"])
+            if not options["loop"]:
+                break
+            full = False
+            time.sleep(options["interval"])
+
+    def report(self, count):
+        for title, state in (("Пропавшие файлы", {"exists": False, "referenced": True}),
+                             ("Сироты", {"exists": True, "referenced": False})):
+            paths = StoredFile.objects.filter(**state).order_by("path").values_list("path", flat=True)[:count]
+            if paths:
+                self.stdout.write(self.style.MIGRATE_HEADING(title))
+                for path in paths:
+                    self.stdout.write(f"  {path}")
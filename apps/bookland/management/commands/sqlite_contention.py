@@ -0,0 +1,78 @@
+# D:\Python\myProject\Bookland\apps\bookland\management\commands\sqlite_contention.py
+
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+
+from bookland.benchmarks import temporary_database
+from bookland.models import AudioFile, BookRating, ModelBooks
+
+PROFILES = {
+    # Настройки по умолчанию Django: журнал отката, BEGIN DEFERRED, timeout 5 с
+    "django": {"ENGINE": "django.db.backends.sqlite3", "OPTIONS": {}},
+    "bookland": {"ENGINE": "bookland.sqlite", "OPTIONS": {"timeout": 20, "transaction_mode": "IMMEDIATE"}},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Конкурентная запись в SQLite: N потоков добавляют оценки и аудиофайлы; "
+        "пропускная способность и ошибки \"database is locked\" для стандартного бэкенда и bookland.sqlite"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--profiles", nargs="+", choices=list(PROFILES), default=list(PROFILES))
+        parser.add_argument("--threads", type=int, default=8, help="Потоков-писателей")
+        parser.add_argument("--ops", type=int, default=100, help="Транзакций на поток")
+
+    def handle(self, *args, **options):
+        for profile in options["profiles"]:
+            with temporary_database(**PROFILES[profile]):
+                with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+                    journal = cursor.execute("PRAGMA journal_mode").fetchone()[0]
+                done, locked, elapsed = self.run(options["threads"], options["ops"])
+            self.stdout.write(
+                f"{profile:9} (journal_mode={journal}) потоков {options['threads']}: транзакций {done}/{options['threads'] * options['ops']} "
+                f"за {elapsed:.2f} с, {done / elapsed:.0f} в с; \"database is locked\": {locked}"
+            )
+
+    def run(self, threads, ops):
+        books = ModelBooks.objects.bulk_create(
+            ModelBooks(title=f"Книга {i}", slug=f"contention-{i}") for i in range(ops)
+        )
+        users = User.objects.bulk_create(User(username=f"writer-{i}") for i in range(threads))
+        results = []
+        barrier = threading.Barrier(threads)
+
+        def writer(user):
+            done = locked = 0
+            barrier.wait()
+            try:
+                for i, book in enumerate(books):
+                    try:
+                        # Как правка в админке: чтение, затем запись в той же транзакции. Оценка и
+                        # аудиофайл обновляют одну строку книги (сводка, счётчики, time_update)
+                        with transaction.atomic():
+                            book = ModelBooks.objects.get(pk=book.pk)
+                            BookRating.objects.create(user=user, book=book, overall_score=5)
+                            AudioFile.objects.create(book=book, file=f"uploads/audio_files/{user.pk}-{i}.mp3")
+                        done += 1
+                    except OperationalError as error:
+                        if "locked" not in str(error):
+                            raise
+                        locked += 1
+            finally:
+                connections.close_all()
+            results.append((done, locked))
+
+        workers = [threading.Thread(target=writer, args=(user,)) for user in users]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+        return sum(done for done, _ in results), sum(locked for _, locked in results), elapsed
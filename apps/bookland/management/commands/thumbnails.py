@@ -0,0 +1,63 @@
+# D:\Python\myProject\Bookland\apps\bookland\management\commands\thumbnails.py
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from bookland.models import BookImage
+from bookland.thumbnails import build_derivatives, orphaned_derivatives, source_version
+
+
+def _build(args):
+    path, force = args
+    try:
+        created = build_derivatives(path, force)
+        return created, source_version(path), ''
+    except Exception as error:  # в т.ч. PIL.Image.DecompressionBombError
+        return 0, '', f"{path}: {error}"
+
+
+class Command(BaseCommand):
+    help = "Строит недостающие уменьшенные копии обложек и удаляет копии без оригинала"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Перестроить все копии")
+        parser.add_argument("--cleanup", action="store_true", help="Удалить копии, оригинал которых удалён")
+        parser.add_argument("--workers", type=int, default=None, help="Процессов в пуле (по умолчанию - все ядра)")
+
+    def handle(self, *args, **options):
+        images = [
+            (pk, default_storage.path(name))
+            for pk, name in BookImage.objects.exclude(image='').values_list('pk', 'image').iterator()
+        ]
+        images = [(pk, path) for pk, path in images if os.path.exists(path)]
+        jobs = [(path, options["force"]) for _, path in images]
+        workers = os.cpu_count() if options["workers"] is None else options["workers"]
+        if workers:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(_build, jobs, chunksize=8))
+        else:
+            results = list(map(_build, jobs))
+
+        for _, _, error in results:
+            if error:
+                self.stderr.write(error)
+        # Версии готовых копий - для thumbnail_url (в т.ч. изображений, загруженных до появления поля)
+        BookImage.objects.bulk_update(
+            [BookImage(pk=pk, thumbnail_version=version) for (pk, _), (_, version, _) in zip(images, results) if version],
+            ['thumbnail_version'], batch_size=500,
+        )
+        created = sum(count for count, _, _ in results)
+        self.stdout.write(f"Изображений: {len(images)}, создано копий: {created}")
+
+        if options["cleanup"]:
+            directory = BookImage._meta.get_field("image").upload_to
+            removed = 0
+            if default_storage.exists(directory):
+                for name in orphaned_derivatives(directory):
+                    default_storage.delete(name)
+                    removed += 1
+            self.stdout.write(f"Удалено копий без оригинала: {removed}")
+        self.stdout.write(self.style.SUCCESS("Готово"))
@@ -0,0 +1,192 @@
+# D:\Python\myProject\Bookland\apps\bookland\media.py
+
+'''Отдача загруженных файлов (аудио, обложки, торренты, доп. файлы) в production.
+
+В отличие от django.views.static.serve (только для отладки):
+- поддерживаются Range-запросы (206 Partial Content) - перемотка внутри M4B
+  не перекачивает файл с нуля;
+- ETag / Last-Modified и условные запросы (If-None-Match, If-Modified-Since,
+  If-Range) - повторный запрос неизменённого файла отвечает 304;
+- под WSGI тело отдаётся через FileResponse: сервер с wsgi.file_wrapper
+  (gunicorn, uWSGI) использует os.sendfile, без чтения файла в Python;
+- под ASGI представление асинхронное, файл читается блоками в пуле потоков
+  (asyncio.to_thread), а ожидание медленного клиента не занимает поток;
+- MEDIA_OFFLOAD в settings ('x-accel' для nginx, 'x-sendfile' для Apache/lighttpd)
+  передаёт отдачу веб-серверу: Django только проверяет путь и ставит заголовок.
+'''
+
+import asyncio
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+from .models import AudioFile, BookImage, TorrentFile, AdditionalFile
+
+MEDIA_BLOCK_SIZE = 64 * 1024
+MEDIA_MAX_AGE = 3600
+MEDIA_VERSIONED_MAX_AGE = 365 * 24 * 3600  # URL с ?v=... (bookland.thumbnails) не меняют содержимое
+
+_RANGE_RE = re.compile(r'bytes=(\d*)-(\d*)')
+
+
+FILE_FIELDS = ((AudioFile, 'file'), (BookImage, 'image'), (TorrentFile, 'file'), (AdditionalFile, 'file'))
+
+
+def media_directories():
+    ''' Каталоги upload_to файловых полей моделей - только из них разрешена отдача. '''
+    return tuple(model._meta.get_field(field).upload_to for model, field in FILE_FIELDS)
+
+
+class MediaFileResponse(FileResponse):
+    block_size = MEDIA_BLOCK_SIZE
+
+
+class FileRange:
+    ''' Часть открытого файла [start, start + length) для FileResponse.
+    fileno() оставлен, чтобы wsgi.file_wrapper мог отдать диапазон через sendfile
+    (позиция файла уже выставлена на start, длину ограничивает Content-Length).
+    '''
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+async def file_chunks(path, start, length):
+    ''' Асинхронная отдача части файла: чтение блоками в пуле потоков, между блоками -
+    ожидание клиента в цикле событий. При обрыве соединения файл закрывается (finally).
+    '''
+    file = await asyncio.to_thread(open, path, 'rb')
+    try:
+        await asyncio.to_thread(file.seek, start)
+        remaining = length
+        while remaining:
+            block = await asyncio.to_thread(file.read, min(MEDIA_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+    finally:
+        file.close()
+
+
+def etag_for(stat_result):
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def parse_range(header, size):
+    ''' (start, end) включительно для одного диапазона "bytes=..."; None - отдать файл целиком;
+    ValueError - диапазон вне файла (416). Несколько диапазонов не поддерживаются (отдаём целиком).
+    '''
+    match = _RANGE_RE.fullmatch(header.strip())
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':  # "bytes=-500" - последние 500 байт
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, end
+
+
+def _if_range_matches(request, etag, mtime):
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    date = parse_http_date_safe(if_range)
+    return date is not None and int(mtime) <= date
+
+
+async def serve_media(request, path):
+    path = posixpath.normpath(path).lstrip('/')  # "uploads/audio_files/../../x" -> "x"
+    if not path.startswith(media_directories()):
+        raise Http404("Файл не найден")
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat_result = await asyncio.to_thread(os.stat, full_path)
+    except (OSError, ValueError):  # ValueError - путь за пределами MEDIA_ROOT
+        raise Http404("Файл не найден")
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise Http404("Файл не найден")
+
+    offload = getattr(settings, 'MEDIA_OFFLOAD', None)
+    if offload:
+        response = HttpResponse(content_type=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+        if offload == 'x-accel':
+            response['X-Accel-Redirect'] = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/') + path
+        else:
+            response['X-Sendfile'] = full_path
+        return response
+
+    etag = etag_for(stat_result)
+    last_modified = http_date(stat_result.st_mtime)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(stat_result.st_mtime)
+    )
+    if response is None:
+        size = stat_result.st_size
+        try:
+            byte_range = parse_range(request.headers.get('Range', ''), size) if request.headers.get('Range') else None
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        if byte_range and not _if_range_matches(request, etag, stat_result.st_mtime):
+            byte_range = None
+
+        start, end = byte_range or (0, size - 1)
+        status = 206 if byte_range else 200
+        if isinstance(request, ASGIRequest):
+            response = StreamingHttpResponse(
+                file_chunks(full_path, start, end - start + 1), status=status,
+                content_type=mimetypes.guess_type(path)[0] or 'application/octet-stream',
+            )
+            response['Content-Disposition'] = content_disposition_header(False, os.path.basename(path))
+        else:
+            file = open(full_path, 'rb')
+            response = MediaFileResponse(FileRange(file, start, end - start + 1) if byte_range else file, status=status)
+        if byte_range:
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = last_modified
+    if 'v' in request.GET:
+        response['Cache-Control'] = f'public, max-age={MEDIA_VERSIONED_MAX_AGE}, immutable'
+    else:
+        response['Cache-Control'] = f'public, max-age={MEDIA_MAX_AGE}'
+    return response
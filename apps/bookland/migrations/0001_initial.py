@@ -0,0 +1,261 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:13
+
+from django.conf import settings
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdditionalFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(upload_to='uploads/extra_files/', validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['txt', 'fb2', 'pdf', 'zip', '7z', 'rar', 'zip'])], verbose_name='Дополнительный файл')),
+                ('file_type', models.CharField(blank=True, max_length=50, null=True, verbose_name='Тип файла')),
+            ],
+            options={
+                'verbose_name': 'Файлы',
+                'verbose_name_plural': 'Files',
+            },
+        ),
+        migrations.CreateModel(
+            name='AudioFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(upload_to='uploads/audio_files/', validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['mp3', 'm4b', 'aac', 'wav'])], verbose_name='Аудиофайл')),
+                ('order', models.PositiveIntegerField(default=0, verbose_name='№ файла')),
+                ('duration', models.DurationField(blank=True, null=True, verbose_name='Длительность')),
+            ],
+            options={
+                'verbose_name': 'Аудиофайл',
+                'verbose_name_plural': 'Files-Audio',
+                'ordering': ['order'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Author',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('surname_nick', models.CharField(max_length=60, verbose_name='Фамилия (nick)')),
+                ('name', models.CharField(blank=True, max_length=60, verbose_name='Имя')),
+                ('patronymic', models.CharField(blank=True, max_length=60, verbose_name='Отчество')),
+                ('slug', models.SlugField(max_length=60, unique=True, verbose_name='URL')),
+                ('description', models.TextField(blank=True, null=True, verbose_name='Описание')),
+            ],
+            options={
+                'verbose_name': 'Автор',
+                'verbose_name_plural': 'Авторы',
+            },
+        ),
+        migrations.CreateModel(
+            name='BookImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.ImageField(upload_to='uploads/book_images/', validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png'])], verbose_name='Изображение')),
+            ],
+            options={
+                'verbose_name': 'Изображение книги',
+                'verbose_name_plural': 'Files-Picture',
+            },
+        ),
+        migrations.CreateModel(
+            name='BookRating',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('overall_score', models.PositiveSmallIntegerField(default=0, verbose_name='Общая оценка')),
+                ('narration_score', models.PositiveSmallIntegerField(default=0, verbose_name='Озвучка')),
+                ('quality_score', models.PositiveSmallIntegerField(default=0, verbose_name='Качество записи')),
+                ('plot_score', models.PositiveSmallIntegerField(default=0, verbose_name='Сюжет и содержание')),
+                ('length_feedback', models.CharField(choices=[('too_short', 'Слишком короткая'), ('perfect', 'Подходит по длине'), ('too_long', 'Слишком длинная')], default='perfect', max_length=100, verbose_name='Продолжительность')),
+                ('would_recommend', models.BooleanField(default=False, verbose_name='Рекомендуете?')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Cycle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=60, unique=True, verbose_name='Имя')),
+                ('slug', models.SlugField(max_length=60, unique=True, verbose_name='URL')),
+                ('description', models.TextField(blank=True, null=True, verbose_name='Описание цикла (серии)')),
+            ],
+            options={
+                'verbose_name': 'Цикл (серия)',
+                'verbose_name_plural': 'Циклы (серии)',
+            },
+        ),
+        migrations.CreateModel(
+            name='ModelBooks',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(db_index=True, max_length=200, verbose_name='Название аудиокниги')),
+                ('slug', models.SlugField(blank=True, max_length=120, unique=True, verbose_name='URL')),
+                ('work_type', models.CharField(choices=[('short-story', 'Рассказ'), ('story', 'Повесть'), ('novel', 'Роман'), ('cycle', 'Цикл книг'), ('poem', 'Стихотворение')], default='novel', max_length=15, verbose_name='Тип произведения')),
+                ('cycle_number', models.CharField(blank=True, max_length=10, null=True, verbose_name='Номер в цикле')),
+                ('year', models.IntegerField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(1800), django.core.validators.MaxValueValidator(2026)], verbose_name='Год')),
+                ('time_create', models.DateTimeField(auto_now_add=True, verbose_name='Время создания')),
+                ('time_update', models.DateTimeField(auto_now=True, verbose_name='Время изменения')),
+                ('duration', models.DurationField(blank=True, null=True, verbose_name='Продолжительность')),
+                ('description', models.TextField(blank=True, null=True, verbose_name='Описание')),
+                ('is_published', models.BooleanField(default=True, verbose_name='Публикация')),
+                ('total_torrent_files', models.PositiveIntegerField(default=0, editable=False, verbose_name='Торрентов')),
+                ('total_audio_files', models.PositiveIntegerField(default=0, editable=False, verbose_name='Аудиофайлов')),
+                ('total_images', models.PositiveIntegerField(default=0, editable=False, verbose_name='Изображений')),
+                ('total_files', models.PositiveIntegerField(default=0, editable=False, verbose_name='Файлов')),
+            ],
+            options={
+                'verbose_name': 'Аудиокнига',
+                'verbose_name_plural': 'Аудиокниги',
+                'ordering': ['-year', 'title'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ModelCategories',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(db_index=True, max_length=50, verbose_name='Жанр')),
+                ('slug', models.SlugField(unique=True, verbose_name='URL')),
+                ('description', models.TextField(blank=True, null=True, verbose_name='Описание')),
+            ],
+            options={
+                'verbose_name': 'Жанр',
+                'verbose_name_plural': 'Жанры',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ModelSubcategories',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(db_index=True, max_length=40, verbose_name='Поджанр')),
+                ('slug', models.SlugField(max_length=60, unique=True, verbose_name='URL')),
+                ('description', models.TextField(blank=True, null=True, verbose_name='Описание')),
+            ],
+            options={
+                'verbose_name': 'Поджанр',
+                'verbose_name_plural': 'Поджанры',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Reader',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('surname_nick', models.CharField(max_length=60, verbose_name='Фамилия (nick)')),
+                ('name', models.CharField(blank=True, max_length=60, verbose_name='Имя')),
+                ('patronymic', models.CharField(blank=True, max_length=60, verbose_name='Отчество')),
+                ('slug', models.SlugField(max_length=60, unique=True, verbose_name='URL')),
+                ('description', models.TextField(blank=True, null=True, verbose_name='Описание')),
+            ],
+            options={
+                'verbose_name': 'Чтец',
+                'verbose_name_plural': 'Чтецы',
+            },
+        ),
+        migrations.CreateModel(
+            name='SocialMediaPlatform',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Платформа')),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='TorrentFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(upload_to='uploads/torrents/', validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['torrent'])], verbose_name='Торрент-файл')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='torrent_files', to='bookland.modelbooks')),
+                ('reader', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='torrent_files', to='bookland.reader')),
+            ],
+            options={
+                'verbose_name': 'Торрент-файл',
+                'verbose_name_plural': 'Files-Torrent',
+            },
+        ),
+        migrations.CreateModel(
+            name='SocialMediaLink',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(verbose_name='Ссылка на пост/контент')),
+                ('description', models.TextField(blank=True, verbose_name='Описание поста (анонс, хештеги и т.д.)')),
+                ('post_date', models.DateField(blank=True, null=True, verbose_name='Дата публикации')),
+                ('video_url', models.URLField(blank=True, null=True, verbose_name='Ссылка на видео (если есть)')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='social_media_links', to='bookland.modelbooks', verbose_name='Книга')),
+                ('platform', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bookland.socialmediaplatform', verbose_name='Платформа')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='reader',
+            index=models.Index(fields=['surname_nick', 'name'], name='bookland_re_surname_a533f3_idx'),
+        ),
+        migrations.AddField(
+            model_name='modelsubcategories',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subcategories', to='bookland.modelcategories', verbose_name='Жанр'),
+        ),
+        migrations.AddField(
+            model_name='modelbooks',
+            name='authors',
+            field=models.ManyToManyField(blank=True, to='bookland.author', verbose_name='Авторы'),
+        ),
+        migrations.AddField(
+            model_name='modelbooks',
+            name='book_subcategories',
+            field=models.ManyToManyField(blank=True, to='bookland.modelsubcategories', verbose_name='Жанры'),
+        ),
+        migrations.AddField(
+            model_name='modelbooks',
+            name='cycle',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='bookland.cycle', verbose_name='Цикл'),
+        ),
+        migrations.AddField(
+            model_name='modelbooks',
+            name='readers',
+            field=models.ManyToManyField(blank=True, related_name='books', to='bookland.reader', verbose_name='Чтецы'),
+        ),
+        migrations.AddField(
+            model_name='bookrating',
+            name='book',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ratings', to='bookland.modelbooks'),
+        ),
+        migrations.AddField(
+            model_name='bookrating',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ratings', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='bookimage',
+            name='book',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='book_images_set', to='bookland.modelbooks', verbose_name='Книга'),
+        ),
+        migrations.AddIndex(
+            model_name='author',
+            index=models.Index(fields=['surname_nick', 'name'], name='bookland_au_surname_7a6f05_idx'),
+        ),
+        migrations.AddField(
+            model_name='audiofile',
+            name='book',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='audio_files', to='bookland.modelbooks', verbose_name='Аудиокнига'),
+        ),
+        migrations.AddField(
+            model_name='additionalfile',
+            name='book',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='additional_files_set', to='bookland.modelbooks', verbose_name='Аудиокнига'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='bookrating',
+            unique_together={('user', 'book')},
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:14
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+CRITERIA = ('overall', 'narration', 'quality', 'plot')
+LENGTH_FIELDS = {'too_short': 'too_short_count', 'perfect': 'perfect_count', 'too_long': 'too_long_count'}
+BAYES_PRIOR_MEAN = 3.0
+BAYES_PRIOR_WEIGHT = 10
+
+
+def build_summaries(apps, schema_editor):
+    ''' Сводки для уже выставленных оценок (как BookRatingSummary.rebuild на момент миграции). '''
+    BookRating = apps.get_model('bookland', 'BookRating')
+    BookRatingSummary = apps.get_model('bookland', 'BookRatingSummary')
+    aggregates = {
+        'ratings_count': models.Count('pk'),
+        'recommend_count': models.Count('pk', filter=models.Q(would_recommend=True)),
+    }
+    for criterion in CRITERIA:
+        aggregates[f"{criterion}_votes"] = models.Count('pk', filter=models.Q(**{f"{criterion}_score__gt": 0}))
+        aggregates[f"{criterion}_sum"] = Coalesce(models.Sum(f"{criterion}_score"), 0)
+    for feedback, length_field in LENGTH_FIELDS.items():
+        aggregates[length_field] = models.Count('pk', filter=models.Q(length_feedback=feedback))
+
+    summaries = []
+    for row in BookRating.objects.order_by().values('book').annotate(**aggregates):
+        summary = BookRatingSummary(book_id=row.pop('book'), **row)
+        for criterion in CRITERIA:
+            votes = row[f"{criterion}_votes"]
+            setattr(summary, f"{criterion}_mean", row[f"{criterion}_sum"] / votes if votes else 0)
+        summary.recommend_ratio = row['recommend_count'] / row['ratings_count']
+        summary.bayesian_score = (
+            (BAYES_PRIOR_WEIGHT * BAYES_PRIOR_MEAN + row['overall_sum']) / (BAYES_PRIOR_WEIGHT + row['overall_votes'])
+        )
+        summaries.append(summary)
+    BookRatingSummary.objects.bulk_create(summaries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookland', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookRatingSummary',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_summary', serialize=False, to='bookland.modelbooks', verbose_name='Книга')),
+                ('ratings_count', models.PositiveIntegerField(default=0, verbose_name='Оценок')),
+                ('overall_votes', models.PositiveIntegerField(default=0)),
+                ('overall_sum', models.PositiveIntegerField(default=0)),
+                ('overall_mean', models.FloatField(default=0, verbose_name='Общая оценка')),
+                ('narration_votes', models.PositiveIntegerField(default=0)),
+                ('narration_sum', models.PositiveIntegerField(default=0)),
+                ('narration_mean', models.FloatField(default=0, verbose_name='Озвучка')),
+                ('quality_votes', models.PositiveIntegerField(default=0)),
+                ('quality_sum', models.PositiveIntegerField(default=0)),
+                ('quality_mean', models.FloatField(default=0, verbose_name='Качество записи')),
+                ('plot_votes', models.PositiveIntegerField(default=0)),
+                ('plot_sum', models.PositiveIntegerField(default=0)),
+                ('plot_mean', models.FloatField(default=0, verbose_name='Сюжет и содержание')),
+                ('too_short_count', models.PositiveIntegerField(default=0, verbose_name='Слишком короткая')),
+                ('perfect_count', models.PositiveIntegerField(default=0, verbose_name='Подходит по длине')),
+                ('too_long_count', models.PositiveIntegerField(default=0, verbose_name='Слишком длинная')),
+                ('recommend_count', models.PositiveIntegerField(default=0, verbose_name='Рекомендуют')),
+                ('recommend_ratio', models.FloatField(default=0, verbose_name='Доля рекомендаций')),
+                ('bayesian_score', models.FloatField(db_index=True, default=3.0, verbose_name='Рейтинг')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг книги',
+                'verbose_name_plural': 'Рейтинги книг',
+            },
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookland', '0002_bookratingsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkedUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('audio', 'Аудиофайл'), ('torrent', 'Торрент-файл'), ('additional', 'Дополнительный файл')], max_length=15, verbose_name='Тип файла')),
+                ('filename', models.CharField(max_length=255, verbose_name='Имя файла')),
+                ('size', models.BigIntegerField(verbose_name='Размер')),
+                ('offset', models.BigIntegerField(default=0, verbose_name='Получено байт')),
+                ('sha256', models.CharField(blank=True, max_length=64, verbose_name='SHA-256')),
+                ('status', models.CharField(choices=[('active', 'Загружается'), ('complete', 'Завершена')], default='active', max_length=10, verbose_name='Статус')),
+                ('object_id', models.BigIntegerField(blank=True, null=True, verbose_name='id созданного файла')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunked_uploads', to='bookland.modelbooks', verbose_name='Книга')),
+                ('reader', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='bookland.reader', verbose_name='Чтец')),
+            ],
+            options={
+                'verbose_name': 'Загрузка частями',
+                'verbose_name_plural': 'Загрузки частями',
+            },
+        ),
+    ]
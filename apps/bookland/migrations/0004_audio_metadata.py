@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookland', '0003_chunkedupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='audiofile',
+            name='bitrate',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Битрейт, кбит/с'),
+        ),
+        migrations.AddField(
+            model_name='audiofile',
+            name='codec',
+            field=models.CharField(blank=True, max_length=10, verbose_name='Кодек'),
+        ),
+        migrations.CreateModel(
+            name='AudioMetadataJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Обрабатывается'), ('done', 'Готово'), ('failed', 'Ошибка')], db_index=True, default='pending', max_length=10, verbose_name='Статус')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('audio_file', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='metadata_job', to='bookland.audiofile')),
+            ],
+            options={
+                'verbose_name': 'Задание метаданных аудио',
+                'verbose_name_plural': 'Задания метаданных аудио',
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookland', '0004_audio_metadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookFileNaming',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='file_naming', serialize=False, to='bookland.modelbooks')),
+                ('prefix', models.CharField(blank=True, max_length=255)),
+                ('audio_sequence', models.PositiveIntegerField(default=0)),
+                ('image_sequence', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Имена файлов книги',
+                'verbose_name_plural': 'Имена файлов книг',
+            },
+        ),
+    ]
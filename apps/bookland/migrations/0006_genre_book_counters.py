@@ -0,0 +1,51 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:14
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def recount_genre_books(apps, schema_editor):
+    ''' Счётчики книг для уже связанных с жанрами книг (как manage.py recount_genres). '''
+    Links = apps.get_model('bookland', 'ModelBooks').book_subcategories.through
+    for model_name, genre_field in (
+        ('ModelSubcategories', 'modelsubcategories'), ('ModelCategories', 'modelsubcategories__category'),
+    ):
+        def books(**filters):
+            links = Links.objects.filter(**{genre_field: models.OuterRef('pk')}, **filters)
+            counts = links.order_by().values(genre_field).annotate(total=models.Count('modelbooks', distinct=True))
+            return Coalesce(models.Subquery(counts.values('total')), 0)
+
+        apps.get_model('bookland', model_name).objects.update(
+            total_books=books(), published_books=books(modelbooks__is_published=True)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookland', '0005_bookfilenaming'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='modelcategories',
+            name='published_books',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Опубликовано книг'),
+        ),
+        migrations.AddField(
+            model_name='modelcategories',
+            name='total_books',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Книг'),
+        ),
+        migrations.AddField(
+            model_name='modelsubcategories',
+            name='published_books',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Опубликовано книг'),
+        ),
+        migrations.AddField(
+            model_name='modelsubcategories',
+            name='total_books',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Книг'),
+        ),
+        migrations.RunPython(recount_genre_books, migrations.RunPython.noop),
+    ]
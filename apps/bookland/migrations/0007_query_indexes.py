@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookland', '0006_genre_book_counters'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='audiofile',
+            name='book',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='audio_files', to='bookland.modelbooks', verbose_name='Аудиокнига'),
+        ),
+        migrations.AlterField(
+            model_name='bookrating',
+            name='book',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='ratings', to='bookland.modelbooks'),
+        ),
+        migrations.AlterField(
+            model_name='modelbooks',
+            name='cycle',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='bookland.cycle', verbose_name='Цикл'),
+        ),
+        migrations.AddIndex(
+            model_name='audiofile',
+            index=models.Index(fields=['book', 'order'], name='audiofile_book_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookrating',
+            index=models.Index(fields=['book', 'created_at'], name='rating_book_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='modelbooks',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['-year', 'title', 'id'], name='book_published_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='modelbooks',
+            index=models.Index(fields=['cycle', 'cycle_number', 'title', '-id'], name='book_cycle_order_idx'),
+        ),
+    ]
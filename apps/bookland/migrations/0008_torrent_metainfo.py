@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookland', '0007_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='torrentfile',
+            name='files',
+            field=models.JSONField(blank=True, default=list, editable=False, verbose_name='Файлы раздачи'),
+        ),
+        migrations.AddField(
+            model_name='torrentfile',
+            name='info_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=40, verbose_name='Info-hash'),
+        ),
+        migrations.AddField(
+            model_name='torrentfile',
+            name='piece_count',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Кусков'),
+        ),
+        migrations.AddField(
+            model_name='torrentfile',
+            name='piece_length',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Размер куска'),
+        ),
+        migrations.AddField(
+            model_name='torrentfile',
+            name='torrent_name',
+            field=models.CharField(blank=True, editable=False, max_length=255, verbose_name='Имя раздачи'),
+        ),
+        migrations.AddField(
+            model_name='torrentfile',
+            name='total_size',
+            field=models.BigIntegerField(blank=True, editable=False, null=True, verbose_name='Размер раздачи, байт'),
+        ),
+    ]
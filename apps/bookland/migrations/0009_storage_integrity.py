@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookland', '0008_torrent_metainfo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StorageDirectory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=255, unique=True)),
+                ('mtime_ns', models.BigIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=255, unique=True, verbose_name='Путь')),
+                ('size', models.BigIntegerField(blank=True, null=True, verbose_name='Размер, байт')),
+                ('mtime', models.DateTimeField(blank=True, null=True, verbose_name='Изменён')),
+                ('exists', models.BooleanField(default=True, verbose_name='Есть на диске')),
+                ('referenced', models.BooleanField(default=False, verbose_name='Есть запись')),
+                ('checked_at', models.DateTimeField(verbose_name='Проверен')),
+            ],
+            options={
+                'verbose_name': 'Файл хранилища',
+                'verbose_name_plural': 'Файлы хранилища',
+                'indexes': [models.Index(fields=['exists', 'referenced'], name='storedfile_state_idx')],
+            },
+        ),
+    ]
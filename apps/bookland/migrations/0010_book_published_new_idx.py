@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookland', '0009_storage_integrity'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='modelbooks',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['-time_create', '-id'], name='book_published_new_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookland', '0010_book_published_new_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunkedupload',
+            name='writing_until',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookland', '0012_sitemapshard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='audiometadatajob',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Взято в работу'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookland', '0013_audiometadatajob_claimed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookimage',
+            name='thumbnail_version',
+            field=models.CharField(blank=True, editable=False, max_length=12),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookland', '0014_bookimage_thumbnail_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chunkedupload',
+            name='status',
+            field=models.CharField(choices=[('active', 'Загружается'), ('finishing', 'Завершается'), ('complete', 'Завершена')], default='active', max_length=10, verbose_name='Статус'),
+        ),
+    ]
@@ -1,14 +1,19 @@
 # D:\Python\django\myLibrary\app\literon\models.py
 
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Cast, Coalesce, NullIf
 from django.core.exceptions import ValidationError
 from django.urls import reverse
 from django.core.validators import MaxValueValidator, MinValueValidator, FileExtensionValidator
 from datetime import datetime
-from django.template.defaultfilters import slugify
-from django.utils.text import slugify
-from .utilities import translit_re, generate_file_name  # моя функция транслитерации
+import uuid
+import base64
+import binascii
+from .torrent_meta import read_torrent
+from .utilities import (  # моя функция транслитерации
+    translit_re, generate_file_name, book_base_slug, build_file_name_prefix, natural_key,
+)
 
 
 class ModelCategories(models.Model):
@@ -19,6 +24,9 @@ class ModelCategories(models.Model):
         null=True,
         verbose_name="Описание"
     )
+    # Счётчики книг жанра (без повторов по поджанрам) - обновляются сигналами (bookland.signals)
+    total_books = models.PositiveIntegerField(default=0, editable=False, verbose_name="Книг")
+    published_books = models.PositiveIntegerField(default=0, editable=False, verbose_name="Опубликовано книг")
 
     def save(self, *args, **kwargs):
         # Генерация уникального слага
@@ -26,14 +34,36 @@ class ModelCategories(models.Model):
         super().save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
-        # Проверяем, есть ли подкатегории и книги, связанные с категорией
+        # Проверяем, есть ли подкатегории и книги, связанные с категорией (по счётчикам поджанров)
+        busy = self.subcategories.filter(total_books__gt=0).values_list('name', flat=True).first()
+        if busy is not None:
+            raise ValidationError(f"Нельзя удалить категорию '{self.name}', так как её подкатегория '{busy}' связана с книгами.")
         if self.subcategories.exists():  # subcategories - related_name для ForeignKey в ModelSubcategories
-            for subcategory in self.subcategories.all():
-                if subcategory.books.exists():  # books - related_name для ManyToManyField в ModelBooks
-                    raise ValidationError(f"Нельзя удалить категорию '{self.name}', так как её подкатегория '{subcategory.name}' связана с книгами.")
             raise ValidationError(f"Нельзя удалить категорию '{self.name}', так как с ней связаны подкатегории.")
         super().delete(*args, **kwargs)
 
+    @classmethod
+    def recount_books(cls, queryset=None):
+        ''' Пересчёт счётчиков книг жанров одним UPDATE (по умолчанию - для всех). '''
+        return _recount_genre_books(cls.objects.all() if queryset is None else queryset, 'modelsubcategories__category')
+
+    @classmethod
+    def tree(cls):
+        ''' Дерево жанров для навигации одним запросом (LEFT JOIN поджанров):
+        [{'slug', 'name', 'books_count', 'subcategories': [{'slug', 'name', 'books_count'}]}],
+        books_count - опубликованные книги.
+        '''
+        rows = cls.objects.order_by('name', 'subcategories__name').values_list(
+            'pk', 'slug', 'name', 'published_books',
+            'subcategories__slug', 'subcategories__name', 'subcategories__published_books',
+        )
+        tree = {}
+        for pk, slug, name, books, sub_slug, sub_name, sub_books in rows:
+            category = tree.setdefault(pk, {'slug': slug, 'name': name, 'books_count': books, 'subcategories': []})
+            if sub_slug is not None:
+                category['subcategories'].append({'slug': sub_slug, 'name': sub_name, 'books_count': sub_books})
+        return list(tree.values())
+
     def __str__(self):
         return f"{self.name}"
 
@@ -62,6 +92,9 @@ class ModelSubcategories(models.Model):
         null=True,
         verbose_name="Описание"
     )
+    # Счётчики книг поджанра - обновляются сигналами (bookland.signals)
+    total_books = models.PositiveIntegerField(default=0, editable=False, verbose_name="Книг")
+    published_books = models.PositiveIntegerField(default=0, editable=False, verbose_name="Опубликовано книг")
 
     def save(self, *args, **kwargs):
         # Генерация уникального слага
@@ -69,11 +102,16 @@ class ModelSubcategories(models.Model):
         super().save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
-        # Проверяем, есть ли книги, связанные с подкатегорией
-        if self.books.exists():  # books - related_name для связи many-to-many с ModelBooks
+        # Проверяем, есть ли книги, связанные с подкатегорией (счётчик читается из базы - экземпляр мог устареть)
+        if type(self).objects.filter(pk=self.pk, total_books__gt=0).exists():
             raise ValidationError("Нельзя удалить подкатегорию, так как с ней связаны книги.")
         super().delete(*args, **kwargs)
 
+    @classmethod
+    def recount_books(cls, queryset=None):
+        ''' Пересчёт счётчиков книг поджанров одним UPDATE (по умолчанию - для всех). '''
+        return _recount_genre_books(cls.objects.all() if queryset is None else queryset, 'modelsubcategories')
+
     def __str__(self):
         return f"{self.name}"
 
@@ -177,6 +215,46 @@ class Cycle(models.Model):
         verbose_name_plural = "Циклы (серии)"
 
 
+def _count_subquery(model):
+    ''' Подзапрос COUNT(*) файлов модели model для книги из внешнего запроса. '''
+    counts = model.objects.filter(book=models.OuterRef('pk')).order_by().values('book')
+    return Coalesce(
+        models.Subquery(counts.annotate(total=models.Count('pk')).values('total')),
+        0,
+    )
+
+
+def _recount_genre_books(queryset, genre_field):
+    ''' UPDATE счётчиков total_books/published_books жанров или поджанров queryset.
+    genre_field - путь от связи книга-поджанр к модели queryset; книга, попавшая в
+    жанр через несколько поджанров, считается один раз.
+    '''
+    def books(**filters):
+        links = ModelBooks.book_subcategories.through.objects.filter(**{genre_field: models.OuterRef('pk')}, **filters)
+        counts = links.order_by().values(genre_field).annotate(total=models.Count('modelbooks', distinct=True))
+        return Coalesce(models.Subquery(counts.values('total')), 0)
+
+    return queryset.update(total_books=books(), published_books=books(modelbooks__is_published=True))
+
+
+class GroupConcat(models.Aggregate):
+    ''' GROUP_CONCAT(... , ', ') для SQLite - склейка строк группы через запятую. '''
+    function = 'GROUP_CONCAT'
+    template = "%(function)s(%(expressions)s, ', ')"
+    output_field = models.CharField()
+
+
+class ModelBooksQuerySet(models.QuerySet):
+    def with_authors_str(self):
+        ''' Аннотирует книги строкой фамилий авторов для __str__ (без запроса на каждую книгу). '''
+        surnames = (
+            Author.objects.filter(modelbooks=models.OuterRef('pk'))
+            .order_by().values('modelbooks')
+            .annotate(joined=GroupConcat('surname_nick')).values('joined')
+        )
+        return self.annotate(authors_str=Coalesce(models.Subquery(surnames), models.Value('')))
+
+
 class ModelBooks(models.Model):
     WORK_TYPES = [
         ('short-story', 'Рассказ'),
@@ -208,6 +286,7 @@ class ModelBooks(models.Model):
         on_delete=models.SET_NULL,
         blank=True,
         null=True,
+        db_index=False,  # поиск по циклу - по индексу book_cycle_order_idx
         verbose_name="Цикл"
     )
     cycle_number = models.CharField(max_length=10, blank=True, null=True, verbose_name='Номер в цикле')
@@ -229,19 +308,91 @@ class ModelBooks(models.Model):
     total_images = models.PositiveIntegerField(default=0, editable=False, verbose_name="Изображений")
     total_files = models.PositiveIntegerField(default=0, editable=False, verbose_name="Файлов")
 
+    objects = ModelBooksQuerySet.as_manager()
+
+    COUNTER_FIELDS = ('total_torrent_files', 'total_audio_files', 'total_images', 'total_files')
+    SLUG_PREFIX_BATCH = 200  # Префиксов в одном запросе подбора слагов (лимит глубины выражений SQLite)
+
     class Meta:
         verbose_name = "Аудиокнига"
         verbose_name_plural = "Аудиокниги"
         ordering = ["-year", "title"]
-
-    def update_counters(self):
-        self.total_torrent_files = self.torrent_files.count()  # Используем related_name
-        self.total_audio_files = self.audio_files.count()  # Используем related_name
-        self.total_images = self.book_images_set.count()  # Используем related_name
-        self.total_files = self.additional_files_set.count()  # Используем related_name
+        indexes = [
+            # Каталог и API: опубликованные книги в порядке (-year, title, id) - без сортировки и без черновиков
+            models.Index(
+                fields=['-year', 'title', 'id'], condition=models.Q(is_published=True), name='book_published_order_idx'
+            ),
+            # Список в админке: ordering (cycle, cycle_number, title) и -pk от ChangeList; заменяет индекс cycle_id
+            models.Index(fields=['cycle', 'cycle_number', 'title', '-id'], name='book_cycle_order_idx'),
+            # Лента новых книг (bookland.feeds): последние опубликованные по времени добавления
+            models.Index(
+                fields=['-time_create', '-id'], condition=models.Q(is_published=True), name='book_published_new_idx'
+            ),
+        ]
+
+    @classmethod
+    def allocate_slugs(cls, base_slugs, exclude_pk=None):
+        ''' Подбор уникальных слагов для списка базовых слагов (в том же порядке).
+        Вместо запроса на каждую коллизию занятые слаги с нужными префиксами
+        выбираются одним запросом (по SLUG_PREFIX_BATCH префиксов), дальше подбор
+        "base", "base-1", "base-2"... идёт в памяти, в т.ч. между книгами одной пачки.
+        '''
+        prefixes = sorted(set(base_slugs))
+        taken = set()
+        for i in range(0, len(prefixes), cls.SLUG_PREFIX_BATCH):
+            query = models.Q()
+            for base in prefixes[i:i + cls.SLUG_PREFIX_BATCH]:
+                query |= models.Q(slug=base) | models.Q(slug__startswith=f"{base}-")
+            queryset = cls.objects.filter(query)
+            if exclude_pk is not None:
+                queryset = queryset.exclude(pk=exclude_pk)
+            taken.update(queryset.values_list('slug', flat=True))
+
+        slugs = []
+        next_n = {}
+        for base in base_slugs:
+            slug = base
+            n = next_n.get(base, 1)
+            while slug in taken:
+                slug = f"{base}-{n}"
+                n += 1
+            next_n[base] = n
+            taken.add(slug)
+            slugs.append(slug)
+        return slugs
+
+    @classmethod
+    def counter_drift(cls):
+        ''' Книги, у которых сохранённые счётчики файлов разошлись с фактическими.
+        Фактические значения считаются одним запросом (коррелированные подзапросы COUNT).
+        '''
+        annotations = {f"actual_{field}": _count_subquery(model) for model, field in cls.counter_models()}
+        drift = models.Q()
+        for _, field in cls.counter_models():
+            drift |= ~models.Q(**{field: models.F(f"actual_{field}")})
+        return cls.objects.annotate(**annotations).filter(drift)
+
+    @classmethod
+    def recount_counters(cls, queryset=None):
+        ''' Пересчёт счётчиков файлов одним UPDATE (по умолчанию - для всех книг). '''
+        queryset = cls.objects.all() if queryset is None else queryset
+        return queryset.update(**{field: _count_subquery(model) for model, field in cls.counter_models()})
+
+    @staticmethod
+    def counter_models():
+        ''' Пары (модель файлов, поле-счётчик в ModelBooks). '''
+        return (
+            (TorrentFile, 'total_torrent_files'),
+            (AudioFile, 'total_audio_files'),
+            (BookImage, 'total_images'),
+            (AdditionalFile, 'total_files'),
+        )
 
     def __str__(self):
-        authors_str = ", ".join(author.surname_nick for author in self.authors.all())
+        # authors_str приходит аннотацией (ModelBooks.objects.with_authors_str()), иначе - запрос авторов
+        authors_str = getattr(self, 'authors_str', None)
+        if authors_str is None:
+            authors_str = ", ".join(author.surname_nick for author in self.authors.all())
         return f"{self.title} | {authors_str}"
 
     def get_absolute_url(self):
@@ -250,31 +401,41 @@ class ModelBooks(models.Model):
     '''Что делает метод save:
 - Проверяет и устанавливает слаг, если он не задан.
 - Обнуляет поля cycle и cycle_number, если work_type не является циклом.
-- Вызывает update_counters для обновления количества файлов.
 - Валидирует данные с помощью full_clean().
 - Сохраняет объект.'''
     def save(self, *args, **kwargs):
         if not self.slug:
-            base_slug = slugify(self.title)
-            slug = base_slug
-            n = 1
-            while ModelBooks.objects.filter(slug=slug).exists():
-                slug = f"{base_slug}-{n}"
-                n += 1
-            self.slug = slug
+            self.slug = ModelBooks.allocate_slugs([book_base_slug(self.title)], exclude_pk=self.pk)[0]
 
         if self.work_type != 'cycle':
             self.cycle = None
             self.cycle_number = None
 
         self.full_clean()
+        # Счётчики файлов ведут сигналы (bookland.signals) атомарными UPDATE,
+        # поэтому при обновлении книги их значения из памяти в БД не пишем
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
         super().save(*args, **kwargs)
 
-        self.update_counters()
-        super().save(update_fields=['total_torrent_files', 'total_audio_files', 'total_images', 'total_files'])
+    def file_name_prefix(self):
+        ''' Общая часть имён файлов книги (кэшируется в BookFileNaming.prefix). '''
+        cycle = self.cycle if self.work_type == 'cycle' and self.cycle_id else None
+        return build_file_name_prefix(
+            self.slug, [author.slug for author in self.authors.all()],
+            cycle.slug if cycle else None, self.cycle_number,
+        )
 
     def get_average_rating(self):
-        pass
+        ''' Средняя общая оценка (из BookRatingSummary) или None, если оценок нет. '''
+        try:
+            summary = self.rating_summary
+        except BookRatingSummary.DoesNotExist:
+            return None
+        return summary.overall_mean if summary.overall_votes else None
 
     def formatted_duration(self):
         if not self.duration:
@@ -285,7 +446,86 @@ class ModelBooks(models.Model):
         return f'{hours:02}:{minutes:02}:{seconds:02}'
 
 
+class BookFileNaming(models.Model):
+    ''' Кэш префикса имён файлов книги и счётчики номеров её аудиофайлов и изображений.
+    Номер выдаётся атомарным UPDATE ... SET sequence = sequence + n, поэтому
+    параллельные загрузки в одну книгу получают разные имена. Префикс
+    сбрасывается (bookland.signals) при смене слага, цикла или авторов книги.
+    '''
+    book = models.OneToOneField(
+        ModelBooks, on_delete=models.CASCADE, primary_key=True, related_name='file_naming'
+    )
+    prefix = models.CharField(max_length=255, blank=True)  # '' - пересчитать при следующей выдаче имени
+    audio_sequence = models.PositiveIntegerField(default=0)
+    image_sequence = models.PositiveIntegerField(default=0)
+
+    SEQUENCE_FIELDS = {'audio': 'audio_sequence', 'image': 'image_sequence'}
+
+    class Meta:
+        verbose_name = "Имена файлов книги"
+        verbose_name_plural = "Имена файлов книг"
+
+    @classmethod
+    def allocate(cls, book, file_type, count=1):
+        ''' Резервирует count номеров для файлов file_type ('audio', 'image') книги.
+        Возвращает (префикс имён, первый номер); для остальных типов номер - None.
+        '''
+        field = cls.SEQUENCE_FIELDS.get(file_type)
+        rows = cls.objects.filter(pk=book.pk)
+        with transaction.atomic():
+            if field and not rows.update(**{field: models.F(field) + count}):
+                cls._seed(book)
+                rows.update(**{field: models.F(field) + count})
+            naming = rows.first()
+            if naming is None:
+                naming = cls._seed(book)
+            if not naming.prefix:
+                naming.prefix = book.file_name_prefix()
+                rows.update(prefix=naming.prefix)
+        return naming.prefix, getattr(naming, field) - count + 1 if field else None
+
+    @classmethod
+    def _seed(cls, book):
+        ''' Строка счётчиков для книги: нумерация продолжает уже загруженные файлы. '''
+        audio = book.audio_files.aggregate(count=models.Count('pk'), last=models.Max('order'))
+        naming = cls(
+            book_id=book.pk,
+            audio_sequence=max(audio['count'], audio['last'] or 0),
+            image_sequence=book.book_images_set.count(),
+        )
+        # Строку мог создать параллельный запрос - тогда остаётся его строка
+        cls.objects.bulk_create([naming], ignore_conflicts=True)
+        return naming
+
+    @classmethod
+    def invalidate(cls, books):
+        ''' Сбрасывает кэш префикса для книг books (queryset или список id). '''
+        return cls.objects.filter(book__in=books).exclude(prefix='').update(prefix='')
+
+    def __str__(self):
+        return f"{self.book_id}: {self.prefix}"
+
+
 # Модель для торрент-файлов
+class TorrentFileQuerySet(models.QuerySet):
+    def by_info_hash(self, info_hash):
+        ''' Торренты с info-hash: 40 hex-символов или 32 символа base32 (как в magnet-ссылках). '''
+        info_hash = info_hash.strip()
+        if len(info_hash) == 32:
+            try:
+                info_hash = base64.b32decode(info_hash.upper()).hex()
+            except binascii.Error:
+                return self.none()
+        return self.filter(info_hash=info_hash.lower())
+
+    def duplicates(self):
+        ''' Info-hash, загруженные больше одного раза: [(info_hash, количество)]. '''
+        return (
+            self.exclude(info_hash='').order_by().values('info_hash')
+            .annotate(count=models.Count('pk')).filter(count__gt=1).values_list('info_hash', 'count')
+        )
+
+
 class TorrentFile(models.Model):
     book = models.ForeignKey(ModelBooks, on_delete=models.CASCADE, related_name='torrent_files')
     reader = models.ForeignKey(Reader, on_delete=models.CASCADE, related_name='torrent_files')
@@ -294,15 +534,92 @@ class TorrentFile(models.Model):
         validators=[FileExtensionValidator(allowed_extensions=['torrent'])],
         verbose_name="Торрент-файл"
     )
+    # Метаинформация из файла (bookland.torrent_meta) - заполняется при сохранении нового файла
+    # или командой manage.py index_torrents; пустой info_hash - файл ещё не разобран
+    info_hash = models.CharField(max_length=40, blank=True, db_index=True, editable=False, verbose_name="Info-hash")
+    torrent_name = models.CharField(max_length=255, blank=True, editable=False, verbose_name="Имя раздачи")
+    total_size = models.BigIntegerField(blank=True, null=True, editable=False, verbose_name="Размер раздачи, байт")
+    piece_length = models.PositiveIntegerField(blank=True, null=True, editable=False, verbose_name="Размер куска")
+    piece_count = models.PositiveIntegerField(blank=True, null=True, editable=False, verbose_name="Кусков")
+    files = models.JSONField(default=list, blank=True, editable=False, verbose_name="Файлы раздачи")
+
+    objects = TorrentFileQuerySet.as_manager()
+
+    METAINFO_FIELDS = ('info_hash', 'torrent_name', 'total_size', 'piece_length', 'piece_count', 'files')
 
     class Meta:
         verbose_name = "Торрент-файл"
         verbose_name_plural = "Files-Torrent"
 
+    def apply_metainfo(self, metadata):
+        self.info_hash = metadata.info_hash
+        self.torrent_name = metadata.name[:255]
+        self.total_size = metadata.total_size
+        self.piece_length = metadata.piece_length
+        self.piece_count = metadata.piece_count
+        self.files = [{'path': path, 'length': length} for path, length in metadata.files]
+
+    def clear_metainfo(self):
+        for name in self.METAINFO_FIELDS:
+            setattr(self, name, self._meta.get_field(name).get_default())
+
+    def read_metainfo(self):
+        ''' Разбирает ещё не сохранённый файл и заполняет поля метаинформации. '''
+        upload = self.file.file
+        reopened = upload.closed  # собранный загрузкой частями файл открываем только на время разбора
+        upload.open('rb')
+        try:
+            metadata = read_torrent(upload)
+        except ValueError as error:
+            raise ValidationError({'file': f"Не удалось разобрать торрент-файл: {error}"}, code='torrent')
+        finally:
+            if reopened:
+                upload.close()
+            else:
+                upload.seek(0)
+        self.apply_metainfo(metadata)
+        self._metainfo_source = upload
+
+    def clean(self):
+        super().clean()
+        if self.file and not self.file._committed:
+            self.read_metainfo()
+            duplicate = (
+                TorrentFile.objects.by_info_hash(self.info_hash).exclude(pk=self.pk)
+                .select_related('book').first()
+            )
+            if duplicate is not None:
+                raise ValidationError(
+                    {'file': f"Этот торрент уже загружен для книги «{duplicate.book.title}»."}, code='duplicate'
+                )
+
     def save(self, *args, **kwargs):
-        self.file.name = generate_file_name(self, self.file.name, 'torrent')
+        if not self.file._committed and getattr(self, '_metainfo_source', None) is not self.file.file:
+            # Без clean() (загрузка частями, код) - разбор здесь; нераспознанный файл сохраняется
+            # с пустым info_hash, его покажет manage.py index_torrents; метаинформация
+            # заменённого файла к новому не относится
+            try:
+                self.read_metainfo()
+            except ValidationError:
+                self.clear_metainfo()
+        if self._state.adding or not self.file._committed:  # имя выдаётся только новому файлу
+            prefix, _ = BookFileNaming.allocate(self.book, 'torrent')
+            self.file.name = generate_file_name(prefix, self.file.name, 'torrent', reader_slug=self.reader.slug)
         super().save(*args, **kwargs)
 
+    def audio_parts(self):
+        ''' Аудиофайлы раздачи по порядку в паре с частями книги (AudioFile по order):
+        [(путь в раздаче, размер, AudioFile или None)] - один запрос.
+        '''
+        extensions = AudioFile._meta.get_field('file').validators[0].allowed_extensions
+        entries = sorted(
+            (entry for entry in self.files if entry['path'].rsplit('.', 1)[-1].lower() in extensions),
+            key=lambda entry: natural_key(entry['path']),
+        )
+        parts = list(self.book.audio_files.order_by('order')[:len(entries)])
+        parts += [None] * (len(entries) - len(parts))
+        return [(entry['path'], entry['length'], part) for entry, part in zip(entries, parts)]
+
     def __str__(self):
         return f"Торрент для {self.book.title} чтец {self.reader.name}"
 
@@ -320,14 +637,18 @@ class BookImage(models.Model):
         validators=[FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png'])],
         verbose_name="Изображение"
     )
+    # Версия оригинала в URL уменьшенных копий (bookland.thumbnails); пусто - копии не готовы
+    thumbnail_version = models.CharField(max_length=12, blank=True, editable=False)
 
     class Meta:
         verbose_name = "Изображение книги"
         verbose_name_plural = "Files-Picture"
 
     def save(self, *args, **kwargs):
-        if not self.image.name.startswith(self.book.slug):
-            self.image.name = generate_file_name(self.book, self.image.name, 'image')
+        if self._state.adding or not self.image._committed:
+            prefix, number = BookFileNaming.allocate(self.book, 'image')
+            self.image.name = generate_file_name(prefix, self.image.name, 'image', number)
+            self.thumbnail_version = ''
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -351,8 +672,9 @@ class AdditionalFile(models.Model):
         verbose_name_plural = "Files"
 
     def save(self, *args, **kwargs):
-        if not self.file.name.startswith(self.book.slug):
-            self.file.name = generate_file_name(self.book, self.file.name, 'additional')
+        if self._state.adding or not self.file._committed:
+            prefix, _ = BookFileNaming.allocate(self.book, 'additional')
+            self.file.name = generate_file_name(prefix, self.file.name, 'additional')
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -362,7 +684,7 @@ class AdditionalFile(models.Model):
 # Модель для аудиофайлов
 class AudioFile(models.Model):
     book = models.ForeignKey("ModelBooks", on_delete=models.CASCADE, related_name='audio_files',
-                             verbose_name="Аудиокнига")
+                             db_index=False, verbose_name="Аудиокнига")  # индекс - audiofile_book_order_idx
     file = models.FileField(
         upload_to='uploads/audio_files/',
         validators=[FileExtensionValidator(allowed_extensions=['mp3', 'm4b', 'aac', 'wav'])],
@@ -370,24 +692,97 @@ class AudioFile(models.Model):
     )
     order = models.PositiveIntegerField(default=0, verbose_name="№ файла")
     duration = models.DurationField(blank=True, null=True, verbose_name="Длительность")
+    bitrate = models.PositiveIntegerField(blank=True, null=True, verbose_name="Битрейт, кбит/с")
+    codec = models.CharField(max_length=10, blank=True, verbose_name="Кодек")
 
     class Meta:
         verbose_name = "Аудиофайл"
         verbose_name_plural = "Files-Audio"
         ordering = ['order']
+        indexes = [models.Index(fields=['book', 'order'], name='audiofile_book_order_idx')]
 
     def save(self, *args, **kwargs):
-        if self.order == 0:  # Если у файла ещё нет номера
-            max_order = self.book.audio_files.aggregate(models.Max('order'))['order__max'] or 0
-            self.order = max_order + 1
-
-        self.file.name = generate_file_name(self.book, self.file.name, 'audio')
+        if self._state.adding or not self.file._committed:
+            # Один номер из счётчика книги - и для имени файла, и для порядка, если он не задан
+            prefix, number = BookFileNaming.allocate(self.book, 'audio')
+            if self.order == 0:
+                self.order = number
+            self.file.name = generate_file_name(prefix, self.file.name, 'audio', number)
+        elif self.order == 0:  # Если у файла ещё нет номера
+            self.order = BookFileNaming.allocate(self.book, 'audio')[1]
         super().save(*args, **kwargs)
 
     def __str__(self):
         return f'{self.book.title} - часть {self.order}'
 
 
+class AudioMetadataJob(models.Model):
+    ''' Задание очереди на чтение метаданных аудиофайла (длительность, битрейт, кодек), см. bookland.audio_worker. '''
+    STATUSES = [
+        ('pending', 'В очереди'),
+        ('running', 'Обрабатывается'),
+        ('done', 'Готово'),
+        ('failed', 'Ошибка'),
+    ]
+    audio_file = models.OneToOneField(AudioFile, on_delete=models.CASCADE, related_name='metadata_job')
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending', db_index=True, verbose_name="Статус")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток")
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(blank=True, null=True, verbose_name="Взято в работу")
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Задание метаданных аудио"
+        verbose_name_plural = "Задания метаданных аудио"
+
+    def __str__(self):
+        return f"{self.audio_file_id}: {self.status}"
+
+
+class StoredFile(models.Model):
+    ''' Файл хранилища по данным сканера целостности (bookland.integrity): размер и mtime на момент
+    проверки, есть ли он на диске и ссылается ли на него AudioFile, BookImage, TorrentFile или
+    AdditionalFile. Есть на диске без ссылки - сирота, со ссылкой без файла - пропавший файл.
+    '''
+    path = models.CharField(max_length=255, unique=True, verbose_name="Путь")
+    size = models.BigIntegerField(blank=True, null=True, verbose_name="Размер, байт")
+    mtime = models.DateTimeField(blank=True, null=True, verbose_name="Изменён")
+    exists = models.BooleanField(default=True, verbose_name="Есть на диске")
+    referenced = models.BooleanField(default=False, verbose_name="Есть запись")
+    checked_at = models.DateTimeField(verbose_name="Проверен")
+
+    class Meta:
+        verbose_name = "Файл хранилища"
+        verbose_name_plural = "Файлы хранилища"
+        indexes = [models.Index(fields=['exists', 'referenced'], name='storedfile_state_idx')]
+
+    def __str__(self):
+        return self.path
+
+
+class StorageDirectory(models.Model):
+    ''' mtime каталога при последнем сканировании: неизменённый каталог повторно не читается. '''
+    path = models.CharField(max_length=255, unique=True)
+    mtime_ns = models.BigIntegerField()
+
+    def __str__(self):
+        return self.path
+
+
+class SitemapShard(models.Model):
+    ''' Время последнего изменения записей шарда карты сайта (разделы без time_update), см. bookland.sitemaps. '''
+    section = models.CharField(max_length=20)
+    shard = models.PositiveIntegerField()
+    changed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['section', 'shard'], name='sitemap_shard_unique')]
+
+    def __str__(self):
+        return f"{self.section}-{self.shard}"
+
+
 class SocialMediaPlatform(models.Model):
     name = models.CharField(max_length=50, unique=True, verbose_name="Платформа")
 
@@ -420,7 +815,7 @@ class SocialMediaLink(models.Model):
 
 class BookRating(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ratings')
-    book = models.ForeignKey(ModelBooks, on_delete=models.CASCADE, related_name='ratings')
+    book = models.ForeignKey(ModelBooks, on_delete=models.CASCADE, related_name='ratings', db_index=False)
 
     # Критерии голосования
     overall_score = models.PositiveSmallIntegerField(verbose_name="Общая оценка", default=0)  # Общая оценка, от 1 до 5
@@ -440,6 +835,180 @@ class BookRating(models.Model):
     class Meta:
         # Пользователь может оценивать каждую книгу только один раз
         unique_together = ['user', 'book']
+        # Оценки книги по времени; заменяет индекс book_id
+        indexes = [models.Index(fields=['book', 'created_at'], name='rating_book_created_idx')]
+
+    def save(self, *args, **kwargs):
+        # Сводка оценок (BookRatingSummary) обновляется сигналом post_save - в той же транзакции
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"Оценка книги {self.book.title} от {self.user.username}"
+
+
+class BookRatingSummary(models.Model):
+    ''' Денормализованная сводка оценок книги. Обновляется инкрементально (bookland.signals)
+    при добавлении, изменении и удалении BookRating; полный пересчёт - manage.py recount_ratings.
+    '''
+    CRITERIA = ('overall', 'narration', 'quality', 'plot')
+    LENGTH_FIELDS = {'too_short': 'too_short_count', 'perfect': 'perfect_count', 'too_long': 'too_long_count'}
+
+    # Байесовская оценка: (BAYES_PRIOR_WEIGHT * BAYES_PRIOR_MEAN + сумма) / (BAYES_PRIOR_WEIGHT + голосов),
+    # книга с парой пятёрок не обгоняет книгу с сотней оценок 4.8
+    BAYES_PRIOR_MEAN = 3.0
+    BAYES_PRIOR_WEIGHT = 10
+
+    book = models.OneToOneField(
+        ModelBooks, on_delete=models.CASCADE, primary_key=True, related_name='rating_summary', verbose_name="Книга"
+    )
+    ratings_count = models.PositiveIntegerField(default=0, verbose_name="Оценок")
+
+    # Оценка 0 - критерий не оценён, в среднее не входит
+    overall_votes = models.PositiveIntegerField(default=0)
+    overall_sum = models.PositiveIntegerField(default=0)
+    overall_mean = models.FloatField(default=0, verbose_name="Общая оценка")
+    narration_votes = models.PositiveIntegerField(default=0)
+    narration_sum = models.PositiveIntegerField(default=0)
+    narration_mean = models.FloatField(default=0, verbose_name="Озвучка")
+    quality_votes = models.PositiveIntegerField(default=0)
+    quality_sum = models.PositiveIntegerField(default=0)
+    quality_mean = models.FloatField(default=0, verbose_name="Качество записи")
+    plot_votes = models.PositiveIntegerField(default=0)
+    plot_sum = models.PositiveIntegerField(default=0)
+    plot_mean = models.FloatField(default=0, verbose_name="Сюжет и содержание")
+
+    too_short_count = models.PositiveIntegerField(default=0, verbose_name="Слишком короткая")
+    perfect_count = models.PositiveIntegerField(default=0, verbose_name="Подходит по длине")
+    too_long_count = models.PositiveIntegerField(default=0, verbose_name="Слишком длинная")
+
+    recommend_count = models.PositiveIntegerField(default=0, verbose_name="Рекомендуют")
+    recommend_ratio = models.FloatField(default=0, verbose_name="Доля рекомендаций")
+    bayesian_score = models.FloatField(default=BAYES_PRIOR_MEAN, db_index=True, verbose_name="Рейтинг")
+
+    class Meta:
+        verbose_name = "Рейтинг книги"
+        verbose_name_plural = "Рейтинги книг"
+
+    def __str__(self):
+        return f"Рейтинг {self.bayesian_score:.2f} ({self.ratings_count})"
+
+    @classmethod
+    def top_rated(cls):
+        ''' Книги по убыванию байесовской оценки - чтение по индексу bayesian_score. '''
+        return cls.objects.select_related('book').filter(book__is_published=True).order_by('-bayesian_score')
+
+    @classmethod
+    def rating_totals(cls, rating):
+        ''' Вклад одной оценки в счётчики сводки. '''
+        totals = {'ratings_count': 1, 'recommend_count': int(rating.would_recommend)}
+        for criterion in cls.CRITERIA:
+            score = getattr(rating, f"{criterion}_score") or 0
+            totals[f"{criterion}_votes"] = int(score > 0)
+            totals[f"{criterion}_sum"] = score
+        for length_field in cls.LENGTH_FIELDS.values():
+            totals[length_field] = 0
+        if rating.length_feedback in cls.LENGTH_FIELDS:
+            totals[cls.LENGTH_FIELDS[rating.length_feedback]] = 1
+        return totals
+
+    @classmethod
+    def apply_delta(cls, book_id, delta, create=True):
+        ''' Одним UPDATE прибавляет delta к счётчикам и пересчитывает средние.
+        Все выражения строятся от старых значений столбцов + delta, поэтому
+        параллельные оценки не теряются (нет чтения-изменения-записи в Python).
+        '''
+        if not any(delta.values()):
+            return
+        if create:
+            cls.objects.bulk_create([cls(book_id=book_id)], ignore_conflicts=True)
+
+        def value(field):
+            return models.F(field) + delta.get(field, 0)
+
+        def ratio(numerator, denominator):
+            return Coalesce(
+                Cast(value(numerator), models.FloatField()) / NullIf(value(denominator), 0),
+                0.0,
+                output_field=models.FloatField(),
+            )
+
+        changes = {field: value(field) for field, change in delta.items() if change}
+        for criterion in cls.CRITERIA:
+            changes[f"{criterion}_mean"] = ratio(f"{criterion}_sum", f"{criterion}_votes")
+        changes['recommend_ratio'] = ratio('recommend_count', 'ratings_count')
+        changes['bayesian_score'] = models.ExpressionWrapper(
+            (cls.BAYES_PRIOR_WEIGHT * cls.BAYES_PRIOR_MEAN + Cast(value('overall_sum'), models.FloatField()))
+            / (cls.BAYES_PRIOR_WEIGHT + value('overall_votes')),
+            output_field=models.FloatField(),
+        )
+        cls.objects.filter(book_id=book_id).update(**changes)
+
+    def refresh_derived(self):
+        ''' Пересчёт средних и байесовской оценки из сумм (для полного пересчёта сводок). '''
+        for criterion in self.CRITERIA:
+            votes = getattr(self, f"{criterion}_votes")
+            setattr(self, f"{criterion}_mean", getattr(self, f"{criterion}_sum") / votes if votes else 0)
+        self.recommend_ratio = self.recommend_count / self.ratings_count if self.ratings_count else 0
+        self.bayesian_score = (
+            (self.BAYES_PRIOR_WEIGHT * self.BAYES_PRIOR_MEAN + self.overall_sum)
+            / (self.BAYES_PRIOR_WEIGHT + self.overall_votes)
+        )
+
+    @classmethod
+    def rebuild(cls):
+        ''' Пересобирает все сводки одним сгруппированным агрегатом по BookRating. '''
+        aggregates = {
+            'ratings_count': models.Count('pk'),
+            'recommend_count': models.Count('pk', filter=models.Q(would_recommend=True)),
+        }
+        for criterion in cls.CRITERIA:
+            scored = models.Q(**{f"{criterion}_score__gt": 0})
+            aggregates[f"{criterion}_votes"] = models.Count('pk', filter=scored)
+            aggregates[f"{criterion}_sum"] = Coalesce(models.Sum(f"{criterion}_score"), 0)
+        for feedback, length_field in cls.LENGTH_FIELDS.items():
+            aggregates[length_field] = models.Count('pk', filter=models.Q(length_feedback=feedback))
+
+        summaries = []
+        for row in BookRating.objects.order_by().values('book').annotate(**aggregates):
+            summary = cls(book_id=row.pop('book'), **row)
+            summary.refresh_derived()
+            summaries.append(summary)
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(summaries, batch_size=500)
+        return len(summaries)
+
+
+class ChunkedUpload(models.Model):
+    ''' Сессия докачиваемой загрузки большого файла (аудио, торрент, доп. файл) частями, см. bookland.uploads. '''
+    KINDS = [
+        ('audio', 'Аудиофайл'),
+        ('torrent', 'Торрент-файл'),
+        ('additional', 'Дополнительный файл'),
+    ]
+    STATUSES = [
+        ('active', 'Загружается'),
+        ('finishing', 'Завершается'),
+        ('complete', 'Завершена'),
+    ]
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=15, choices=KINDS, verbose_name="Тип файла")
+    book = models.ForeignKey(ModelBooks, on_delete=models.CASCADE, related_name='chunked_uploads', verbose_name="Книга")
+    reader = models.ForeignKey(Reader, on_delete=models.CASCADE, blank=True, null=True, verbose_name="Чтец")
+    filename = models.CharField(max_length=255, verbose_name="Имя файла")
+    size = models.BigIntegerField(verbose_name="Размер")
+    offset = models.BigIntegerField(default=0, verbose_name="Получено байт")
+    sha256 = models.CharField(max_length=64, blank=True, verbose_name="SHA-256")
+    status = models.CharField(max_length=10, choices=STATUSES, default='active', verbose_name="Статус")
+    object_id = models.BigIntegerField(blank=True, null=True, verbose_name="id созданного файла")
+    writing_until = models.DateTimeField(blank=True, null=True, editable=False)  # аренда приёма части, см. bookland.uploads
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Загрузка частями"
+        verbose_name_plural = "Загрузки частями"
 
     def __str__(self):
-        return f"Оценка книги {self.book.title} от {self.user.username}"
\ No newline at end of file
+        return f"{self.filename} ({self.offset}/{self.size})"
@@ -0,0 +1,208 @@
+# D:\Python\myProject\Bookland\apps\bookland\profiling.py
+
+'''Профилирование запросов к базе по HTTP-запросам (включается BOOKLAND_PROFILING).
+
+QueryProfileMiddleware замеряет для каждого запроса время ответа, число SQL-запросов,
+их суммарное время и повторяющиеся запросы (N+1 - один и тот же SQL с разными
+параметрами). SQL перехватывается обёрткой connection.execute_wrappers, которая
+ставится на каждое соединение (connection_created); текущий профиль передаётся
+через contextvar, поэтому запросы из sync_to_async под ASGI попадают в профиль
+своего HTTP-запроса так же, как под WSGI.
+
+Сводка по view и кольцевой буфер медленных запросов (с их SQL) хранятся в памяти
+процесса - stats(), /__stats__/. Если задан BOOKLAND_PROFILE_LOG, каждый запрос
+дописывается строкой JSON в файл - из него отчёт строит manage.py bookland_profile.
+Запись в файл идёт вне общей блокировки сводки, а для async-запросов - в потоке
+(sync_to_async), чтобы дисковый ввод-вывод не останавливал цикл событий.
+'''
+
+import json
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+DUPLICATE_THRESHOLD = 2  # Запрос, выполненный столько раз и больше, считается повтором (N+1)
+SLOW_QUERIES_KEPT = 100  # SQL медленного запроса в буфере - не больше стольких запросов
+
+_current = ContextVar('bookland_profile', default=None)
+_lock = threading.Lock()
+_log_lock = threading.Lock()  # строки журнала от разных потоков не перемешиваются
+_views = {}
+_slow = deque(maxlen=50)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def signature(sql):
+    ''' SQL без различий, не влияющих на форму запроса: IN (%s, %s, ...) -> IN (...). '''
+    return re.sub(r"IN \((?:%s, )*%s\)", "IN (...)", sql)
+
+
+def _record_query(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.add_query(sql, time.perf_counter() - started)
+
+
+def _install(connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _install_opened():
+    for connection in connections.all(initialized_only=True):  # открытые соединения этого потока
+        _install(connection)
+
+
+class RequestProfile:
+    def __init__(self, request):
+        self.method = request.method
+        self.path = request.path
+        self.started = time.perf_counter()
+        self.queries = []
+
+    def add_query(self, sql, duration):
+        self.queries.append((sql, duration))
+
+    def finish(self, request, response):
+        wall = time.perf_counter() - self.started
+        match = getattr(request, 'resolver_match', None)
+        counts = Counter(signature(sql) for sql, _ in self.queries)
+        return {
+            'time': time.time(),
+            'method': self.method,
+            'path': self.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'wall_ms': round(wall * 1000, 2),
+            'queries': len(self.queries),
+            'db_ms': round(sum(duration for _, duration in self.queries) * 1000, 2),
+            'duplicates': {sql: count for sql, count in counts.most_common() if count >= DUPLICATE_THRESHOLD},
+        }
+
+
+def record(entry, queries):
+    ''' Учёт завершённого запроса: сводка по view, буфер медленных, файл BOOKLAND_PROFILE_LOG. '''
+    _write_log(_summarize(entry, queries))
+
+
+async def arecord(entry, queries):
+    ''' record() для async-запросов: сводка - сразу, запись в файл - в потоке. '''
+    entry = _summarize(entry, queries)
+    if _setting('BOOKLAND_PROFILE_LOG', None):
+        await sync_to_async(_write_log, thread_sensitive=False)(entry)
+
+
+def _summarize(entry, queries):
+    ''' Сводка по view и буфер медленных (только память). Возвращает запись для журнала. '''
+    slow = entry['wall_ms'] >= _setting('BOOKLAND_SLOW_REQUEST_MS', 500)
+    if slow:
+        entry = {**entry, 'sql': [
+            {'sql': sql, 'ms': round(duration * 1000, 2)} for sql, duration in queries[:SLOW_QUERIES_KEPT]
+        ]}
+    key = entry['view'] or entry['path']
+    with _lock:
+        view = _views.setdefault(key, {
+            'requests': 0, 'wall_ms': 0.0, 'max_wall_ms': 0.0, 'db_ms': 0.0, 'queries': 0, 'with_duplicates': 0,
+        })
+        view['requests'] += 1
+        view['wall_ms'] += entry['wall_ms']
+        view['max_wall_ms'] = max(view['max_wall_ms'], entry['wall_ms'])
+        view['db_ms'] += entry['db_ms']
+        view['queries'] += entry['queries']
+        view['with_duplicates'] += bool(entry['duplicates'])
+        if slow:
+            _slow.append(entry)
+    return entry
+
+
+def _write_log(entry):
+    path = _setting('BOOKLAND_PROFILE_LOG', None)
+    if not path:
+        return
+    line = json.dumps(entry, ensure_ascii=False) + '\n'
+    with _log_lock, open(path, 'a', encoding='utf-8') as log:
+        log.write(line)
+
+
+def stats(top=20):
+    ''' Сводка процесса: view по суммарному времени ответа и последние медленные запросы. '''
+    with _lock:
+        views = [(name, dict(view)) for name, view in _views.items()]
+        slow = list(_slow)
+    ranked = []
+    for name, view in sorted(views, key=lambda item: item[1]['wall_ms'], reverse=True)[:top]:
+        requests = view['requests']
+        ranked.append({
+            'view': name,
+            'requests': requests,
+            'avg_wall_ms': round(view['wall_ms'] / requests, 2),
+            'max_wall_ms': view['max_wall_ms'],
+            'avg_db_ms': round(view['db_ms'] / requests, 2),
+            'avg_queries': round(view['queries'] / requests, 1),
+            'with_duplicates': view['with_duplicates'],
+        })
+    return {'views': ranked, 'slow': slow[::-1]}
+
+
+def reset():
+    with _lock:
+        _views.clear()
+        _slow.clear()
+
+
+class QueryProfileMiddleware:
+    ''' Профиль каждого запроса (см. модуль). Без BOOKLAND_PROFILING отключается при запуске. '''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not _setting('BOOKLAND_PROFILING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        connection_created.connect(_install, dispatch_uid='bookland_profiling')
+        global _slow
+        with _lock:
+            _slow = deque(_slow, maxlen=_setting('BOOKLAND_PROFILE_BUFFER', 50))
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        _install_opened()
+        profile = RequestProfile(request)
+        token = _current.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        record(profile.finish(request, response), profile.queries)
+        return response
+
+    async def __acall__(self, request):
+        # ORM из async-view работает в потоке sync_to_async; его соединение могло открыться до профилирования
+        await sync_to_async(_install_opened)()
+        profile = RequestProfile(request)
+        token = _current.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        await arecord(profile.finish(request, response), profile.queries)
+        return response
@@ -0,0 +1,219 @@
+# D:\Python\myProject\Bookland\apps\bookland\search.py
+
+'''Полнотекстовый поиск аудиокниг (SQLite FTS5).
+
+Для каждой книги в виртуальной таблице SEARCH_TABLE хранится документ: название,
+имена авторов и чтецов, название цикла (в кириллице и транслитерации - поиск
+находит "Булгаков" и по "bulgakov") и описание. Документ пересобирается
+сигналами при сохранении/удалении книги, смене её авторов и чтецов, а также
+при изменении самих авторов, чтецов и циклов.
+
+На других СУБД (без FTS5) индекс не ведётся, а поиск сводится к icontains.
+'''
+
+import re
+
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import ModelBooks, Author, Reader, Cycle
+from .utilities import translit_re
+
+SEARCH_TABLE = 'bookland_book_search'
+
+# Веса колонок для bm25 (book_id, title, people, cycle, description)
+RANK_WEIGHTS = (0.0, 10.0, 5.0, 3.0, 1.0)
+
+INDEX_BATCH = 500
+
+_TERM_RE = re.compile(r'\w+')
+
+
+def search_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def ensure_search_table():
+    ''' Создаёт FTS5-таблицу, если её ещё нет. Возвращает True, если таблица создана сейчас. '''
+    if not search_enabled():
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [SEARCH_TABLE])
+        if cursor.fetchone():
+            return False
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+            "book_id UNINDEXED, title, people, cycle, description, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+    return True
+
+
+def _with_translit(*values):
+    ''' Строка для индекса: исходные значения и их транслитерация. '''
+    values = [value for value in values if value]
+    return ' '.join(values + [translit_re(value) for value in values])
+
+
+def _document(book):
+    people = [str(person) for person in book.authors.all()] + [str(person) for person in book.readers.all()]
+    return (
+        book.pk,
+        _with_translit(book.title),
+        _with_translit(*people),
+        _with_translit(book.cycle.name) if book.cycle else '',
+        book.description or '',
+    )
+
+
+def index_books(book_ids):
+    ''' Пересобирает документы индекса для книг book_ids (список id или values_list-запрос).
+    Документы удалённых книг просто удаляются.
+    '''
+    if not search_enabled():
+        return
+    book_ids = list(book_ids)
+    for i in range(0, len(book_ids), INDEX_BATCH):
+        batch = book_ids[i:i + INDEX_BATCH]
+        books = (
+            ModelBooks.objects.filter(pk__in=batch)
+            .select_related('cycle')
+            .prefetch_related('authors', 'readers')
+        )
+        documents = [_document(book) for book in books]
+        with connection.cursor() as cursor:
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE book_id IN ({placeholders})", batch)
+            cursor.executemany(f"INSERT INTO {SEARCH_TABLE} VALUES (%s, %s, %s, %s, %s)", documents)
+
+
+def schedule_index(book_ids):
+    ''' Откладывает переиндексацию до фиксации транзакции. Сохранение книги в админке
+    посылает несколько сигналов (книга, авторы, чтецы) - книга переиндексируется один раз.
+    '''
+    pending = connection.__dict__.setdefault('_bookland_search_pending', set())
+    pending.update(book_ids)
+    transaction.on_commit(_flush_pending)
+
+
+def _flush_pending():
+    pending = connection.__dict__.pop('_bookland_search_pending', None)
+    if pending:
+        index_books(pending)
+
+
+def rebuild_index(chunk_size=2000):
+    ''' Полная пересборка индекса (команда manage.py rebuild_search_index). '''
+    if not search_enabled():
+        return 0
+    ensure_search_table()
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+    total = 0
+    batch = []
+    for book_id in ModelBooks.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=chunk_size):
+        batch.append(book_id)
+        if len(batch) == chunk_size:
+            index_books(batch)
+            total += len(batch)
+            batch = []
+    index_books(batch)
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('optimize')")
+    return total + len(batch)
+
+
+def match_expression(query):
+    ''' Запрос пользователя -> выражение FTS5: все слова обязательны, каждое - как префикс. '''
+    terms = _TERM_RE.findall(query.replace('_', ' '))
+    return ' AND '.join(f'"{term}"*' for term in terms)
+
+
+def search_queryset(queryset, query):
+    ''' Фильтрует queryset книг по поисковому запросу (для админки - без ограничения и ранжирования). '''
+    expression = match_expression(query)
+    if not expression:
+        return queryset
+    if not search_enabled():
+        return queryset.filter(title__icontains=query)
+    return queryset.filter(pk__in=RawSQL(
+        f"SELECT book_id FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s", [expression]
+    ))
+
+
+def search_books(query, limit=20):
+    ''' Опубликованные книги по запросу, в порядке релевантности (bm25), одним запросом. '''
+    expression = match_expression(query)
+    if not expression:
+        return []
+    if not search_enabled():
+        return list(ModelBooks.objects.filter(is_published=True, title__icontains=query)[:limit])
+    weights = ', '.join(str(weight) for weight in RANK_WEIGHTS)
+    return list(ModelBooks.objects.raw(
+        f"SELECT b.* FROM {SEARCH_TABLE} s "
+        f"JOIN {ModelBooks._meta.db_table} b ON b.id = s.book_id "
+        f"WHERE {SEARCH_TABLE} MATCH %s AND b.is_published "
+        f"ORDER BY bm25({SEARCH_TABLE}, {weights}) LIMIT %s",
+        [expression, limit],
+    ))
+
+
+# --- Синхронизация индекса ---
+
+def create_search_table(sender, **kwargs):
+    ''' post_migrate: создаёт таблицу индекса и, если она новая, индексирует существующие книги. '''
+    if ensure_search_table():
+        rebuild_index()
+
+
+@receiver(post_save, sender=ModelBooks)
+def book_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_index([instance.pk])
+
+
+@receiver(post_delete, sender=ModelBooks)
+def book_deleted(sender, instance, **kwargs):
+    schedule_index([instance.pk])
+
+
+@receiver(m2m_changed, sender=ModelBooks.authors.through)
+@receiver(m2m_changed, sender=ModelBooks.readers.through)
+def book_people_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # После очистки связей со стороны автора/чтеца книги уже не найти
+        instance._search_book_ids = list(_related_book_ids(instance))
+    elif action in ('post_add', 'post_remove'):
+        schedule_index(pk_set if reverse else [instance.pk])
+    elif action == 'post_clear':
+        schedule_index(getattr(instance, '_search_book_ids', []) if reverse else [instance.pk])
+
+
+def _related_book_ids(instance):
+    ''' id книг автора, чтеца или цикла. '''
+    books = instance.books if isinstance(instance, Reader) else instance.modelbooks_set
+    return books.values_list('pk', flat=True)
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Reader)
+@receiver(post_save, sender=Cycle)
+def person_or_cycle_saved(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        schedule_index(_related_book_ids(instance))
+
+
+@receiver(pre_delete, sender=Author)
+@receiver(pre_delete, sender=Reader)
+@receiver(pre_delete, sender=Cycle)
+def person_or_cycle_deleting(sender, instance, **kwargs):
+    instance._search_book_ids = list(_related_book_ids(instance))
+
+
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Reader)
+@receiver(post_delete, sender=Cycle)
+def person_or_cycle_deleted(sender, instance, **kwargs):
+    schedule_index(getattr(instance, '_search_book_ids', []))
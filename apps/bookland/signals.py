@@ -0,0 +1,371 @@
+# D:\Python\myProject\Bookland\apps\bookland\signals.py
+
+'''Инкрементальное обновление денормализованных данных книг.
+
+Счётчики файлов ModelBooks. При создании/удалении торрента, аудиофайла, изображения или доп. файла счётчик
+книги меняется атомарным UPDATE ... SET total = total ± 1 (F-выражение),
+без пересчёта COUNT(*). Расхождения (например, после bulk_create файлов в обход
+сигналов) исправляет команда manage.py recount_counters.
+
+Сводка оценок BookRatingSummary. Изменение счётчиков и средних при добавлении,
+изменении и удалении BookRating - одним UPDATE в той же транзакции (см.
+BookRating.save); полный пересчёт - manage.py recount_ratings.
+
+Метаданные аудио. Новый AudioFile и AudioFile с заменённым файлом ставятся в
+очередь AudioMetadataJob, которую разбирает manage.py audio_metadata
+(bookland.audio_worker); после удаления AudioFile длительность книги
+пересчитывается (после коммита).
+
+Обложки. После сохранения BookImage уменьшенные копии строятся в фоновом пуле
+(bookland.thumbnails); при удалении или замене изображения старые копии удаляются.
+
+Имена файлов. Кэш префикса имён (BookFileNaming.prefix) сбрасывается при
+изменении слага, цикла или авторов книги, а также слагов авторов и циклов.
+
+Версия книги для API и кэша. ModelBooks.time_update (ETag/Last-Modified в
+bookland.api, ключи bookland.cache) обновляется и при смене авторов, чтецов,
+жанров и файлов книги, и при изменении или удалении самих авторов, чтецов,
+циклов и жанров.
+
+Дерево жанров. Счётчики книг поджанров и жанров (total_books, published_books)
+пересчитываются одним UPDATE для затронутых поджанров при смене жанров книги,
+публикации и удалении книги, переносе поджанра в другой жанр; полный
+пересчёт - manage.py recount_genres.
+'''
+
+from django.db import transaction
+from django.db.models import F, QuerySet
+from django.utils import timezone
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import (
+    ModelBooks, TorrentFile, AudioFile, BookImage, AdditionalFile, BookRating, BookRatingSummary, AudioMetadataJob,
+    BookFileNaming, Author, Reader, Cycle, ModelCategories, ModelSubcategories,
+)
+from . import cache
+from .audio_worker import enqueue, rollup_book_durations
+from .thumbnails import delete_derivatives, schedule_derivatives
+
+COUNTER_FIELDS = {model: field for model, field in ModelBooks.counter_models()}
+
+# Значение поля, не загруженного на момент post_init (only/defer): исходное значение
+# дочитывается одним запросом только при сохранении или удалении записи
+_DEFERRED = object()
+
+
+def change_counter(model, book_id, delta):
+    ''' Атомарно изменяет счётчик файлов модели model у книги book_id на delta. '''
+    field = COUNTER_FIELDS[model]
+    books = ModelBooks.objects.filter(pk=book_id)
+    if delta < 0:
+        books = books.filter(**{f"{field}__gte": -delta})  # PositiveIntegerField не уходит в минус
+    books.update(**{field: F(field) + delta})
+
+
+@receiver(post_init, sender=TorrentFile)
+@receiver(post_init, sender=AudioFile)
+@receiver(post_init, sender=BookImage)
+@receiver(post_init, sender=AdditionalFile)
+def remember_book(sender, instance, **kwargs):
+    # Запоминаем исходную книгу, чтобы отследить перенос файла в другую книгу
+    instance._counted_book_id = instance.__dict__.get('book_id', _DEFERRED)
+
+
+@receiver(pre_save, sender=TorrentFile)
+@receiver(pre_save, sender=AudioFile)
+@receiver(pre_save, sender=BookImage)
+@receiver(pre_save, sender=AdditionalFile)
+@receiver(pre_delete, sender=TorrentFile)
+@receiver(pre_delete, sender=AudioFile)
+@receiver(pre_delete, sender=BookImage)
+@receiver(pre_delete, sender=AdditionalFile)
+def load_counted_book(sender, instance, **kwargs):
+    if instance._counted_book_id is _DEFERRED:
+        instance._counted_book_id = sender.objects.filter(pk=instance.pk).values_list('book_id', flat=True).first()
+
+
+@receiver(post_save, sender=TorrentFile)
+@receiver(post_save, sender=AudioFile)
+@receiver(post_save, sender=BookImage)
+@receiver(post_save, sender=AdditionalFile)
+def file_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:  # loaddata: счётчики приходят вместе с фикстурой книги
+        return
+    if created:
+        change_counter(sender, instance.book_id, 1)
+        touch_books([instance.book_id])
+    elif instance._counted_book_id != instance.book_id:
+        change_counter(sender, instance._counted_book_id, -1)
+        change_counter(sender, instance.book_id, 1)
+        touch_books([instance._counted_book_id, instance.book_id])
+    instance._counted_book_id = instance.book_id
+
+
+@receiver(post_delete, sender=TorrentFile)
+@receiver(post_delete, sender=AudioFile)
+@receiver(post_delete, sender=BookImage)
+@receiver(post_delete, sender=AdditionalFile)
+def file_deleted(sender, instance, **kwargs):
+    change_counter(sender, instance._counted_book_id, -1)
+    touch_books([instance._counted_book_id])
+
+
+@receiver(post_init, sender=BookRating)
+def remember_rating(sender, instance, **kwargs):
+    # Вклад оценки в сводку на момент загрузки - чтобы при изменении применить только разницу
+    if instance.pk and instance.get_deferred_fields():
+        instance._summary_book_id = instance._summary_totals = _DEFERRED
+        return
+    instance._summary_book_id = instance.book_id
+    instance._summary_totals = BookRatingSummary.rating_totals(instance) if instance.pk else None
+
+
+@receiver(pre_save, sender=BookRating)
+@receiver(pre_delete, sender=BookRating)
+def load_rating(sender, instance, **kwargs):
+    if instance._summary_totals is _DEFERRED:
+        stored = BookRating.objects.filter(pk=instance.pk).first()
+        instance._summary_book_id = stored.book_id if stored else None
+        instance._summary_totals = BookRatingSummary.rating_totals(stored) if stored else None
+
+
+@receiver(post_save, sender=BookRating)
+def rating_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    new = BookRatingSummary.rating_totals(instance)
+    old = None if created else instance._summary_totals
+    if old and instance._summary_book_id != instance.book_id:
+        BookRatingSummary.apply_delta(instance._summary_book_id, {field: -value for field, value in old.items()})
+        old = None
+    delta = {field: value - (old[field] if old else 0) for field, value in new.items()}
+    BookRatingSummary.apply_delta(instance.book_id, delta)
+    instance._summary_book_id = instance.book_id
+    instance._summary_totals = new
+
+
+@receiver(post_delete, sender=BookRating)
+def rating_deleted(sender, instance, **kwargs):
+    # Сводку не создаём: книга может удаляться каскадно вместе с ней
+    totals = instance._summary_totals or BookRatingSummary.rating_totals(instance)
+    BookRatingSummary.apply_delta(
+        instance._summary_book_id, {field: -value for field, value in totals.items()}, create=False
+    )
+
+
+@receiver(post_init, sender=AudioFile)
+def remember_audio_source(sender, instance, **kwargs):
+    source = instance.__dict__.get('file', _DEFERRED)
+    instance._metadata_source = getattr(source, 'name', source)
+
+
+@receiver(pre_save, sender=AudioFile)
+def load_audio_source(sender, instance, **kwargs):
+    if instance._metadata_source is _DEFERRED:
+        instance._metadata_source = sender.objects.filter(pk=instance.pk).values_list('file', flat=True).first()
+
+
+@receiver(post_save, sender=AudioFile)
+def audio_file_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    name = instance.file.name
+    if created:
+        AudioMetadataJob.objects.create(audio_file=instance)
+    elif name != instance._metadata_source:  # файл заменён - длительность, битрейт и кодек устарели
+        enqueue([instance.pk])
+    instance._metadata_source = name
+
+
+@receiver(post_delete, sender=AudioFile)
+def audio_file_deleted(sender, instance, **kwargs):
+    book_id = instance._counted_book_id
+    transaction.on_commit(lambda: rollup_book_durations([book_id]))
+
+
+@receiver(post_init, sender=BookImage)
+def remember_image(sender, instance, **kwargs):
+    image = instance.__dict__.get('image', _DEFERRED)
+    instance._thumbnail_source = getattr(image, 'name', image)
+
+
+@receiver(pre_save, sender=BookImage)
+@receiver(pre_delete, sender=BookImage)
+def load_image(sender, instance, **kwargs):
+    if instance._thumbnail_source is _DEFERRED:
+        instance._thumbnail_source = sender.objects.filter(pk=instance.pk).values_list('image', flat=True).first()
+
+
+@receiver(post_save, sender=BookImage)
+def image_saved(sender, instance, raw=False, **kwargs):
+    if raw or not instance.image:
+        return
+    old_name, name = instance._thumbnail_source, instance.image.name
+    instance._thumbnail_source = name
+    if old_name and old_name != name:
+        transaction.on_commit(lambda: delete_derivatives(old_name))
+    pk, path = instance.pk, instance.image.path
+    transaction.on_commit(lambda: schedule_derivatives(pk, name, path))
+
+
+@receiver(post_delete, sender=BookImage)
+def image_deleted(sender, instance, **kwargs):
+    name = instance._thumbnail_source or instance.image.name
+    if name:
+        transaction.on_commit(lambda: delete_derivatives(name))
+
+
+def _naming_state(book):
+    # Поля книги, из которых складывается префикс имён файлов. Через __dict__ - чтобы не
+    # догружать отложенные поля (only/defer); незагруженное поле при сохранении сбрасывает кэш.
+    return tuple(book.__dict__.get(field, _DEFERRED) for field in ('slug', 'work_type', 'cycle_id', 'cycle_number'))
+
+
+
+@receiver(post_init, sender=ModelBooks)
+def remember_naming(sender, instance, **kwargs):
+    instance._naming_state = _naming_state(instance)
+
+
+@receiver(post_save, sender=ModelBooks)
+def book_naming_changed(sender, instance, created, raw=False, **kwargs):
+    state = _naming_state(instance)
+    if not created and not raw and state != instance._naming_state:
+        BookFileNaming.invalidate([instance.pk])
+    instance._naming_state = state
+
+
+@receiver(m2m_changed, sender=ModelBooks.authors.through)
+def book_authors_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        BookFileNaming.invalidate([instance.pk])
+    elif action == 'pre_clear':  # после очистки книги автора уже не найти
+        BookFileNaming.invalidate(instance.modelbooks_set.all())
+    else:
+        BookFileNaming.invalidate(pk_set)
+
+
+@receiver(post_save, sender=Author)
+def author_naming_changed(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        BookFileNaming.invalidate(instance.modelbooks_set.all())
+
+
+@receiver(post_save, sender=Cycle)
+def cycle_naming_changed(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        BookFileNaming.invalidate(instance.modelbooks_set.all())
+
+
+# Модель, связанная с книгой -> поле ModelBooks
+BOOK_RELATIONS = {Author: 'authors', Reader: 'readers', ModelSubcategories: 'book_subcategories', Cycle: 'cycle'}
+
+
+def touch_books(books):
+    ''' Обновляет time_update книг books (queryset книг или список id) одним UPDATE. '''
+    if not isinstance(books, QuerySet):
+        books = ModelBooks.objects.filter(pk__in=books)
+    books.update(time_update=timezone.now())
+
+
+@receiver(m2m_changed, sender=ModelBooks.authors.through)
+@receiver(m2m_changed, sender=ModelBooks.readers.through)
+@receiver(m2m_changed, sender=ModelBooks.book_subcategories.through)
+def book_relations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        touch_books([instance.pk])
+    elif action == 'pre_clear':  # после очистки связанные книги уже не найти
+        touch_books(ModelBooks.objects.filter(**{BOOK_RELATIONS[type(instance)]: instance}))
+    else:
+        touch_books(pk_set)
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Reader)
+@receiver(post_save, sender=Cycle)
+@receiver(post_save, sender=ModelSubcategories)
+def related_entity_saved(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        touch_books(ModelBooks.objects.filter(**{BOOK_RELATIONS[sender]: instance}))
+
+
+@receiver(pre_delete, sender=Author)
+@receiver(pre_delete, sender=Reader)
+@receiver(pre_delete, sender=Cycle)
+@receiver(pre_delete, sender=ModelSubcategories)
+def related_entity_deleting(sender, instance, **kwargs):
+    # Связи удаляются каскадом (или SET NULL у цикла) без сигналов m2m_changed/post_save
+    touch_books(ModelBooks.objects.filter(**{BOOK_RELATIONS[sender]: instance}))
+
+
+def recount_genres(subcategory_ids):
+    ''' Пересчёт счётчиков книг поджанров subcategory_ids и их жанров. '''
+    ids = set(subcategory_ids) - {None}
+    if not ids:
+        return
+    subcategories = ModelSubcategories.objects.filter(pk__in=ids)
+    ModelSubcategories.recount_books(subcategories)
+    ModelCategories.recount_books(ModelCategories.objects.filter(pk__in=subcategories.values('category')))
+    cache.invalidate_genres(ids)
+
+
+@receiver(m2m_changed, sender=ModelBooks.book_subcategories.through)
+def book_genres_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:  # изменены книги поджанра
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            recount_genres([instance.pk])
+    elif action == 'pre_clear':  # после очистки поджанры книги уже не найти
+        instance._cleared_genres = list(instance.book_subcategories.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        recount_genres(instance._cleared_genres)
+    elif action in ('post_add', 'post_remove'):
+        recount_genres(pk_set)
+
+
+@receiver(post_init, sender=ModelBooks)
+def remember_published(sender, instance, **kwargs):
+    instance._genre_published = instance.__dict__.get('is_published', _DEFERRED)
+
+
+@receiver(post_save, sender=ModelBooks)
+def book_published_changed(sender, instance, created, raw=False, **kwargs):
+    published = instance.__dict__.get('is_published', _DEFERRED)
+    if not created and not raw and published != instance._genre_published:
+        recount_genres(instance.book_subcategories.values_list('pk', flat=True))
+    instance._genre_published = published
+
+
+@receiver(pre_delete, sender=ModelBooks)
+def book_genres_deleting(sender, instance, **kwargs):
+    # Связи с поджанрами удаляются каскадом, без m2m_changed
+    instance._deleted_genres = list(instance.book_subcategories.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=ModelBooks)
+def book_genres_deleted(sender, instance, **kwargs):
+    recount_genres(instance._deleted_genres)
+
+
+@receiver(post_init, sender=ModelSubcategories)
+def remember_category(sender, instance, **kwargs):
+    instance._counted_category_id = instance.__dict__.get('category_id')
+
+
+@receiver(post_save, sender=ModelSubcategories)
+def subcategory_moved(sender, instance, created, raw=False, **kwargs):
+    old_category = instance._counted_category_id
+    instance._counted_category_id = instance.category_id
+    if not created and not raw and old_category != instance.category_id:
+        categories = ModelCategories.objects.filter(pk__in=[old_category, instance.category_id])
+        ModelCategories.recount_books(categories)
+        cache.invalidate('categories', categories.values_list('slug', flat=True))
+
+
+@receiver(post_delete, sender=ModelSubcategories)
+def subcategory_deleted(sender, instance, **kwargs):
+    ModelCategories.recount_books(ModelCategories.objects.filter(pk=instance.category_id))
@@ -0,0 +1,276 @@
+# D:\Python\myProject\Bookland\apps\bookland\sitemaps.py
+
+'''Карта сайта (sitemap.xml) для поисковых систем: индекс и шарды до SHARD_SIZE адресов.
+
+/sitemap.xml - индекс (sitemapindex) со ссылками на шарды /sitemap-<раздел>-<n>.xml.
+Шард n раздела - записи с pk из (n * SHARD_SIZE, (n + 1) * SHARD_SIZE]: новые
+записи попадают в последний шард, правка книги меняет только шард, где она лежит.
+
+Шарды хранятся на диске (BOOKLAND_SITEMAP_DIR) в файлах с версией в имени:
+- книги - число опубликованных книг шарда и max(time_update), один агрегатный
+  запрос по диапазону pk; time_update меняют сохранение книги, её связей и файлов;
+- остальные разделы - число записей, max(pk) и время изменения шарда из
+  таблицы SitemapShard, его обновляют сигналы сохранения и удаления (смена
+  слага меняет адрес).
+Версия берётся из БД, поэтому все процессы видят одну и ту же. Неизменный шард
+отдаётся готовым файлом после запроса версии; изменённый строится заново потоком
+по .iterator(chunk_size=CHUNK_SIZE) (values_list, без объектов моделей) во
+временный файл, который затем подменяет старый. Стоимость перестроения
+пропорциональна числу изменённых шардов, а не размеру каталога.
+'''
+
+import asyncio
+import hashlib
+import os
+import tempfile
+from xml.sax.saxutils import escape
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count, F, Max
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .media import MEDIA_BLOCK_SIZE, MediaFileResponse
+from .models import Author, Cycle, ModelBooks, ModelCategories, ModelSubcategories, Reader, SitemapShard
+
+SHARD_SIZE = 50000  # Предел адресов в одном файле протокола sitemaps.org
+CHUNK_SIZE = 2000
+SITEMAP_MAX_AGE = 3600
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+SITEMAP_XMLNS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+CONTENT_TYPE = 'application/xml; charset=utf-8'
+
+
+def sitemap_dir():
+    return str(getattr(settings, 'BOOKLAND_SITEMAP_DIR', os.path.join(settings.BASE_DIR, 'sitemaps')))
+
+
+def base_url(request):
+    return f"{request.scheme}://{request.get_host()}"
+
+
+def _entry(tag, location, lastmod=None):
+    lastmod = f"<lastmod>{lastmod.date().isoformat()}</lastmod>" if lastmod else ''
+    return f"<{tag}><loc>{escape(location)}</loc>{lastmod}</{tag}>\n"
+
+
+class Section:
+    ''' Раздел карты сайта: записи model (с условием filters) по маршруту url_name.
+    url_kwargs - {аргумент маршрута: поле записи}; lastmod - поле времени изменения.
+    '''
+
+    def __init__(self, name, model, url_name, url_kwargs, lastmod=None, filters=None):
+        self.name = name
+        self.model = model
+        self.url_name = url_name
+        self.url_kwargs = url_kwargs
+        self.lastmod = lastmod
+        self.filters = filters or {}
+
+    def get_queryset(self):
+        return self.model.objects.filter(**self.filters).order_by()
+
+    def shard_queryset(self, shard):
+        return self.get_queryset().filter(pk__gt=shard * SHARD_SIZE, pk__lte=(shard + 1) * SHARD_SIZE)
+
+    def _aggregates(self):
+        aggregates = {'count': Count('pk')}
+        if self.lastmod:
+            aggregates['lastmod'] = Max(self.lastmod)
+        return aggregates
+
+    def shards(self):
+        ''' [{'shard', 'count', 'lastmod'}] непустых шардов - один запрос с группировкой. '''
+        return list(
+            self.get_queryset().annotate(shard=(F('pk') - 1) / SHARD_SIZE)
+            .values('shard').annotate(**self._aggregates()).order_by('shard')
+        )
+
+    def version(self, shard):
+        ''' (число записей, max(pk), время изменения) шарда; число 0 - шарда нет. Время - max(lastmod)
+        или, для разделов без поля времени, SitemapShard.changed_at.
+        '''
+        values = self.shard_queryset(shard).aggregate(last=Max('pk'), **self._aggregates())
+        if self.lastmod:
+            changed = values['lastmod']
+        else:
+            changed = SitemapShard.objects.filter(section=self.name, shard=shard).values_list(
+                'changed_at', flat=True
+            ).first()
+        return values['count'], values['last'], changed
+
+    def locations(self, shard, site):
+        ''' (адрес, lastmod) записей шарда в порядке pk: адрес - подстановка слагов в шаблон
+        маршрута (reverse один раз на шард), строки читаются блоками по CHUNK_SIZE.
+        '''
+        template = site + reverse(self.url_name, kwargs={name: f'__{name}__' for name in self.url_kwargs})
+        fields = list(self.url_kwargs.values()) + ([self.lastmod] if self.lastmod else [])
+        rows = self.shard_queryset(shard).order_by('pk').values_list(*fields).iterator(chunk_size=CHUNK_SIZE)
+        for row in rows:
+            slugs = row[:len(self.url_kwargs)]
+            if not all(slugs):
+                continue
+            location = template
+            for name, slug in zip(self.url_kwargs, slugs):
+                location = location.replace(f'__{name}__', slug)
+            yield location, row[-1] if self.lastmod else None
+
+
+SECTIONS = {section.name: section for section in (
+    Section('books', ModelBooks, 'audiobook', {'slug': 'slug'}, lastmod='time_update',
+            filters={'is_published': True}),
+    Section('authors', Author, 'author', {'slug': 'slug'}),
+    Section('readers', Reader, 'reader', {'slug': 'slug'}),
+    Section('cycles', Cycle, 'cycle', {'cycle_slug': 'slug'}),
+    Section('categories', ModelCategories, 'category', {'cat_slug': 'slug'}),
+    Section('subcategories', ModelSubcategories, 'subcategory', {'cat_slug': 'category__slug', 'subcat_slug': 'slug'}),
+)}
+
+
+def shard_of(pk):
+    return (pk - 1) // SHARD_SIZE
+
+
+# --- Файлы шардов ---
+
+def _write_shard(path, section, shard, site):
+    ''' Строит файл шарда и возвращает его открытым на чтение - параллельный запрос
+    с более новой версией может удалить файл сразу после переименования.
+    '''
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            file.write(f'{XML_HEADER}<urlset xmlns="{SITEMAP_XMLNS}">\n')
+            for location, lastmod in section.locations(shard, site):
+                file.write(_entry('url', location, lastmod))
+            file.write('</urlset>\n')
+        result = open(temp, 'rb')
+    except BaseException:
+        os.remove(temp)
+        raise
+    os.replace(temp, path)  # читатели видят либо старый файл, либо готовый новый
+    built = os.fstat(result.fileno()).st_mtime_ns
+    prefix = f'{section.name}-{shard}.'
+    for entry in os.scandir(directory):
+        if not entry.name.startswith(prefix) or entry.path == path or entry.name.endswith('.tmp'):
+            continue
+        try:
+            if entry.stat().st_mtime_ns < built:  # прежние версии; более новую не трогаем
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+    return result
+
+
+def open_shard(section, shard, site):
+    ''' (открытый файл, ETag, время изменения) актуальной версии шарда; файл строится,
+    если версия изменилась. None - шард пуст. Открытый файл переживает удаление
+    версии параллельным запросом.
+    '''
+    count, last, changed = section.version(shard)
+    if not count:
+        return None
+    digest = hashlib.md5(repr((site, count, last, changed)).encode(), usedforsecurity=False).hexdigest()[:16]
+    path = os.path.join(sitemap_dir(), f'{section.name}-{shard}.{digest}.xml')
+    try:
+        file = open(path, 'rb')
+    except FileNotFoundError:
+        file = _write_shard(path, section, shard, site)
+    return file, f'"{digest}"', changed
+
+
+async def _file_blocks(file):
+    try:
+        while True:
+            block = await asyncio.to_thread(file.read, MEDIA_BLOCK_SIZE)
+            if not block:
+                break
+            yield block
+    finally:
+        file.close()
+
+
+# --- Представления ---
+
+async def sitemap_index(request):
+    ''' Индекс карты сайта: по ссылке на каждый непустой шард каждого раздела. '''
+    site = base_url(request)
+    parts = [f'{XML_HEADER}<sitemapindex xmlns="{SITEMAP_XMLNS}">\n']
+    for section in SECTIONS.values():
+        for row in await sync_to_async(section.shards)():
+            location = site + reverse('sitemap_section', args=[section.name, row['shard']])
+            parts.append(_entry('sitemap', location, row.get('lastmod')))
+    parts.append('</sitemapindex>\n')
+    response = HttpResponse(''.join(parts), content_type=CONTENT_TYPE)
+    response['Cache-Control'] = f'public, max-age={SITEMAP_MAX_AGE}'
+    return response
+
+
+async def sitemap_section(request, section, shard):
+    ''' Шард раздела: готовый файл с диска или построенный заново (см. модуль). '''
+    section = SECTIONS.get(section)
+    if section is None:
+        raise Http404("Нет такого раздела")
+    opened = await sync_to_async(open_shard)(section, shard, base_url(request))
+    if opened is None:
+        raise Http404("Нет такого шарда")
+    file, etag, lastmod = opened
+    last_modified = int(lastmod.timestamp()) if lastmod else None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        file.close()
+    elif isinstance(request, ASGIRequest):
+        response = StreamingHttpResponse(_file_blocks(file), content_type=CONTENT_TYPE)
+        response['Content-Length'] = os.fstat(file.fileno()).st_size
+    else:
+        response = MediaFileResponse(file, content_type=CONTENT_TYPE)  # sendfile через wsgi.file_wrapper
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = f'public, max-age={SITEMAP_MAX_AGE}'
+    return response
+
+
+# --- Время изменения шардов разделов без time_update ---
+
+_SECTION_OF = {section.model: section.name for section in SECTIONS.values() if not section.lastmod}
+
+
+def touch_shards(section, pks):
+    ''' Отмечает изменёнными шарды раздела section, в которые попадают записи pks (один запрос). '''
+    now = timezone.now()
+    SitemapShard.objects.bulk_create(
+        [SitemapShard(section=section, shard=shard, changed_at=now) for shard in {shard_of(pk) for pk in pks}],
+        update_conflicts=True, unique_fields=['section', 'shard'], update_fields=['changed_at'],
+    )
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Reader)
+@receiver(post_save, sender=Cycle)
+@receiver(post_save, sender=ModelCategories)
+@receiver(post_save, sender=ModelSubcategories)
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Reader)
+@receiver(post_delete, sender=Cycle)
+@receiver(post_delete, sender=ModelCategories)
+@receiver(post_delete, sender=ModelSubcategories)
+def sitemap_changed(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None:
+        return
+    touch_shards(_SECTION_OF[sender], [instance.pk])
+    if sender is ModelCategories:
+        # Адреса поджанров содержат слаг жанра
+        pks = list(ModelSubcategories.objects.filter(category_id=instance.pk).values_list('pk', flat=True))
+        if pks:
+            touch_shards('subcategories', pks)
@@ -0,0 +1,191 @@
+# D:\Python\myProject\Bookland\apps\bookland\storage.py
+
+'''Файловое хранилище загрузок с дедупликацией по содержимому.
+
+Одна и та же обложка, текст .fb2 или аудиочасть, загруженные к разным изданиям
+книги, лежат на диске один раз. Содержимое хешируется (SHA-256) при записи -
+потоком, без чтения файла в память - и сохраняется как блоб
+.blobs/ab/cd/<sha256>, а привычное имя (generate_file_name) - жёсткая ссылка на
+блоб. Счётчик ссылок ведёт файловая система (st_nlink): блоб с единственной
+ссылкой (своей) не нужен ни одному файлу и удаляется сборкой мусора
+(manage.py media_dedup --gc). Отдача файлов, sendfile, file.path и удаление
+работают с именами как с обычными файлами.
+
+На файловой системе без жёстких ссылок имя получает копию блоба.
+Файлы по именам не должны меняться на месте - это изменило бы все копии.
+
+    STORAGES = {'default': {
+        'BACKEND': 'bookland.storage.DedupFileSystemStorage',
+        'OPTIONS': {'blob_dir': '.blobs'},
+    }, ...}
+'''
+
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+
+HASH_BLOCK_SIZE = 1024 * 1024
+GC_GRACE_SECONDS = 3600  # Блоб моложе не удаляется: его могли записать, но ещё не связать с именем
+
+
+def _hash_file(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+class DedupFileSystemStorage(FileSystemStorage):
+    def __init__(self, *args, blob_dir='.blobs', **kwargs):
+        super().__init__(*args, **kwargs)
+        self.blob_dir = blob_dir
+
+    @property
+    def blob_root(self):
+        return os.path.join(self.location, self.blob_dir)
+
+    def blob_path(self, digest):
+        return os.path.join(self.blob_root, digest[:2], digest[2:4], digest)
+
+    def _makedirs(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        if self.directory_permissions_mode is not None:
+            os.chmod(directory, self.directory_permissions_mode)
+
+    def _spool(self, content):
+        ''' Временный файл с содержимым в каталоге блобов и его SHA-256. '''
+        self._makedirs(os.path.join(self.blob_root, 'tmp'))
+        if hasattr(content, 'temporary_file_path'):
+            # Файл уже на диске (большая загрузка, загрузка частями) - перемещается, а не копируется;
+            # хеш, посчитанный при загрузке (sha256), не пересчитывается
+            return getattr(content, 'sha256', None) or _hash_file(content.temporary_file_path()), \
+                content.temporary_file_path()
+        fd, temp = tempfile.mkstemp(dir=os.path.join(self.blob_root, 'tmp'))
+        hasher = hashlib.sha256()
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    hasher.update(chunk)
+                    file.write(chunk)
+        except BaseException:
+            os.remove(temp)
+            raise
+        return hasher.hexdigest(), temp
+
+    def _save(self, name, content):
+        digest, temp = self._spool(content)
+        blob = self.blob_path(digest)
+        full_path = self.path(name)
+        try:
+            self._makedirs(os.path.dirname(blob))
+            self._makedirs(os.path.dirname(full_path))
+            while True:
+                if temp is not None and not os.path.exists(blob):
+                    file_move_safe(temp, blob, allow_overwrite=True)  # одинаковое содержимое - перезапись безопасна
+                    temp = None
+                try:
+                    self._link(blob, full_path)
+                except FileExistsError:
+                    name = self.get_available_name(name)
+                    full_path = self.path(name)
+                except FileNotFoundError:
+                    if temp is None:
+                        raise
+                    # блоб удалила сборка мусора между проверкой и ссылкой - записываем заново
+                else:
+                    break
+        finally:
+            if temp is not None and os.path.exists(temp):
+                os.remove(temp)
+
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+        name = os.path.relpath(full_path, self.location)
+        self._ensure_location_group_id(full_path)
+        return str(name).replace('\\', '/')
+
+    def _link(self, blob, path):
+        try:
+            os.link(blob, path)
+        except (FileExistsError, FileNotFoundError):
+            raise
+        except OSError:  # файловая система без жёстких ссылок
+            with open(blob, 'rb') as source, open(path, 'xb') as target:
+                shutil.copyfileobj(source, target, HASH_BLOCK_SIZE)
+
+    def _blobs(self):
+        for root, directories, files in os.walk(self.blob_root):
+            if root == self.blob_root and 'tmp' in directories:
+                directories.remove('tmp')
+            for file in files:
+                path = os.path.join(root, file)
+                yield path, os.stat(path)
+
+    def usage(self):
+        ''' {'blobs', 'links', 'stored_bytes', 'logical_bytes', 'saved_bytes'}: сколько занимают
+        блобы и сколько заняли бы файлы по именам без дедупликации.
+        '''
+        blobs = links = stored = logical = 0
+        for _, info in self._blobs():
+            blobs += 1
+            links += info.st_nlink - 1
+            stored += info.st_size
+            logical += info.st_size * (info.st_nlink - 1)
+        return {
+            'blobs': blobs, 'links': links, 'stored_bytes': stored,
+            'logical_bytes': logical, 'saved_bytes': max(logical - stored, 0),
+        }
+
+    def collect_garbage(self, grace=GC_GRACE_SECONDS, dry_run=False):
+        ''' Удаляет блобы без имён и брошенные временные файлы старше grace секунд.
+        Возвращает (число файлов, байт). Если имя появится у блоба между проверкой и
+        удалением, файл по имени не пострадает (данные держит ссылка), он лишь перестанет
+        делить место с будущими копиями.
+        '''
+        deadline = time.time() - grace
+        candidates = [(path, info) for path, info in self._blobs() if info.st_nlink == 1]
+        temp_dir = os.path.join(self.blob_root, 'tmp')
+        if os.path.isdir(temp_dir):
+            candidates += [(entry.path, entry.stat()) for entry in os.scandir(temp_dir)]
+        removed = freed = 0
+        for path, info in candidates:
+            if info.st_mtime > deadline:
+                continue
+            if not dry_run:
+                os.remove(path)
+            removed += 1
+            freed += info.st_size
+        return removed, freed
+
+    def adopt(self, directories, skip_suffixes=('.part',)):
+        ''' Переводит на блобы файлы, сохранённые до дедупликации (в каталогах directories -
+        имена относительно хранилища). Возвращает (файлов, освобождено байт).
+        '''
+        adopted = freed = 0
+        for directory in directories:
+            for root, _, files in os.walk(self.path(directory)):
+                for file in files:
+                    path = os.path.join(root, file)
+                    info = os.stat(path)
+                    if file.endswith(skip_suffixes) or info.st_nlink > 1:  # .part ещё дописывается
+                        continue
+                    blob = self.blob_path(_hash_file(path))
+                    self._makedirs(os.path.dirname(blob))
+                    try:
+                        os.link(path, blob)
+                    except FileExistsError:
+                        # такое содержимое уже есть - файл заменяется ссылкой на блоб (атомарно)
+                        temp = f"{path}.dedup"
+                        os.link(blob, temp)
+                        os.replace(temp, path)
+                        freed += info.st_size
+                    adopted += 1
+        return adopted, freed
@@ -0,0 +1,13 @@
+# D:\Python\myProject\Bookland\apps\bookland\templatetags\bookland_images.py
+
+from django import template
+
+from bookland.thumbnails import thumbnail_url as _thumbnail_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def thumbnail_url(book_image, size='thumb', fmt='webp'):
+    ''' {% thumbnail_url book_image 'small' %} - URL уменьшенной копии обложки (BookImage, не поле image). '''
+    return _thumbnail_url(book_image, size, fmt)
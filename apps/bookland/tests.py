@@ -1,3 +1,1906 @@
-from django.test import TestCase
+import base64
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+import wave
+import zipfile
+from datetime import timedelta
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from PIL import Image
+
+from .admin import ModelBooksAdmin
+from .api import RESOURCES, Keyset
+from .importer import BookImporter, read_records
+from . import audio_ingest, audio_worker, benchmarks, cache, integrity, profiling, sitemaps, uploads
+from .audio_ingest import open_parts
+from .audio_meta import read_audio_metadata
+from .cache_backends import LRUFileBasedCache
+from .management.commands.bookland_bench import Command as BenchCommand
+from .models import (
+    AdditionalFile, AudioFile, AudioMetadataJob, Author, BookFileNaming, BookImage, BookRating, BookRatingSummary, ChunkedUpload, Cycle,
+    ModelBooks, ModelCategories, ModelSubcategories, Reader, StoredFile, TorrentFile,
+)
+from .search import search_books, search_queryset
+from .storage import DedupFileSystemStorage
+from .thumbnails import derivative_name, derivative_names, thumbnail_url
+from .torrent_meta import read_torrent
+from .utilities import TRANSLIT_DICT, _translit, translit_many, translit_re
+
+
+def translit_reference(input_str):
+    ''' Исходная (до оптимизации) реализация translit_re - эталон для сравнения. '''
+    output_str = ''.join([TRANSLIT_DICT.get(char.lower(), char) for char in input_str])
+    output_str = re.sub('_+', '_', output_str)
+    output_str = output_str.strip('_')
+    output_str = re.sub('-+', '-', output_str)
+    output_str = output_str.strip('-')
+    return output_str.lower()
+
+
+class TranslitTests(SimpleTestCase):
+    # Алфавит для генерации строк: ключи таблицы, их заглавные формы, латиница,
+    # разделители и "неудобные" символы (İ, K-кельвин, ẞ, комбинирующие знаки)
+    ALPHABET = (
+        list(''.join(TRANSLIT_DICT)) + [key.upper() for key in TRANSLIT_DICT]
+        + list('abcXYZ_-__--  ') + ['İ', 'K', 'ẞ', '̑', '̆', '日', '😀']
+    )
+
+    def random_strings(self, count, seed=20241018):
+        rnd = random.Random(seed)
+        for _ in range(count):
+            yield ''.join(rnd.choice(self.ALPHABET) for _ in range(rnd.randint(0, 40)))
+
+    def test_known_values(self):
+        self.assertEqual(translit_re('Мастер и Маргарита'), 'master_i_margarita')
+        self.assertEqual(translit_re('  Щука — «рыба»!  '), 'shchuka_-_ryba')
+        self.assertEqual(translit_re('-_a'), '_a')
+        self.assertEqual(translit_re(''), '')
+
+    def test_equivalent_to_reference(self):
+        for value in self.random_strings(5000):
+            with self.subTest(value=value):
+                self.assertEqual(_translit(value), translit_reference(value))
+                self.assertEqual(translit_re(value), translit_reference(value))
+
+    def test_translit_many(self):
+        values = list(self.random_strings(100, seed=1))
+        self.assertEqual(translit_many(values), [translit_reference(value) for value in values])
+        self.assertEqual(translit_many(iter(values)), translit_many(values))
+
+
+class BookImporterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = ModelCategories.objects.create(name="Классика")
+        cls.subcategory = ModelSubcategories.objects.create(category=cls.category, name="Роман")
+        cls.author = Author.objects.create(surname_nick="Булгаков", name="Михаил", slug="bulgakov")
+        cls.reader = Reader.objects.create(surname_nick="Клюквин", name="Александр", slug="klyukvin")
+        cls.cycle = Cycle.objects.create(name="Москва")
+
+    def test_allocate_slugs(self):
+        ModelBooks.objects.bulk_create([ModelBooks(title="a", slug="master"), ModelBooks(title="b", slug="master-1")])
+        with self.assertNumQueries(1):
+            slugs = ModelBooks.allocate_slugs(["master", "master", "other", "master"])
+        self.assertEqual(slugs, ["master-2", "master-3", "other", "master-4"])
+
+    def test_import_jsonl(self):
+        lines = [
+            json.dumps({
+                "title": "Мастер и Маргарита", "authors": [self.author.slug], "readers": self.reader.slug,
+                "subcategories": self.subcategory.slug, "year": 1966, "work_type": "cycle",
+                "cycle": self.cycle.slug, "cycle_number": "1",
+            })
+            for _ in range(30)
+        ]
+        lines.append(json.dumps({"title": "Без автора", "authors": "nobody"}))
+        importer = BookImporter(chunk_size=10)
+        result = importer.run(read_records(io.StringIO("\n".join(lines)), "jsonl"))
+
+        self.assertEqual(result["created"], 30)
+        self.assertEqual([index for index, _ in result["errors"]], [31])
+        slugs = set(ModelBooks.objects.values_list("slug", flat=True))
+        self.assertEqual(len(slugs), 30)
+        self.assertIn("master-i-margarita-29", slugs)
+        book = ModelBooks.objects.get(slug="master-i-margarita")
+        self.assertEqual(list(book.authors.all()), [self.author])
+        self.assertEqual(list(book.readers.all()), [self.reader])
+        self.assertEqual(list(book.book_subcategories.all()), [self.subcategory])
+        self.assertEqual(book.cycle, self.cycle)
+
+    def test_slug_taken_by_parallel_import(self):
+        ModelBooks.objects.bulk_create([ModelBooks(title="Мастер", slug="master")])
+        allocate = ModelBooks.allocate_slugs
+        calls = []
+
+        def stale_then_fresh(bases):
+            # Первый подбор видит базу до коммита параллельного импорта, занявшего "master"
+            calls.append(bases)
+            return ["master"] if len(calls) == 1 else allocate(bases)
+
+        with mock.patch.object(ModelBooks, "allocate_slugs", side_effect=stale_then_fresh):
+            result = BookImporter().run([{"title": "Мастер"}])
+        self.assertEqual((result["created"], len(calls)), (1, 2))
+        self.assertTrue(ModelBooks.objects.filter(slug="master-1").exists())
+
+    def test_explicit_slug_validated(self):
+        records = [{"title": "A", "slug": "x" * 111}, {"title": "B", "slug": "не слаг"}, {"title": "C", "slug": "c"}]
+        result = BookImporter().run(records)
+        self.assertEqual(result["created"], 1)
+        self.assertEqual([index for index, _ in result["errors"]], [1, 2])
+
+    def test_import_updates_genre_counters_and_pages(self):
+        page = self.author.slug
+        before = async_to_sync(cache.generation)("authors", page)
+        lines = [json.dumps({"title": f"Бег {i}", "authors": page, "subcategories": self.subcategory.slug}) for i in range(3)]
+        BookImporter().run(read_records(io.StringIO("\n".join(lines)), "jsonl"))
+
+        self.subcategory.refresh_from_db()
+        self.category.refresh_from_db()
+        self.assertEqual((self.subcategory.total_books, self.subcategory.published_books), (3, 3))
+        self.assertEqual(self.category.total_books, 3)
+        self.assertNotEqual(async_to_sync(cache.generation)("authors", page), before)
+        with self.assertRaises(ValidationError):  # защита от удаления поджанра с книгами видит импорт
+            self.subcategory.delete()
+
+    def test_import_chunk_query_count(self):
+        rows = "title,authors,readers\n" + "".join(
+            f"Книга {i % 3},{self.author.slug},{self.reader.slug}\n" for i in range(50)
+        )
+        importer = BookImporter()
+        importer.slug_maps["authors"][self.author.slug] = self.author.pk
+        importer.slug_maps["readers"][self.reader.slug] = self.reader.pk
+        # подбор слагов + INSERT книг + INSERT связей с авторами и чтецами (+ SAVEPOINT/RELEASE)
+        # + поисковый индекс: книги, авторы, чтецы, DELETE, INSERT
+        with self.assertNumQueries(11):
+            importer.run(read_records(io.StringIO(rows), "csv"))
+
+
+class GenreTreeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.prose = ModelCategories.objects.create(name="Проза")
+        cls.poetry = ModelCategories.objects.create(name="Поэзия")
+        cls.satire = ModelSubcategories.objects.create(category=cls.prose, name="Сатира")
+        cls.drama = ModelSubcategories.objects.create(category=cls.prose, name="Драма")
+        cls.lyrics = ModelSubcategories.objects.create(category=cls.poetry, name="Лирика")
+        cls.books = [ModelBooks.objects.create(title=f"Книга {i}", slug=f"genre-book-{i}") for i in range(3)]
+
+    def counts(self, obj):
+        obj.refresh_from_db()
+        return obj.total_books, obj.published_books
+
+    def test_counts_follow_m2m_changes(self):
+        first, second, third = self.books
+        first.book_subcategories.add(self.satire, self.drama)
+        second.book_subcategories.add(self.satire)
+        self.drama.modelbooks_set.add(third)
+        self.assertEqual(self.counts(self.satire), (2, 2))
+        self.assertEqual(self.counts(self.drama), (2, 2))
+        self.assertEqual(self.counts(self.prose), (3, 3))  # книга в двух поджанрах жанра считается один раз
+
+        first.book_subcategories.remove(self.drama)
+        self.assertEqual(self.counts(self.drama), (1, 1))
+        self.assertEqual(self.counts(self.prose), (3, 3))
+        first.book_subcategories.clear()
+        self.satire.modelbooks_set.clear()
+        self.assertEqual(self.counts(self.satire), (0, 0))
+        self.assertEqual(self.counts(self.prose), (1, 1))
+
+    def test_counts_follow_publication_and_deletion(self):
+        first, second, _ = self.books
+        first.book_subcategories.add(self.lyrics)
+        second.book_subcategories.add(self.lyrics)
+        first.is_published = False
+        first.save()
+        self.assertEqual(self.counts(self.lyrics), (2, 1))
+        self.assertEqual(self.counts(self.poetry), (2, 1))
+        second.delete()
+        self.assertEqual(self.counts(self.lyrics), (1, 0))
+
+        self.lyrics.category = self.prose
+        self.lyrics.save()
+        self.assertEqual(self.counts(self.poetry), (0, 0))
+        self.assertEqual(self.counts(self.prose), (1, 0))
+
+    def test_tree_in_one_query(self):
+        self.books[0].book_subcategories.add(self.satire)
+        with self.assertNumQueries(1):
+            tree = ModelCategories.tree()
+        self.assertEqual([category["name"] for category in tree], ["Поэзия", "Проза"])
+        self.assertEqual(tree[1]["books_count"], 1)
+        self.assertEqual(
+            tree[1]["subcategories"],
+            [{"slug": self.drama.slug, "name": "Драма", "books_count": 0},
+             {"slug": self.satire.slug, "name": "Сатира", "books_count": 1}],
+        )
+
+    def test_delete_guards(self):
+        self.books[0].book_subcategories.add(self.satire)
+        with self.assertRaisesMessage(ValidationError, "связаны книги"):
+            self.satire.delete()
+        with self.assertNumQueries(1), self.assertRaisesMessage(ValidationError, "Сатира"):
+            self.prose.delete()
+        with self.assertRaisesMessage(ValidationError, "связаны подкатегории"):
+            self.poetry.delete()
+        self.drama.delete()
+        self.assertFalse(ModelSubcategories.objects.filter(pk=self.drama.pk).exists())
+
+    def test_recount_command(self):
+        self.books[0].book_subcategories.add(self.satire)
+        ModelSubcategories.objects.update(total_books=7, published_books=7)
+        ModelCategories.objects.update(total_books=7, published_books=7)
+        call_command("recount_genres", stdout=io.StringIO())
+        self.assertEqual(self.counts(self.satire), (1, 1))
+        self.assertEqual(self.counts(self.poetry), (0, 0))
+
+
+class SqliteBackendTests(SimpleTestCase):
+    def wrapper(self, path, **options):
+        from .sqlite.base import DatabaseWrapper
+
+        settings_dict = {**connection.settings_dict, "ENGINE": "bookland.sqlite", "NAME": path, "OPTIONS": options}
+        wrapper = DatabaseWrapper(settings_dict, alias="sqlite-profile")
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def test_pragmas_applied_on_connect(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        wrapper = self.wrapper(os.path.join(directory.name, "db.sqlite3"), timeout=3, pragmas={"cache_size": -1000})
+        with wrapper.cursor() as cursor:
+            pragmas = {
+                name: cursor.execute(f"PRAGMA {name}").fetchone()[0]
+                for name in ("journal_mode", "synchronous", "busy_timeout", "cache_size", "foreign_keys")
+            }
+        self.assertEqual(pragmas, {
+            "journal_mode": "wal", "synchronous": 1, "busy_timeout": 3000, "cache_size": -1000, "foreign_keys": 1,
+        })
+
+    def test_atomic_takes_write_lock_immediately(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "db.sqlite3")
+        wrapper = self.wrapper(path)
+        with wrapper.cursor() as cursor:
+            cursor.execute("CREATE TABLE t (x INTEGER)")
+        other = sqlite3.connect(path, timeout=0, isolation_level=None)
+        self.addCleanup(other.close)
+        wrapper._start_transaction_under_autocommit()  # так транзакцию начинает atomic()
+        with self.assertRaisesMessage(sqlite3.OperationalError, "locked"):
+            other.execute("BEGIN IMMEDIATE")
+        wrapper.cursor().execute("ROLLBACK")
+
+
+class MigrationTests(TestCase):
+    def test_models_match_migrations(self):
+        # Изменение схемы без миграции: makemigrations --check завершается с ошибкой
+        call_command("makemigrations", "bookland", check=True, dry_run=True, stdout=io.StringIO())
+
+
+class QueryPlanTests(TestCase):
+    ''' Горячие запросы должны идти по индексам: без полного просмотра таблицы и без сортировки во временном B-дереве. '''
+
+    def hot_queries(self):
+        books = RESOURCES["books"]
+        order = books.keyset.order_by()
+        return {
+            "каталог": books.get_queryset().order_by(*order)[:20],
+            "каталог, следующая страница": books.get_queryset().filter(books.keyset.after([2000, "Б", 5])).order_by(*order)[:20],
+            "админка книг": ModelBooks.objects.select_related("cycle").order_by(*ModelBooksAdmin.ordering, "-pk")[:100],
+            "книги цикла": ModelBooks.objects.filter(cycle_id=1).order_by(),  # индекс cycle_id заменён составным
+            "аудиофайлы книги": AudioFile.objects.filter(book_id=1).order_by("book", "order"),
+            "оценки книги": BookRating.objects.filter(book_id=1).order_by("created_at"),
+            "лента новых книг": ModelBooks.objects.filter(is_published=True).order_by("-time_create", "-id")[:50],
+        }
+
+    def test_hot_queries_use_indexes(self):
+        full_scan = re.compile(r"\bSCAN (\w+)$")  # "SCAN t USING INDEX ..." - обход индекса, не таблицы
+        for name, queryset in self.hot_queries().items():
+            with self.subTest(name):
+                plan = queryset.explain()
+                for line in plan.splitlines():
+                    self.assertIsNone(full_scan.search(line), f"Полный просмотр таблицы:\n{plan}")
+                    self.assertNotIn("TEMP B-TREE", line, f"Сортировка без индекса:\n{plan}")
+
+
+class FileCountersTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = Reader.objects.create(surname_nick="Клюквин", slug="klyukvin")
+        cls.book = ModelBooks.objects.create(title="Book", slug="book")
+
+    def test_counters_follow_files(self):
+        audio = [AudioFile.objects.create(book=self.book, file=f"{i}.mp3") for i in range(3)]
+        TorrentFile.objects.create(book=self.book, reader=self.reader, file="book.torrent")
+        BookImage.objects.create(book=self.book, image="cover.jpg")
+        AdditionalFile.objects.create(book=self.book, file="book.fb2")
+        audio[0].delete()
+
+        self.book.refresh_from_db()
+        self.assertEqual(
+            [getattr(self.book, field) for field in ModelBooks.COUNTER_FIELDS], [1, 2, 1, 1]
+        )
+
+    def test_book_save_keeps_counters(self):
+        stale = ModelBooks.objects.get(pk=self.book.pk)
+        AudioFile.objects.create(book=self.book, file="1.mp3")
+        stale.title = "Book 2"
+        # проверка уникальности слага (full_clean) + UPDATE + страницы для сброса кэша (название изменилось)
+        with self.assertNumQueries(3):
+            stale.save()
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.total_audio_files, 1)
+
+    def test_deferred_querysets_do_not_load_book(self):
+        other = ModelBooks.objects.create(title="Other", slug="other")
+        for i in range(5):
+            TorrentFile.objects.create(book=self.book, reader=self.reader, file=f"{i}.torrent")
+            BookImage.objects.create(book=self.book, image=f"{i}.jpg")
+        with self.assertNumQueries(1):
+            torrents = list(TorrentFile.objects.only("pk", "file"))
+        with self.assertNumQueries(1):
+            list(BookImage.objects.only("pk"))
+        self.assertEqual(len(torrents), 5)
+
+        # Исходная книга отложенного поля дочитывается при сохранении - счётчики переносятся верно
+        torrents[0].book = other
+        torrents[0].save()
+        torrents[1].delete()
+        self.book.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.book.total_torrent_files, other.total_torrent_files), (3, 1))
+
+    def test_recount_counters(self):
+        AudioFile.objects.create(book=self.book, file="1.mp3")
+        ModelBooks.objects.filter(pk=self.book.pk).update(total_audio_files=7, total_images=2)
+        self.assertEqual(list(ModelBooks.counter_drift().values_list("pk", flat=True)), [self.book.pk])
+
+        call_command("recount_counters", stdout=io.StringIO())
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.total_audio_files, self.book.total_images), (1, 0))
+        self.assertFalse(ModelBooks.counter_drift().exists())
+
+
+class AdminQueryCountTests(TestCase):
+    ''' Число запросов страниц админки не должно зависеть от размера каталога. '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser("admin", "admin@example.com", "password")
+        cls.cycle = Cycle.objects.create(name="Цикл")
+        cls.authors = [Author.objects.create(surname_nick=f"Автор{i}", slug=f"author-{i}") for i in range(2)]
+
+    def setUp(self):
+        self.client.force_login(self.admin_user)
+
+    def add_books(self, count):
+        for _ in range(count):
+            book = ModelBooks.objects.create(title="Книга", work_type="cycle", cycle=self.cycle)
+            book.authors.set(self.authors)
+            AudioFile.objects.create(book=book, file="part.mp3")
+            BookImage.objects.create(book=book, image="cover.jpg")
+            AdditionalFile.objects.create(book=book, file="book.fb2", file_type="fb2")
+
+    def assertConstantQueries(self, url):
+        self.add_books(2)
+        self.client.get(url)  # прогрев кешей (ContentType и т.п.)
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.add_books(8)
+        with self.assertNumQueries(len(small)):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_books_changelist(self):
+        self.assertConstantQueries(reverse("admin:bookland_modelbooks_changelist"))
+
+    def test_audio_changelist(self):
+        self.assertConstantQueries(reverse("admin:bookland_audiofile_changelist"))
+
+    def test_image_changelist(self):
+        self.assertConstantQueries(reverse("admin:bookland_bookimage_changelist"))
+
+    def test_additional_file_changelist(self):
+        self.assertConstantQueries(reverse("admin:bookland_additionalfile_changelist"))
+
+    def test_audio_add_form(self):
+        self.assertConstantQueries(reverse("admin:bookland_audiofile_add"))
+
+    def test_book_autocomplete(self):
+        url = reverse("admin:autocomplete") + "?app_label=bookland&model_name=audiofile&field_name=book&term=Кн"
+        self.assertConstantQueries(url)
+
+    def test_book_change_form(self):
+        self.add_books(1)
+        book = ModelBooks.objects.get()
+        reader = Reader.objects.create(surname_nick="Чтецов", slug="chtetsov")
+        book.readers.add(reader)
+        TorrentFile.objects.create(book=book, reader=reader, file="book.torrent")
+        url = reverse("admin:bookland_modelbooks_change", args=[book.pk])
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+        # Каталог растёт - страница книги не загружает всех авторов, чтецов и жанры
+        Author.objects.bulk_create(Author(surname_nick=f"Другой{i}", slug=f"other-{i}") for i in range(200))
+        Reader.objects.bulk_create(Reader(surname_nick=f"Голос{i}", slug=f"voice-{i}") for i in range(200))
+        category = ModelCategories.objects.create(name="Жанр", slug="genre")
+        ModelSubcategories.objects.bulk_create(
+            ModelSubcategories(category=category, name=f"Поджанр{i}", slug=f"sub-{i}") for i in range(50)
+        )
+        with self.assertNumQueries(len(small)):
+            response = self.client.get(url)
+        self.assertNotContains(response, "Другой1")
+        self.assertNotContains(response, "Голос1")
+        self.assertContains(response, "Автор0")  # выбранные значения - на странице
+
+    def test_authors_str_annotation(self):
+        self.add_books(1)
+        book = ModelBooks.objects.with_authors_str().get()
+        with self.assertNumQueries(0):
+            self.assertEqual(str(book), "Книга | Автор0, Автор1")
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Индекс обновляется после фиксации транзакции
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.create_books()
+
+    @classmethod
+    def create_books(cls):
+        cls.author = Author.objects.create(surname_nick="Булгаков", name="Михаил", slug="bulgakov")
+        cls.reader = Reader.objects.create(surname_nick="Клюквин", slug="klyukvin")
+        cls.cycle = Cycle.objects.create(name="Московские истории")
+        cls.master = ModelBooks.objects.create(
+            title="Мастер и Маргарита", work_type="cycle", cycle=cls.cycle, description="Роман о дьяволе"
+        )
+        cls.master.authors.add(cls.author)
+        cls.master.readers.add(cls.reader)
+        cls.heart = ModelBooks.objects.create(title="Собачье сердце")
+        cls.heart.authors.add(cls.author)
+        cls.hidden = ModelBooks.objects.create(title="Мастер на все руки", is_published=False)
+
+    def test_search_books(self):
+        self.assertEqual(search_books("маргарита"), [self.master])
+        self.assertEqual(search_books("Марг"), [self.master])  # префикс
+        self.assertEqual(search_books("margarita"), [self.master])  # транслитерация
+        self.assertEqual(search_books("клюквин мастер"), [self.master])
+        self.assertEqual(search_books("московские"), [self.master])
+        self.assertEqual(search_books("дьяволе"), [self.master])
+        self.assertEqual(set(search_books("bulgakov")), {self.master, self.heart})
+        self.assertEqual(search_books("мастер"), [self.master])  # неопубликованная не попадает
+        self.assertEqual(search_books('"*'), [])
+
+    def test_ranking(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            other = ModelBooks.objects.create(title="Записки", description="упоминается сердце")
+        self.assertEqual(search_books("сердце"), [self.heart, other])
+
+    def test_index_follows_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.surname_nick = "Bulgakoff"
+            self.author.save()
+        self.assertEqual(set(search_books("bulgakoff")), {self.master, self.heart})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.heart.authors.clear()
+        self.assertEqual(search_books("bulgakoff"), [self.master])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cycle.delete()
+        self.assertEqual(search_books("московские"), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.master.delete()
+        self.assertEqual(search_books("маргарита"), [])
+
+    def test_reindex_once_per_transaction(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.heart.title = "Собачье сердце (ред.)"
+            self.heart.save()
+            self.heart.readers.add(self.reader)
+        # книга + авторы + чтецы + DELETE + INSERT
+        with self.assertNumQueries(5):
+            for callback in callbacks:
+                callback()
+        self.assertCountEqual(search_books("клюквин"), [self.master, self.heart])
+
+    def test_admin_and_endpoint(self):
+        self.assertCountEqual(search_queryset(ModelBooks.objects.all(), "мастер"), [self.hidden, self.master])
+        response = self.client.get(reverse("search"), {"q": "сердце"})
+        self.assertEqual(response.json()["results"][0]["slug"], self.heart.slug)
+
+
+class RatingSummaryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(f"user{i}") for i in range(3)]
+        cls.book = ModelBooks.objects.create(title="Book", slug="book")
+        cls.other = ModelBooks.objects.create(title="Other", slug="other")
+
+    def rate(self, user, book=None, **scores):
+        return BookRating.objects.create(user=user, book=book or self.book, **scores)
+
+    def summary(self, book=None):
+        return BookRatingSummary.objects.get(book=book or self.book)
+
+    def test_incremental_summary(self):
+        first = self.rate(self.users[0], overall_score=5, narration_score=4, would_recommend=True)
+        self.rate(self.users[1], overall_score=3, plot_score=2, length_feedback="too_long")
+        summary = self.summary()
+        self.assertEqual((summary.ratings_count, summary.overall_votes, summary.overall_sum), (2, 2, 8))
+        self.assertEqual((summary.overall_mean, summary.narration_mean, summary.plot_mean), (4.0, 4.0, 2.0))
+        self.assertEqual((summary.perfect_count, summary.too_long_count), (1, 1))
+        self.assertEqual(summary.recommend_ratio, 0.5)
+        self.assertAlmostEqual(summary.bayesian_score, (10 * 3.0 + 8) / 12)
+        self.assertEqual(self.book.get_average_rating(), 4.0)
+
+        first.overall_score = 1
+        first.would_recommend = False
+        first.save()
+        summary = self.summary()
+        self.assertEqual((summary.ratings_count, summary.overall_mean, summary.recommend_count), (2, 2.0, 0))
+
+        first.delete()
+        summary = self.summary()
+        self.assertEqual((summary.ratings_count, summary.overall_mean, summary.narration_votes), (1, 3.0, 0))
+
+    def test_deferred_rating_keeps_summary(self):
+        self.rate(self.users[0], overall_score=5)
+        with self.assertNumQueries(1):
+            rating = BookRating.objects.only("pk", "overall_score").get()
+        rating.overall_score = 3
+        rating.save()
+        self.assertEqual((self.summary().ratings_count, self.summary().overall_sum), (1, 3))
+        BookRating.objects.defer("book").get().delete()
+        self.assertEqual(self.summary().ratings_count, 0)
+
+    def test_rebuild_matches_incremental(self):
+        for i, user in enumerate(self.users):
+            self.rate(user, overall_score=i + 3, quality_score=i, would_recommend=bool(i))
+            self.rate(user, book=self.other, overall_score=5, length_feedback="too_short")
+        fields = [field.name for field in BookRatingSummary._meta.fields]
+        incremental = list(BookRatingSummary.objects.order_by("book").values_list(*fields))
+
+        call_command("recount_ratings", stdout=io.StringIO())
+        self.assertEqual(list(BookRatingSummary.objects.order_by("book").values_list(*fields)), incremental)
+
+    def test_top_rated(self):
+        self.rate(self.users[0], overall_score=5)
+        for user in self.users:
+            self.rate(user, book=self.other, overall_score=5)
+        with self.assertNumQueries(1):
+            self.assertEqual([summary.book for summary in BookRatingSummary.top_rated()], [self.other, self.book])
+
+    def test_book_delete(self):
+        self.rate(self.users[0], overall_score=5)
+        self.book.delete()
+        self.assertFalse(BookRatingSummary.objects.exists())
+
+
+class SyntheticStream:
+    ''' Поток из size байт, генерируемых на лету (без буфера на весь объём); hasher - контрольная сумма. '''
+
+    def __init__(self, size, hasher):
+        self.remaining = size
+        self.pattern = hashlib.sha256(str(size).encode()).digest() * 2048  # 64 КБ
+        self.hasher = hasher
+
+    def read(self, n):
+        block = self.pattern[:min(n, self.remaining)]
+        self.remaining -= len(block)
+        self.hasher.update(block)
+        return block
+
+
+class ChunkedUploadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_superuser("admin", "admin@example.com", "password")
+        cls.reader = Reader.objects.create(surname_nick="Клюквин", slug="klyukvin")
+        cls.book = ModelBooks.objects.create(title="Book", slug="book")
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        self.settings_override = self.settings(MEDIA_ROOT=self.media.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.client.force_login(self.staff)
+
+    def start(self, data, **extra):
+        payload = {"kind": "audio", "book": self.book.pk, "filename": "part.mp3", "size": len(data)}
+        payload.update(extra)
+        response = self.client.post(reverse("upload_start"), payload, content_type="application/json")
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()["id"]
+
+    def put(self, upload_id, data, start):
+        return self.client.put(
+            reverse("upload_chunk", args=[upload_id]), data, content_type="application/octet-stream",
+            HTTP_CONTENT_RANGE=f"bytes {start}-{start + len(data) - 1}/*",
+        )
+
+    def test_upload_in_chunks(self):
+        data = os.urandom(300_000)
+        upload_id = self.start(data, sha256=hashlib.sha256(data).hexdigest())
+        self.assertEqual(self.put(upload_id, data[:100_000], 0).json()["offset"], 100_000)
+        self.assertEqual(self.put(upload_id, data[:100_000], 0).status_code, 409)  # повтор той же части
+
+        uploads._hashers.clear()  # часть пришла в другой процесс - хеш посчитается по файлу при завершении
+        self.assertEqual(self.client.get(reverse("upload_chunk", args=[upload_id])).json()["offset"], 100_000)
+        response = self.put(upload_id, data[100_000:], 100_000)
+        self.assertEqual(response.json()["status"], "complete")
+
+        audio = AudioFile.objects.get(pk=response.json()["object_id"])
+        self.assertTrue(audio.file.name.startswith("uploads/audio_files/"))
+        with audio.file.open("rb") as file:
+            self.assertEqual(file.read(), data)
+        self.assertEqual(os.listdir(os.path.dirname(audio.file.path)), [os.path.basename(audio.file.name)])
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.total_audio_files, 1)
+
+    def test_parallel_part_is_rejected(self):
+        data = os.urandom(1000)
+        upload_id = self.start(data)
+        # Часть с того же байта принимает другой процесс - аренда сессии занята
+        ChunkedUpload.objects.filter(pk=upload_id).update(writing_until=timezone.now() + timedelta(minutes=1))
+        self.assertEqual(self.put(upload_id, data, 0).status_code, 409)
+        self.assertEqual(os.path.getsize(uploads.part_path(ChunkedUpload.objects.get(pk=upload_id))), 0)
+
+        # Аренда упавшего процесса истекает
+        ChunkedUpload.objects.filter(pk=upload_id).update(writing_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.put(upload_id, data, 0).json()["status"], "complete")
+
+    def test_single_finish(self):
+        data = os.urandom(1000)
+        upload_id = self.start(data)
+        url = reverse("upload_chunk", args=[upload_id])
+        digest, racing = uploads._digest, []
+
+        def finish_concurrently(upload):
+            # Пока первый запрос завершает загрузку, приходят повтор последней части и пустая часть
+            racing.append(self.put(upload_id, data, 0).status_code)
+            racing.append(self.client.put(url, b"", content_type="application/octet-stream").status_code)
+            return digest(upload)
+
+        with mock.patch.object(uploads, "_digest", side_effect=finish_concurrently):
+            self.assertEqual(self.put(upload_id, data, 0).json()["status"], "complete")
+        self.assertEqual(racing, [409, 409])
+        self.assertEqual(self.client.put(url, b"", content_type="application/octet-stream").status_code, 409)
+        self.assertEqual(AudioFile.objects.count(), 1)
+
+    def test_failed_finish_can_be_retried(self):
+        data = os.urandom(1000)
+        upload_id = self.start(data)
+        with mock.patch.object(uploads, "_digest", side_effect=OSError("disk")), self.assertRaises(OSError):
+            self.put(upload_id, data, 0)
+        upload = ChunkedUpload.objects.get(pk=upload_id)
+        self.assertEqual((upload.status, upload.offset, upload.writing_until), ("active", 1000, None))
+
+        url = reverse("upload_chunk", args=[upload_id])
+        response = self.client.put(url, b"", content_type="application/octet-stream")
+        self.assertEqual(response.json()["status"], "complete")
+        self.assertEqual(AudioFile.objects.count(), 1)
+
+    def test_abandoned_hashers_evicted(self):
+        uploads._hashers["abandoned"] = (10, hashlib.sha256(), time.monotonic() - uploads.UPLOAD_HASHER_TTL - 1)
+        self.start(b"x")
+        self.assertNotIn("abandoned", uploads._hashers)
+
+    def test_hash_mismatch(self):
+        data = b"x" * 1000
+        upload_id = self.start(data, sha256="0" * 64)
+        self.assertEqual(self.put(upload_id, data, 0).status_code, 400)
+        self.assertFalse(AudioFile.objects.exists())
+        self.assertFalse(ChunkedUpload.objects.exists())
+
+    def test_validation(self):
+        response = self.client.post(
+            reverse("upload_start"), {"kind": "audio", "book": self.book.pk, "filename": "x.exe", "size": 1},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse("upload_chunk", args=[uuid.uuid4()])).status_code, 403)
+
+    def test_memory_stays_flat(self):
+        # Размер синтетического файла: BOOKLAND_UPLOAD_TEST_SIZE (например, 2147483648 для 2 ГБ)
+        size = int(os.environ.get("BOOKLAND_UPLOAD_TEST_SIZE", 64 * 1024 * 1024))
+        chunk = 16 * 1024 * 1024
+        upload = uploads.start_upload("torrent", self.book, "book.torrent", size, reader=self.reader)
+        expected = hashlib.sha256()
+        tracemalloc.start()
+        try:
+            for start in range(0, size, chunk):
+                length = min(chunk, size - start)
+                instance = uploads.write_chunk(upload, start, SyntheticStream(length, expected), length)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertLess(peak, 2 * 1024 * 1024)
+        self.assertEqual(instance.file.size, size)
+        upload.refresh_from_db()
+        self.assertEqual((upload.status, upload.sha256), ("complete", expected.hexdigest()))
+
+
+def mp3_bytes(frames, xing_frames=None):
+    ''' MPEG-1 Layer III, 128 кбит/с, 44100 Гц, стерео: ID3v2-тег и frames фреймов по 417 байт. '''
+    frame = bytearray(b"\xff\xfb\x90\x00" + bytes(413))
+    first = bytearray(frame)
+    if xing_frames:
+        first[36:48] = b"Xing" + struct.pack(">II", 1, xing_frames)
+    id3 = b"ID3\x03\x00\x00\x00\x00\x00\x0a" + bytes(10)
+    return id3 + bytes(first) + bytes(frame) * (frames - 1)
+
+
+def mp4_bytes(seconds):
+    def atom(kind, body):
+        return struct.pack(">I4s", 8 + len(body), kind) + body
+
+    mvhd = atom(b"mvhd", bytes(4) + struct.pack(">IIII", 0, 0, 1000, seconds * 1000) + bytes(80))
+    stsd = atom(b"stsd", bytes(4) + struct.pack(">I", 1) + atom(b"mp4a", bytes(28)))
+    trak = atom(b"trak", atom(b"mdia", atom(b"minf", atom(b"stbl", stsd))))
+    return atom(b"ftyp", b"M4B \x00\x00\x00\x00") + atom(b"moov", mvhd + trak) + atom(b"mdat", bytes(5000))
+
+
+def adts_bytes(frames):
+    length = 200
+    header = bytes([0xFF, 0xF1, 0x50, 0x80 | (length >> 11), (length >> 3) & 0xFF, ((length & 7) << 5) | 0x1F, 0xFC])
+    return (header + bytes(length - 7)) * frames
+
+
+class AudioMetadataTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+
+    def write(self, name, data):
+        path = os.path.join(self.media.name, name)
+        with open(path, "wb") as file:
+            file.write(data)
+        return path
+
+    def test_formats(self):
+        cbr = read_audio_metadata(self.write("cbr.mp3", mp3_bytes(1000)))
+        self.assertEqual((cbr.bitrate, cbr.codec), (128, "mp3"))
+        self.assertAlmostEqual(cbr.duration, 1000 * 417 * 8 / 128000, places=3)
+
+        vbr = read_audio_metadata(self.write("vbr.mp3", mp3_bytes(100, xing_frames=5000)))
+        self.assertAlmostEqual(vbr.duration, 5000 * 1152 / 44100, places=3)
+
+        m4b = read_audio_metadata(self.write("book.m4b", mp4_bytes(3600)))
+        self.assertEqual((m4b.duration, m4b.codec), (3600, "aac"))
+
+        aac = read_audio_metadata(self.write("book.aac", adts_bytes(430)))
+        self.assertAlmostEqual(aac.duration, 430 * 1024 / 44100, places=3)
+
+        wav_path = os.path.join(self.media.name, "book.wav")
+        with wave.open(wav_path, "wb") as file:
+            file.setnchannels(1)
+            file.setsampwidth(2)
+            file.setframerate(8000)
+            file.writeframes(bytes(8000 * 2 * 3))
+        self.assertEqual(read_audio_metadata(wav_path), (3.0, 128, "pcm"))
+
+        with self.assertRaises(ValueError):
+            read_audio_metadata(self.write("noise.mp3", bytes(5000)))
+
+    def test_worker_fills_durations(self):
+        with self.settings(MEDIA_ROOT=self.media.name):
+            book = ModelBooks.objects.create(title="Book", slug="book")
+            contents = [mp3_bytes(100, xing_frames=3828), mp4_bytes(200), b"broken"]  # ~100 с, 200 с, мусор
+            parts = [AudioFile.objects.create(book=book, file=f"{i}.mp3") for i in range(3)]
+            for part, data in zip(parts, contents):
+                self.write(part.file.name, data)
+            self.assertEqual(AudioMetadataJob.objects.filter(status="pending").count(), 3)
+            url = reverse("api_detail", args=["books", "book"])
+            before = self.client.get(url)
+            self.assertIsNone(before.json()["duration"])
+
+            stats = audio_worker.run(workers=0)
+            self.assertEqual((stats.files, stats.failed), (3, 1))
+
+        # Пересчёт длительности меняет time_update: кэш карточки и ETag не отдают старое значение
+        after = self.client.get(url, HTTP_IF_NONE_MATCH=before["ETag"])
+        self.assertEqual(after.status_code, 200)
+        self.assertIsNotNone(after.json()["duration"])
+
+        parts[1].refresh_from_db()
+        self.assertEqual((parts[1].duration, parts[1].codec), (timedelta(seconds=200), "aac"))
+        book.refresh_from_db()
+        self.assertEqual(round(book.duration.total_seconds()), 300)
+        job = AudioMetadataJob.objects.get(audio_file=parts[2])
+        self.assertEqual((job.status, job.attempts), ("failed", 1))
+
+        self.assertEqual(audio_worker.enqueue_backfill(), 1)
+        self.assertEqual(AudioMetadataJob.objects.filter(status="pending").count(), 1)
+
+    def test_replaced_and_deleted_parts(self):
+        with self.settings(MEDIA_ROOT=self.media.name):
+            book = ModelBooks.objects.create(title="Book", slug="book")
+            parts = [AudioFile.objects.create(book=book, file=f"{i}.mp3") for i in range(2)]
+            self.write(parts[0].file.name, mp4_bytes(200))
+            self.write(parts[1].file.name, mp4_bytes(100))
+            audio_worker.run(workers=0)
+            book.refresh_from_db()
+            self.assertEqual(book.duration, timedelta(seconds=300))
+
+            # Замена файла ставит задание в очередь заново
+            self.write("new.m4b", mp4_bytes(50))
+            parts[0].file = "new.m4b"
+            parts[0].save()
+            self.assertEqual(AudioMetadataJob.objects.get(audio_file=parts[0]).status, "pending")
+            AudioFile.objects.get(pk=parts[1].pk).save()  # файл не менялся
+            self.assertEqual(AudioMetadataJob.objects.get(audio_file=parts[1]).status, "done")
+            audio_worker.run(workers=0)
+            book.refresh_from_db()
+            self.assertEqual(book.duration, timedelta(seconds=150))
+
+        # Удаление части пересчитывает длительность книги после коммита
+        with self.captureOnCommitCallbacks(execute=True):
+            AudioFile.objects.only("pk").get(pk=parts[1].pk).delete()
+        book.refresh_from_db()
+        self.assertEqual(book.duration, timedelta(seconds=50))
+
+    def test_stale_claims_are_reclaimed(self):
+        book = ModelBooks.objects.create(title="Book", slug="book")
+        parts = [AudioFile.objects.create(book=book, file=f"{i}.mp3") for i in range(2)]
+        stale = audio_worker.claim(10)
+        self.assertEqual(len(stale), 2)
+        self.assertEqual(audio_worker.claim(10), [])  # аренда не истекла
+
+        AudioMetadataJob.objects.filter(audio_file=parts[0]).update(
+            claimed_at=timezone.now() - audio_worker.CLAIM_LEASE - timedelta(seconds=1)
+        )
+        fresh = audio_worker.claim(10)  # обработчик упал - задание забирает другой
+        self.assertEqual([job.audio_file_id for job in fresh], [parts[0].pk])
+
+        # Опоздавший обработчик не перезаписывает задание, которое уже принадлежит другому
+        audio_worker.process_batch(stale, map_function=lambda function, paths: [(None, 0, "err") for _ in paths])
+        self.assertEqual(
+            dict(AudioMetadataJob.objects.values_list("audio_file_id", "status")),
+            {parts[0].pk: "running", parts[1].pk: "failed"},
+        )
+
+
+class MediaServingTests(SimpleTestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = self.settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        os.makedirs(os.path.join(media.name, "uploads/audio_files"))
+        self.data = os.urandom(200_000)
+        with open(os.path.join(media.name, "uploads/audio_files/book.m4b"), "wb") as file:
+            file.write(self.data)
+        with open(os.path.join(media.name, "secret.txt"), "w") as file:
+            file.write("secret")
+        self.url = reverse("media", args=["uploads/audio_files/book.m4b"])
+
+    def test_full_and_conditional(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.data)
+        self.assertEqual((response["Accept-Ranges"], response["Content-Length"]), ("bytes", "200000"))
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]).status_code, 304)
+
+    def test_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=1000-1999")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 1000-1999/200000")
+        self.assertEqual(b"".join(response.streaming_content), self.data[1000:2000])
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=-500")
+        self.assertEqual(b"".join(response.streaming_content), self.data[-500:])
+        response = self.client.get(self.url, HTTP_RANGE="bytes=199000-")
+        self.assertEqual(b"".join(response.streaming_content), self.data[199000:])
+
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE="bytes=300000-").status_code, 416)
+        etag = self.client.get(self.url)["ETag"]
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=etag).status_code, 206)
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"old"').status_code, 200)
+
+    def test_only_upload_directories(self):
+        self.assertEqual(self.client.get(reverse("media", args=["secret.txt"])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("media", args=["uploads/audio_files/../../secret.txt"])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("media", args=["uploads/audio_files/none.mp3"])).status_code, 404)
+
+    def test_offload(self):
+        with self.settings(MEDIA_OFFLOAD="x-accel"):
+            response = self.client.get(self.url)
+        self.assertEqual(response["X-Accel-Redirect"], "/protected-media/uploads/audio_files/book.m4b")
+        with self.settings(MEDIA_OFFLOAD="x-sendfile"):
+            response = self.client.get(self.url)
+        self.assertTrue(response["X-Sendfile"].endswith("uploads/audio_files/book.m4b"))
+
+
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = ModelBooks.objects.create(title="Cover", slug="cover")
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = self.settings(MEDIA_ROOT=media.name, THUMBNAIL_WORKERS=0)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def create_image(self):
+        buffer = io.BytesIO()
+        Image.new("RGB", (1200, 900), "red").save(buffer, "JPEG")
+        with self.captureOnCommitCallbacks(execute=True):
+            return BookImage.objects.create(book=self.book, image=SimpleUploadedFile("c.jpg", buffer.getvalue()))
+
+    def test_derivatives_built_and_removed(self):
+        image = self.create_image()
+        paths = [default_storage.path(name) for name in derivative_names(image.image.name)]
+        self.assertEqual(len(paths), 6)
+        self.assertTrue(all(os.path.exists(path) for path in paths))
+        with Image.open(default_storage.path(derivative_name(image.image.name, "small"))) as small:
+            self.assertEqual((small.format, small.size), ("WEBP", (300, 225)))
+
+        image.refresh_from_db()
+        with self.assertNumQueries(0), mock.patch("os.stat", side_effect=AssertionError("stat")):
+            url = thumbnail_url(image, "thumb")
+        self.assertRegex(url, r"\.thumb\.webp\?v=\w+$")
+        response = self.client.get(url)
+        self.assertIn("immutable", response["Cache-Control"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            image.delete()
+        self.assertFalse(any(os.path.exists(path) for path in paths))
+
+    def test_fallback_and_orphan_cleanup(self):
+        image = self.create_image()
+        for name in derivative_names(image.image.name):
+            default_storage.delete(name)
+        BookImage.objects.filter(pk=image.pk).update(thumbnail_version="")
+        image.refresh_from_db()
+        self.assertEqual(thumbnail_url(image), image.image.url)
+
+        call_command("thumbnails", workers=0, stdout=io.StringIO())
+        self.assertTrue(default_storage.exists(derivative_name(image.image.name, "thumb")))
+        image.refresh_from_db()
+        self.assertRegex(thumbnail_url(image), r"\.thumb\.webp\?v=\w+$")
+
+        orphan = derivative_name("uploads/book_images/gone.png", "thumb", "orig")
+        default_storage.save(orphan, io.BytesIO(b"x"))
+        call_command("thumbnails", workers=0, cleanup=True, stdout=io.StringIO())
+        self.assertFalse(default_storage.exists(orphan))
+        self.assertTrue(default_storage.exists(derivative_name(image.image.name, "thumb")))
+
+    def test_template_tag(self):
+        image = self.create_image()
+        image.refresh_from_db()
+        rendered = Template("{% load bookland_images %}{% thumbnail_url image 'small' 'orig' %}").render(
+            Context({"image": image})
+        )
+        self.assertEqual(rendered, thumbnail_url(image, "small", "orig"))
+        self.assertRegex(rendered, r"\.small\.jpg\?v=\w+$")
+
+    def test_inline_build_failure_is_logged(self):
+        with mock.patch.object(Image, "open", side_effect=Image.DecompressionBombError("too big")), \
+                self.assertLogs("bookland.thumbnails", "ERROR"):
+            image = self.create_image()  # ошибка построения не роняет запрос после коммита
+        image.refresh_from_db()
+        self.assertEqual(thumbnail_url(image), image.image.url)
+
+
+class FileNamingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(surname_nick="Булгаков", slug="bulgakov")
+        cls.book = ModelBooks.objects.create(title="Master", slug="master")
+        cls.book.authors.add(cls.author)
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = self.settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def add_audio(self, book=None):
+        return AudioFile.objects.create(book=book or self.book, file=ContentFile(b"x", name="part.mp3"))
+
+    def test_sequence_and_constant_queries(self):
+        counts = []
+        for _ in range(200):
+            with CaptureQueriesContext(connection) as queries:
+                audio = self.add_audio(ModelBooks.objects.get(pk=self.book.pk))
+            counts.append(len(queries))
+        self.assertEqual(len(set(counts[1:])), 1, counts)
+        self.assertEqual(audio.order, 200)
+        self.assertEqual(audio.file.name, "uploads/audio_files/200-master-bulgakov.mp3")
+        names = list(AudioFile.objects.values_list("file", flat=True))
+        self.assertEqual(len(set(names)), 200)
+
+    def test_stale_book_objects_get_distinct_numbers(self):
+        first, second = ModelBooks.objects.get(pk=self.book.pk), ModelBooks.objects.get(pk=self.book.pk)
+        self.assertEqual(
+            [self.add_audio(book).order for book in (first, second, first)], [1, 2, 3]
+        )
+
+    def test_prefix_invalidation(self):
+        self.add_audio()
+        cycle = Cycle.objects.create(name="Цикл", slug="cikl")
+        self.book.work_type, self.book.cycle, self.book.cycle_number = "cycle", cycle, "2"
+        self.book.save()
+        self.assertEqual(self.add_audio().file.name, "uploads/audio_files/02-master-cikl-2-bulgakov.mp3")
+
+        self.book.authors.add(Author.objects.create(surname_nick="Ильф", slug="ilf"))
+        cycle.slug = "cycle"
+        cycle.save()
+        self.assertEqual(self.add_audio().file.name, "uploads/audio_files/03-master-cycle-2-bulgakov-ilf.mp3")
+
+    def test_resave_keeps_name_and_existing_files_continue_numbering(self):
+        audio = self.add_audio()
+        name = audio.file.name
+        audio.save()
+        self.assertEqual(audio.file.name, name)
+
+        BookFileNaming.objects.all().delete()
+        self.assertEqual(self.add_audio().order, 2)
+
+
+class PublicApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(surname_nick="Стругацкий", slug="strugatskij")
+        cls.reader = Reader.objects.create(surname_nick="Клюквин", slug="klyukvin")
+        category = ModelCategories.objects.create(name="Фантастика")
+        cls.subcategory = ModelSubcategories.objects.create(category=category, name="Космос")
+        cls.books = []
+        for i in range(23):
+            book = ModelBooks.objects.create(
+                title=f"Book {i % 5}", slug=f"book-{i}", year=None if i % 4 == 0 else 1950 + i % 3,
+                is_published=i != 7,
+            )
+            book.authors.add(cls.author)
+            book.readers.add(cls.reader)
+            book.book_subcategories.add(cls.subcategory)
+            cls.books.append(book)
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def test_keyset_pagination_matches_ordering(self):
+        expected = sorted(
+            (book for book in self.books if book.is_published),
+            key=lambda book: (book.year is None, -(book.year or 0), book.title, book.pk),
+        )
+        slugs, url, params = [], reverse("api_list", args=["books"]), {"limit": 4, "fields": "slug"}
+        while url:
+            data = self.get(url, **params).json()
+            slugs += [item["slug"] for item in data["results"]]
+            url, params = data["next"], {}
+        self.assertEqual(slugs, [book.slug for book in expected])
+
+    def test_constant_queries_and_sparse_fields(self):
+        url = reverse("api_list", args=["books"])
+        fields = "title,authors,readers,subcategories,cycle"
+        with CaptureQueriesContext(connection) as small:
+            self.get(url, limit=2, fields=fields)
+        with CaptureQueriesContext(connection) as large:
+            data = self.get(url, limit=20, fields=fields).json()
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(set(data["results"][0]), set(fields.split(",")))
+        self.assertEqual(data["results"][0]["authors"], [{"slug": self.author.slug, "name": "Стругацкий"}])
+
+        self.assertEqual(self.client.get(url, {"fields": "title,password"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"after": "garbage"}).status_code, 400)
+        for forged in (["x", "y", 1], [{"a": 1}, "t", 1], [2000, "t", "zz"], [2000, None, 1], [2000, "t", [1]]):
+            with self.subTest(forged=forged):
+                response = self.client.get(url, {"after": Keyset.encode(forged)})
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(url, {"after": Keyset.encode([None, "t", "5"])}).status_code, 200)
+
+    def test_list_revalidation(self):
+        url, params = reverse("api_list", args=["books"]), {"limit": 3, "fields": "slug"}
+        response = self.get(url, **params)
+        self.assertNotIn("Last-Modified", response)
+        self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+        # Книга ушла со страницы - max(time_update) страницы не растёт, но страница другая
+        ModelBooks.objects.filter(slug=response.json()["results"][0]["slug"]).update(is_published=False)
+        self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 200)
+        since = http_date(time.time() + 3600)
+        self.assertEqual(self.client.get(url, params, HTTP_IF_MODIFIED_SINCE=since).status_code, 200)
+
+    def test_book_detail_revalidation(self):
+        url = reverse("api_detail", args=["books", "book-1"])
+        response = self.get(url)
+        self.assertEqual(response.json()["subcategories"][0]["category"], self.subcategory.category.slug)
+        etag = response["ETag"]
+        self.assertTrue(etag.startswith('W/"'))
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.books[1].readers.clear()
+        self.assertNotEqual(self.get(url)["ETag"], etag)
+        self.assertEqual(self.client.get(reverse("api_detail", args=["books", "book-7"])).status_code, 404)
+
+    def test_other_resources(self):
+        data = self.get(reverse("api_detail", args=["authors", self.author.slug])).json()
+        self.assertEqual(len(data["books"]), 22)
+        response = self.get(reverse("api_subcategory", args=[self.subcategory.category.slug, self.subcategory.slug]))
+        self.assertEqual(response.json()["category"]["slug"], self.subcategory.category.slug)
+        self.assertEqual(self.client.get(response.request["PATH_INFO"], HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+        categories = self.get(reverse("api_list", args=["categories"])).json()["results"]
+        self.assertEqual(categories[0]["subcategories"][0]["slug"], self.subcategory.slug)
+        self.assertEqual(self.client.get(reverse("api_list", args=["users"])).status_code, 404)
+
+
+class AsgiViewsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = ModelBooks.objects.create(title="Async", slug="async", year=2001)
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = self.settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        os.makedirs(os.path.join(media.name, "uploads/audio_files"))
+        self.data = os.urandom(300_000)
+        with open(os.path.join(media.name, "uploads/audio_files/a.mp3"), "wb") as file:
+            file.write(self.data)
+
+    async def read(self, response):
+        return b"".join([chunk async for chunk in response.streaming_content])
+
+    async def test_media_streams_asynchronously(self):
+        url = reverse("media", args=["uploads/audio_files/a.mp3"])
+        response = await self.async_client.get(url)
+        self.assertTrue(response.is_async)
+        self.assertEqual((response["Content-Length"], response["Content-Type"]), ("300000", "audio/mpeg"))
+        self.assertEqual(await self.read(response), self.data)
+
+        response = await self.async_client.get(url, headers={"Range": "bytes=100000-100099"})
+        self.assertEqual((response.status_code, response["Content-Range"]), (206, "bytes 100000-100099/300000"))
+        self.assertEqual(await self.read(response), self.data[100000:100100])
+
+    async def test_api_and_index(self):
+        response = await self.async_client.get(reverse("api_detail", args=["books", "async"]))
+        self.assertEqual(response.json()["year"], 2001)
+        response = await self.async_client.get(reverse("api_list", args=["books"]), {"fields": "slug"})
+        self.assertEqual(response.json()["results"], [{"slug": "async"}])
+        self.assertEqual((await self.async_client.post(reverse("api_list", args=["books"]))).status_code, 405)
+        self.assertEqual((await self.async_client.get("/")).status_code, 200)
+
+
+class CatalogueCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(surname_nick="Пелевин", slug="pelevin")
+        cls.other = Author.objects.create(surname_nick="Сорокин", slug="sorokin")
+        cls.book = ModelBooks.objects.create(title="Generation", slug="generation", year=1999)
+        cls.book.authors.add(cls.author)
+        cls.category = ModelCategories.objects.create(name="Проза")
+
+    def setUp(self):
+        override = self.settings(CACHES={"default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": f"test-{uuid.uuid4()}",
+        }})
+        override.enable()
+        self.addCleanup(override.disable)
+        cache.reset_stats()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_override = self.settings(MEDIA_ROOT=media.name)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+    def outcomes(self, kind, url):
+        before = cache.stats().get(kind, {"hits": 0, "misses": 0})
+        self.assertEqual(self.client.get(url).status_code, 200)
+        after = cache.stats()[kind]
+        return after["hits"] - before["hits"], after["misses"] - before["misses"]
+
+    def test_book_detail_versioned_by_time_update(self):
+        url = reverse("api_detail", args=["books", "generation"])
+        self.assertEqual(self.outcomes("books", url), (0, 1))
+        self.assertEqual(self.outcomes("books", url), (1, 0))
+        AudioFile.objects.create(book=self.book, file=ContentFile(b"x", name="1.mp3"))
+        self.assertEqual(self.outcomes("books", url), (0, 1))
+        self.author.description = "Писатель"
+        self.author.save()
+        self.assertEqual(self.outcomes("books", url), (0, 1))
+
+    def test_pages_invalidated_precisely(self):
+        pelevin = reverse("api_detail", args=["authors", self.author.slug])
+        sorokin = reverse("api_detail", args=["authors", self.other.slug])
+        for url in (pelevin, sorokin):
+            self.outcomes("authors", url)
+
+        self.book.title = "Generation П"
+        self.book.save()
+        self.assertEqual(self.outcomes("authors", pelevin), (0, 1))
+        self.assertEqual(self.outcomes("authors", sorokin), (1, 0))
+        self.assertEqual(self.client.get(pelevin).json()["books"][0]["title"], "Generation П")
+
+        self.book.authors.add(self.other)
+        self.assertEqual(self.outcomes("authors", sorokin), (0, 1))
+        self.assertEqual(self.outcomes("authors", pelevin), (1, 0))
+
+    def test_category_tree(self):
+        url = reverse("api_category_tree")
+        self.assertEqual(self.outcomes("tree", url), (0, 1))
+        self.assertEqual(self.outcomes("tree", url), (1, 0))
+        ModelSubcategories.objects.create(category=self.category, name="Сатира")
+        self.assertEqual(self.outcomes("tree", url), (0, 1))
+        tree = self.client.get(url).json()["results"]
+        self.assertEqual(tree[0]["subcategories"][0]["name"], "Сатира")
+
+    def test_stats_view_is_staff_only(self):
+        url = reverse("cache_stats")
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+        self.client.get(reverse("api_category_tree"))
+        self.assertEqual(self.client.get(url).json()["cache"]["tree"]["misses"], 1)
+
+
+class LRUFileCacheTests(SimpleTestCase):
+    def test_evicts_least_recently_read(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        backend = LRUFileBasedCache(directory.name, {"OPTIONS": {"MAX_SIZE": 10_000}})
+        payload = os.urandom(3000)  # содержимое сжимается - нужны несжимаемые данные
+        for i, key in enumerate(["a", "b", "c"]):
+            backend.set(key, payload)
+            os.utime(backend._key_to_file(key), ns=(i * 10**9, i * 10**9))
+        self.assertEqual(backend.get("a"), payload)  # "a" прочитан - теперь самый свежий
+        backend.set("d", payload)  # объём дошёл до лимита - вытесняются давно не читанные
+        backend.set("e", payload)
+        self.assertIsNone(backend.get("b"))
+        self.assertEqual(backend.get("a"), payload)
+        self.assertLessEqual(backend.total_size(), 10_000)
+
+    def test_writes_do_not_rescan_directory(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        backend = LRUFileBasedCache(directory.name, {"OPTIONS": {"MAX_SIZE": 10**6}})
+        with mock.patch.object(backend, "_list_cache_files", wraps=backend._list_cache_files) as listing:
+            for i in range(50):
+                backend.set(f"key-{i}", i)
+        self.assertEqual(listing.call_count, 1)  # один обход - при первой записи
+
+
+class ProfilingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(surname_nick="Лем", slug="lem")
+        cls.book = ModelBooks.objects.create(title="Солярис", slug="solaris", year=1961)
+        cls.book.authors.add(cls.author)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.log = os.path.join(directory.name, "profile.jsonl")
+        override = self.settings(BOOKLAND_PROFILING=True, BOOKLAND_SLOW_REQUEST_MS=0, BOOKLAND_PROFILE_LOG=self.log)
+        override.enable()
+        self.addCleanup(override.disable)
+        profiling.reset()
+        self.addCleanup(profiling.reset)
+
+    def entries(self):
+        with open(self.log, encoding="utf-8") as log:
+            return [json.loads(line) for line in log]
+
+    def test_sync_request_profiled(self):
+        self.assertEqual(self.client.get(reverse("api_list", args=["authors"])).status_code, 200)
+        entry = self.entries()[-1]
+        self.assertEqual((entry["view"], entry["status"]), ("api_list", 200))
+        self.assertGreater(entry["queries"], 0)
+        self.assertEqual(len(entry["sql"]), entry["queries"])  # медленный (порог 0) - вместе с SQL
+        self.assertEqual(profiling.stats()["views"][0]["view"], "api_list")
+
+    async def test_async_request_profiled(self):
+        # ORM из async-view выполняется в другом потоке (sync_to_async) - запросы всё равно в профиле
+        write, threads = profiling._write_log, []
+
+        def write_in_thread(entry):
+            threads.append(threading.get_ident())
+            write(entry)
+
+        with mock.patch.object(profiling, "_write_log", side_effect=write_in_thread):
+            response = await self.async_client.get(reverse("api_detail", args=["books", "solaris"]))
+        self.assertEqual(response.status_code, 200)
+        # Запись журнала - не в потоке цикла событий
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.get_ident())
+        entry = self.entries()[-1]
+        self.assertEqual(entry["view"], "api_detail")
+        self.assertGreater(entry["queries"], 0)
+
+    def test_duplicates_detected(self):
+        request = RequestFactory().get("/")
+        profile = profiling.RequestProfile(request)
+        for ids in ("%s", "%s, %s", "%s"):
+            profile.add_query(f"SELECT * FROM t WHERE id IN ({ids})", 0.001)
+        profile.add_query("SELECT 1", 0.001)
+        entry = profile.finish(request, HttpResponse())
+        self.assertEqual(entry["duplicates"], {"SELECT * FROM t WHERE id IN (...)": 3})
+
+    def test_report_and_stats_endpoint(self):
+        self.client.get(reverse("api_list", args=["books"]))
+        with open(self.log, "a", encoding="utf-8") as log:
+            log.write(json.dumps({
+                "method": "GET", "path": "/admin/", "view": "admin:index", "status": 200, "wall_ms": 900.0,
+                "queries": 30, "db_ms": 400.0, "duplicates": {"SELECT * FROM bookland_cycle WHERE id = %s": 25},
+            }) + "\n")
+        out = io.StringIO()
+        call_command("bookland_profile", "--sort", "queries", stdout=out)
+        report = out.getvalue()
+        self.assertLess(report.index("admin:index"), report.index("api_list"))
+        self.assertIn("до 25 раз", report)
+
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+        data = self.client.get(reverse("stats")).json()
+        self.assertTrue(data["profiling"])
+        self.assertIn("api_list", [view["view"] for view in data["views"]])
+        self.assertIn("cache", data)
+
+
+class BenchmarkSuiteTests(TestCase):
+    def test_catalogue_and_benchmarks(self):
+        counts = {"books": 40, "authors": 10, "readers": 5, "cycles": 5, "categories": 2, "subcategories": 2,
+                  "audio": 2, "ratings": 60}
+        generated = benchmarks.generate_catalogue(counts, seed=1)
+        self.assertEqual(generated, {**counts, "subcategories": 4, "audio": 80})
+        self.assertRegex(ModelBooks.objects.first().title, "[а-яё]")
+        self.assertFalse(ModelBooks.counter_drift().exists())  # счётчики пересчитаны после bulk_create
+        self.assertEqual(BookRatingSummary.objects.aggregate(total=Sum("ratings_count"))["total"], 60)
+
+        results = benchmarks.run(repeat=3)
+        self.assertEqual(set(results), set(benchmarks.BENCHMARKS))
+        for name, result in results.items():
+            with self.subTest(name):
+                self.assertEqual(result["runs"], 3)
+                self.assertLessEqual(result["p50_ms"], result["p95_ms"])
+        self.assertEqual(results["translit_re"]["queries"], 0)
+        self.assertEqual(results["category_delete_guard"]["queries"], 1)
+
+    def test_empty_catalogue_skips(self):
+        counts = {**benchmarks.DEFAULT_COUNTS, "books": 0, "audio": 0, "ratings": 0, "authors": 2, "readers": 2,
+                  "cycles": 1, "categories": 1, "subcategories": 1}
+        benchmarks.generate_catalogue(counts, seed=1)
+        names = [name for name in benchmarks.BENCHMARKS if name != "startup"]
+        results = benchmarks.run(names, repeat=2)
+        for name in ("translit_re", "book_save", "generate_file_name", "category_delete_guard", "sitemap_after_edit"):
+            with self.subTest(name):
+                self.assertIn("skipped", results[name])
+        self.assertEqual(results["search"]["runs"], 2)
+
+        out = io.StringIO()
+        BenchCommand(stdout=out).report(results, baseline={"translit_re": {"skipped": "нет книг"}})
+        self.assertIn("translit_re                пропущен: в каталоге нет книг", out.getvalue())
+
+
+class AudioIngestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_superuser("admin", "admin@example.com", "password")
+        cls.author = Author.objects.create(surname_nick="Толстой", slug="tolstoy")
+        cls.book = ModelBooks.objects.create(title="Война и мир", slug="voyna-i-mir")
+        cls.book.authors.add(cls.author)
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = self.settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def archive(self, names):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            for name in names:
+                archive.writestr(name, name.encode())
+        buffer.seek(0)
+        return buffer
+
+    def test_natural_key(self):
+        names = ["Part 10.mp3", "part 2.mp3", "Part 1.mp3", "CD2/01.mp3", "CD1/10.mp3", "CD1/9.mp3"]
+        self.assertEqual(
+            sorted(names, key=audio_ingest.natural_key),
+            ["CD1/9.mp3", "CD1/10.mp3", "CD2/01.mp3", "Part 1.mp3", "part 2.mp3", "Part 10.mp3"],
+        )
+
+    def test_ingest_archive(self):
+        AudioFile.objects.create(book=self.book, file=ContentFile(b"x", name="intro.mp3"))
+        archive = self.archive(["Часть 10.mp3", "Часть 2.mp3", "cover.jpg", "__MACOSX/._Часть 2.mp3", "Часть 1.mp3"])
+        with open_parts(archive) as parts:
+            created = audio_ingest.ingest_audio(self.book, parts)
+
+        self.assertEqual([audio.order for audio in created], [2, 3, 4])  # после уже загруженной части
+        self.assertEqual(
+            [default_storage.open(audio.file.name).read() for audio in created],
+            ["Часть 1.mp3".encode(), "Часть 2.mp3".encode(), "Часть 10.mp3".encode()],
+        )
+        self.assertEqual(created[0].file.name, "uploads/audio_files/02-voyna-i-mir-tolstoy.mp3")
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.total_audio_files, 4)
+        self.assertEqual(AudioMetadataJob.objects.filter(audio_file__in=created).count(), 3)
+        # Размеры для админки - без ожидания сканирования хранилища
+        stored = StoredFile.objects.filter(path__in=[audio.file.name for audio in created], exists=True, referenced=True)
+        self.assertEqual(
+            sorted(stored.values_list("size", flat=True)), sorted(len(f"Часть {i}.mp3".encode()) for i in (1, 2, 10))
+        )
+
+    def test_ingest_queries_do_not_grow_with_parts(self):
+        def queries(count):
+            with CaptureQueriesContext(connection) as captured, open_parts(
+                self.archive([f"{i}.mp3" for i in range(count)])
+            ) as parts:
+                audio_ingest.ingest_audio(self.book, parts)
+            return len(captured)
+
+        queries(1)  # первая загрузка создаёт счётчики имён книги
+        self.assertEqual(queries(2), queries(20))
+
+    def test_endpoints(self):
+        url = reverse("audio_ingest", args=[self.book.pk])
+        files = [SimpleUploadedFile(name, b"data") for name in ("Глава 10.mp3", "Глава 9.mp3")]
+        self.assertEqual(self.client.post(url, {"files": files}).status_code, 403)
+
+        self.client.force_login(self.staff)
+        response = self.client.post(url, {"files": files})
+        self.assertEqual(response.status_code, 201, response.content)
+        ninth, tenth = [row["id"] for row in response.json()["files"]]
+        self.assertEqual(AudioFile.objects.get(pk=ninth).order, 1)
+
+        url = reverse("audio_reorder", args=[self.book.pk])
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.post(url, {"order": [tenth, ninth]}, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(self.book.audio_files.values_list("pk", flat=True)), [tenth, ninth])
+        # Новый порядок - одним UPDATE, без сохранения частей по одной
+        self.assertEqual(sum('UPDATE "bookland_audiofile"' in query["sql"] for query in captured), 1)
+
+        response = self.client.post(url, {"order": [tenth]}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        bad = self.client.post(reverse("audio_ingest", args=[self.book.pk]), {"files": [SimpleUploadedFile("a.txt", b"")]})
+        self.assertEqual(bad.status_code, 400)
+
+
+def bencode(value):
+    if isinstance(value, int):
+        return b"i%de" % value
+    if isinstance(value, str):
+        value = value.encode()
+    if isinstance(value, bytes):
+        return b"%d:%s" % (len(value), value)
+    if isinstance(value, list):
+        return b"l" + b"".join(bencode(item) for item in value) + b"e"
+    return b"d" + b"".join(bencode(key) + bencode(value[key]) for key in sorted(value)) + b"e"
+
+
+def torrent_bytes(files, name="book", piece_length=2 ** 18, pieces=3):
+    info = {"name": name, "piece length": piece_length, "pieces": bytes(20 * pieces)}
+    if isinstance(files, int):
+        info["length"] = files
+    else:
+        info["files"] = [{"length": length, "path": path.split("/")} for path, length in files]
+    return bencode({"announce": "http://tracker.example/announce", "info": info}), hashlib.sha1(bencode(info)).hexdigest()
+
+
+class TorrentMetaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(surname_nick="Толстой", slug="tolstoy")
+        cls.reader = Reader.objects.create(surname_nick="Чтецов", slug="chtetsov")
+        cls.book = ModelBooks.objects.create(title="Война и мир", slug="voyna-i-mir")
+        cls.book.authors.add(cls.author)
+        cls.book.readers.add(cls.reader)
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = self.settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_parse(self):
+        data, info_hash = torrent_bytes([("CD1/Часть 10.mp3", 300), ("CD1/Часть 2.mp3", 200), ("cover.jpg", 5)])
+        metadata = read_torrent(io.BytesIO(data))
+        self.assertEqual(metadata.info_hash, info_hash)
+        self.assertEqual((metadata.name, metadata.total_size, metadata.piece_count), ("book", 505, 3))
+        self.assertEqual(metadata.files[0], ("CD1/Часть 10.mp3", 300))
+
+        single = read_torrent(io.BytesIO(torrent_bytes(1000, name="book.mp3")[0]))
+        self.assertEqual(single.files, [("book.mp3", 1000)])
+
+        for broken in (b"", b"not a torrent", data[:-10], bencode({"info": {"name": "x"}}), b"d4:infoi01ee"):
+            with self.subTest(broken=broken[:20]), self.assertRaises(ValueError):
+                read_torrent(io.BytesIO(broken))
+
+    def test_pieces_are_streamed(self):
+        # 50 000 кусков (1 МБ хешей) - в память читается не весь pieces, а буфер
+        data, info_hash = torrent_bytes(50000 * 2 ** 18, pieces=50000)
+        tracemalloc.start()
+        try:
+            metadata = read_torrent(io.BytesIO(data))
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual((metadata.info_hash, metadata.piece_count), (info_hash, 50000))
+        self.assertLess(peak, 512 * 1024)
+
+    def test_save_indexes_and_lookup(self):
+        data, info_hash = torrent_bytes([("01.mp3", 10), ("02.mp3", 20)])
+        torrent = TorrentFile.objects.create(
+            book=self.book, reader=self.reader, file=SimpleUploadedFile("book.torrent", data)
+        )
+        torrent.refresh_from_db()
+        self.assertEqual((torrent.info_hash, torrent.total_size, torrent.piece_count), (info_hash, 30, 3))
+        self.assertEqual(default_storage.open(torrent.file.name).read(), data)
+
+        magnet = base64.b32encode(bytes.fromhex(info_hash)).decode()
+        with self.assertNumQueries(1):
+            self.assertEqual(list(TorrentFile.objects.by_info_hash(magnet)), [torrent])
+        self.assertEqual(list(TorrentFile.objects.by_info_hash(info_hash.upper())), [torrent])
+
+        duplicate = TorrentFile(book=self.book, reader=self.reader, file=SimpleUploadedFile("copy.torrent", data))
+        with self.assertRaises(ValidationError) as raised:
+            duplicate.full_clean()
+        self.assertIn("Война и мир", str(raised.exception))
+
+        broken = TorrentFile(book=self.book, reader=self.reader, file=SimpleUploadedFile("bad.torrent", b"oops"))
+        with self.assertRaises(ValidationError):
+            broken.full_clean()
+
+        # Замена файла на нераспознанный не оставляет метаинформацию прежнего
+        torrent.file = SimpleUploadedFile("bad.torrent", b"oops")
+        torrent.save()
+        torrent.refresh_from_db()
+        self.assertEqual((torrent.info_hash, torrent.total_size, torrent.files), ("", None, []))
+        self.assertEqual(list(TorrentFile.objects.by_info_hash(info_hash)), [])
+
+    def test_audio_parts(self):
+        AudioFile.objects.create(book=self.book, file=ContentFile(b"1", name="a.mp3"))
+        AudioFile.objects.create(book=self.book, file=ContentFile(b"2", name="b.mp3"))
+        data, _ = torrent_bytes([("Часть 10.mp3", 3), ("Часть 2.mp3", 2), ("cover.jpg", 1), ("Часть 1.mp3", 1)])
+        torrent = TorrentFile.objects.create(
+            book=self.book, reader=self.reader, file=SimpleUploadedFile("book.torrent", data)
+        )
+        first, second = self.book.audio_files.order_by("order")
+        with self.assertNumQueries(1):
+            parts = torrent.audio_parts()
+        self.assertEqual(parts, [("Часть 1.mp3", 1, first), ("Часть 2.mp3", 2, second), ("Часть 10.mp3", 3, None)])
+
+    def test_backfill_command(self):
+        data, info_hash = torrent_bytes(123)
+        for name in ("one.torrent", "two.torrent"):
+            torrent = TorrentFile.objects.create(book=self.book, reader=self.reader, file=name)
+            # Файл, загруженный до разбора метаинформации
+            TorrentFile.objects.filter(pk=torrent.pk).update(
+                file=default_storage.save(f"uploads/torrents/{name}", ContentFile(data))
+            )
+        self.assertEqual(TorrentFile.objects.filter(info_hash="").count(), 2)
+
+        out = io.StringIO()
+        call_command("index_torrents", workers=0, duplicates=True, stdout=out)
+        self.assertEqual(TorrentFile.objects.filter(info_hash=info_hash, total_size=123).count(), 2)
+        self.assertEqual(list(TorrentFile.objects.duplicates()), [(info_hash, 2)])
+        self.assertIn(f"{info_hash}  x2", out.getvalue())
+
+    def test_backfill_queries_per_batch(self):
+        for i in range(5):
+            data, _ = torrent_bytes(100 + i)
+            torrent = TorrentFile.objects.create(book=self.book, reader=self.reader, file=f"{i}.torrent")
+            TorrentFile.objects.filter(pk=torrent.pk).update(
+                file=default_storage.save(f"uploads/torrents/{i}.torrent", ContentFile(data))
+            )
+        # Пачка - выборка и bulk_update, плюс пустая выборка в конце; без запроса на каждую запись
+        with self.assertNumQueries(3):
+            call_command("index_torrents", workers=0, stdout=io.StringIO())
+        self.assertFalse(TorrentFile.objects.filter(info_hash="").exists())
+
+
+class DedupStorageTests(SimpleTestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.storage = DedupFileSystemStorage(location=media.name)
+
+    def test_same_content_stored_once(self):
+        first = self.storage.save("uploads/book_images/a.jpg", ContentFile(b"cover" * 1000))
+        second = self.storage.save("uploads/book_images/b.jpg", ContentFile(b"cover" * 1000))
+        other = self.storage.save("uploads/book_images/a.jpg", ContentFile(b"another"))  # имя занято - новое имя
+
+        self.assertNotEqual(other, first)
+        self.assertTrue(os.path.samefile(self.storage.path(first), self.storage.path(second)))
+        self.assertEqual(self.storage.open(second).read(), b"cover" * 1000)
+        self.assertEqual(
+            self.storage.usage(),
+            {"blobs": 2, "links": 3, "stored_bytes": 5007, "logical_bytes": 10007, "saved_bytes": 5000},
+        )
+
+    def test_temporary_file_is_moved(self):
+        path = os.path.join(self.storage.location, "upload.part")
+        with open(path, "wb") as file:
+            file.write(b"torrent")
+        digest = hashlib.sha256(b"torrent").hexdigest()
+        name = self.storage.save("uploads/torrents/book.torrent", uploads.AssembledFile(path, "book.torrent", digest))
+
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.samefile(self.storage.path(name), self.storage.blob_path(digest)))
+
+    def test_garbage_collection(self):
+        kept = self.storage.save("uploads/extra_files/kept.fb2", ContentFile(b"kept"))
+        dropped = self.storage.save("uploads/extra_files/dropped.fb2", ContentFile(b"dropped"))
+        self.storage.delete(dropped)
+
+        self.assertEqual(self.storage.collect_garbage(), (0, 0))  # блоб ещё свежий
+        self.assertEqual(self.storage.collect_garbage(grace=0, dry_run=True), (1, 7))
+        self.assertEqual(self.storage.collect_garbage(grace=0), (1, 7))
+        self.assertFalse(os.path.exists(self.storage.blob_path(hashlib.sha256(b"dropped").hexdigest())))
+        self.assertEqual(self.storage.open(kept).read(), b"kept")
+        self.assertEqual(self.storage.usage()["blobs"], 1)
+
+    def test_adopt_and_command(self):
+        directory = os.path.join(self.storage.location, "uploads", "audio_files")
+        os.makedirs(directory)
+        for name in ("01-a.mp3", "01-b.mp3", "upload.part"):
+            with open(os.path.join(directory, name), "wb") as file:
+                file.write(b"part" * 256)
+
+        out = io.StringIO()
+        with self.settings(MEDIA_ROOT=self.storage.location):
+            call_command("media_dedup", adopt=True, stdout=out)
+        self.assertIn("Переведено на блобы: 2", out.getvalue())
+        self.assertTrue(os.path.samefile(os.path.join(directory, "01-a.mp3"), os.path.join(directory, "01-b.mp3")))
+        self.assertEqual(os.stat(os.path.join(directory, "upload.part")).st_nlink, 1)
+        self.assertEqual(self.storage.usage()["saved_bytes"], 1024)
+
+
+class StorageIntegrityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_superuser("admin", "admin@example.com", "password")
+        cls.book = ModelBooks.objects.create(title="Война и мир", slug="voyna-i-mir")
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = self.settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def write(self, name, data):
+        path = default_storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(data)
+
+    def test_scan_flags_orphans_and_missing(self):
+        kept = AdditionalFile.objects.create(book=self.book, file=ContentFile(b"x" * 2048, name="book.fb2"))
+        self.assertEqual(StoredFile.objects.get(path=kept.file.name).size, 2048)  # записан сразу при сохранении
+        lost = AdditionalFile.objects.create(book=self.book, file="uploads/extra_files/lost.pdf")
+        self.write("uploads/extra_files/orphan.txt", b"orphan")
+        self.write("uploads/extra_files/upload.part", b"...")
+
+        stats = integrity.scan()
+        self.assertEqual((stats["missing"], stats["orphans"]), (1, 1))
+        self.assertTrue(StoredFile.objects.filter(path="uploads/extra_files/orphan.txt", referenced=False).exists())
+        self.assertFalse(StoredFile.objects.get(path=lost.file.name).exists)
+        self.assertFalse(StoredFile.objects.filter(path__endswith=".part").exists())
+
+        kept.delete()  # запись удалена, файл остался - сирота
+        self.assertFalse(StoredFile.objects.get(path=kept.file.name).referenced)
+
+    def test_incremental_scan_reads_only_changed_directories(self):
+        self.write("uploads/audio_files/01.mp3", b"1")
+        self.write("uploads/book_images/cover.jpg", b"2")
+        self.assertEqual(integrity.scan()["files"], 2)
+
+        stats = integrity.scan()
+        self.assertEqual((stats["listed"], stats["files"], stats["updated"]), (0, 0, 0))
+
+        self.write("uploads/audio_files/02.mp3", b"22")
+        os.remove(default_storage.path("uploads/audio_files/01.mp3"))
+        stats = integrity.scan()
+        self.assertEqual((stats["listed"], stats["files"], stats["forgotten"]), (1, 1, 1))
+        self.assertEqual(
+            sorted(StoredFile.objects.values_list("path", flat=True)),
+            ["uploads/audio_files/02.mp3", "uploads/book_images/cover.jpg"],
+        )
+        self.assertEqual(integrity.scan(full=True)["listed"], 2)  # оба каталога, хотя не менялись
+
+    def test_admin_reads_sizes_from_table(self):
+        for i in range(5):
+            AdditionalFile.objects.create(book=self.book, file=ContentFile(b"x" * 1024 * 1024, name=f"{i}.pdf"))
+        self.client.force_login(self.staff)
+        probe = AssertionError("обращение к диску из админки")
+        with mock.patch.object(DedupFileSystemStorage, "size", side_effect=probe), \
+                mock.patch.object(DedupFileSystemStorage, "exists", side_effect=probe):
+            response = self.client.get(reverse("admin:bookland_additionalfile_changelist"))
+        self.assertContains(response, "1.00 MB", count=5)
+
+        call_command("scan_storage", report=5, stdout=io.StringIO())
+        self.assertEqual(StoredFile.objects.filter(exists=True, referenced=True).count(), 5)
+
+
+class SitemapFeedTests(TestCase):
+    NS = {"sm": sitemaps.SITEMAP_XMLNS, "atom": "http://www.w3.org/2005/Atom"}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = [ModelBooks.objects.create(title=f"Книга {i}", slug=f"book-{i}", year=2000 + i) for i in range(5)]
+        cls.draft = ModelBooks.objects.create(title="Черновик", slug="draft", is_published=False)
+        cls.author = Author.objects.create(surname_nick="Пелевин", slug="pelevin")
+        cls.books[0].authors.add(cls.author)
+        cls.reader = Reader.objects.create(surname_nick="Князев", slug="knyazev")
+        cls.cycle = Cycle.objects.create(name="Трилогия", slug="trilogy")
+        cls.category = ModelCategories.objects.create(name="Проза", slug="proza")
+        cls.subcategory = ModelSubcategories.objects.create(category=cls.category, name="Сатира", slug="satira")
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        override = self.settings(BOOKLAND_SITEMAP_DIR=directory.name, CACHES={"default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": f"test-{uuid.uuid4()}",
+        }})
+        override.enable()
+        self.addCleanup(override.disable)
+        patcher = mock.patch.object(sitemaps, "SHARD_SIZE", 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def locations(self, response, tag="sm:url"):
+        self.assertEqual(response.status_code, 200)
+        content = b"".join(response.streaming_content) if response.streaming else response.content
+        return [node.findtext("sm:loc", namespaces=self.NS) for node in ElementTree.fromstring(content).findall(tag, self.NS)]
+
+    def shard_url(self, section, pk):
+        return reverse("sitemap_section", args=[section, sitemaps.shard_of(pk)])
+
+    def test_absolute_urls_resolve(self):
+        for obj in (self.books[0], self.author, self.reader, self.cycle, self.category, self.subcategory):
+            response = self.client.get(obj.get_absolute_url())
+            self.assertEqual(response.status_code, 200, obj.get_absolute_url())
+            self.assertEqual(response.json()["slug"], obj.slug)
+        self.assertEqual(self.client.get(self.draft.get_absolute_url()).status_code, 404)
+        self.assertEqual(self.client.get("/categories/poeziya/satira/").status_code, 404)
+
+    def test_index_and_shards_cover_catalogue(self):
+        shards = self.locations(self.client.get(reverse("sitemap")), "sm:sitemap")
+        self.assertEqual(
+            sorted(shards),
+            sorted({f"http://testserver{self.shard_url('books', book.pk)}" for book in self.books}
+                   | {f"http://testserver{self.shard_url(name, obj.pk)}" for name, obj in (
+                       ("authors", self.author), ("readers", self.reader), ("cycles", self.cycle),
+                       ("categories", self.category), ("subcategories", self.subcategory))}),
+        )
+        urls = []
+        for shard in shards:
+            response = self.client.get(shard)
+            self.assertEqual(response["Content-Type"], sitemaps.CONTENT_TYPE)
+            urls += self.locations(response)
+        expected = self.books + [self.author, self.reader, self.cycle, self.category, self.subcategory]
+        self.assertEqual(sorted(urls), sorted(f"http://testserver{obj.get_absolute_url()}" for obj in expected))
+
+        content = b"".join(self.client.get(self.shard_url("books", self.books[0].pk)).streaming_content)
+        self.assertIn(f"<lastmod>{self.books[0].time_update.date().isoformat()}</lastmod>".encode(), content)
+        self.assertEqual(self.client.get(reverse("sitemap_section", args=["books", 10 ** 6])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("sitemap_section", args=["users", 0])).status_code, 404)
+
+    def test_only_changed_shards_are_rebuilt(self):
+        shard_urls = sorted({self.shard_url("books", book.pk) for book in self.books})
+        for url in shard_urls:
+            self.locations(self.client.get(url))
+        files = sorted(os.listdir(self.directory))
+
+        with mock.patch.object(sitemaps, "_write_shard", wraps=sitemaps._write_shard) as write:
+            for url in shard_urls:
+                with self.assertNumQueries(1):  # только версия шарда
+                    response = self.client.get(url)
+                response.close()
+            self.assertEqual(write.call_count, 0)
+
+            book = self.books[-1]
+            book.title = "Переименована"
+            book.save()
+            for url in shard_urls:
+                self.client.get(url).close()
+            self.assertEqual([call.args[2] for call in write.call_args_list], [sitemaps.shard_of(book.pk)])
+        self.assertEqual(len(os.listdir(self.directory)), len(files))  # прежняя версия шарда удалена
+
+        response = self.client.get(shard_urls[0])
+        response.close()
+        not_modified = self.client.get(shard_urls[0], HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_slug_change_invalidates_shard(self):
+        url = self.shard_url("subcategories", self.subcategory.pk)
+        self.assertEqual(self.locations(self.client.get(url)), ["http://testserver/categories/proza/satira/"])
+        self.category.name = "Поэзия"  # слаг - из названия
+        self.category.save()
+        self.assertEqual(self.locations(self.client.get(url)), ["http://testserver/categories/poeziya/satira/"])
+
+        url = self.shard_url("authors", self.author.pk)
+        self.author.name = "Виктор"
+        self.author.save()
+        self.assertEqual(self.locations(self.client.get(url)), [f"http://testserver{self.author.get_absolute_url()}"])
+        self.assertNotEqual(self.author.slug, "pelevin")
+
+    def test_version_shared_between_processes(self):
+        url = self.shard_url("authors", self.author.pk)
+        self.locations(self.client.get(url))
+        cache.get_cache().clear()  # другой процесс - свой локальный кэш; версия шарда от него не зависит
+        with mock.patch.object(sitemaps, "_write_shard", wraps=sitemaps._write_shard) as write:
+            self.assertEqual(self.locations(self.client.get(url)), ["http://testserver/authors/pelevin/"])
+        self.assertEqual(write.call_count, 0)
+
+    def test_file_removed_by_parallel_request(self):
+        replace = os.replace
+
+        def replace_then_remove(source, target):
+            replace(source, target)
+            os.remove(target)  # версию сразу удалил параллельный запрос
+
+        with mock.patch.object(sitemaps.os, "replace", side_effect=replace_then_remove):
+            response = self.client.get(self.shard_url("books", self.books[0].pk))
+        self.assertIn("http://testserver/books/book-0/", self.locations(response))
+
+    async def test_shard_streams_under_asgi(self):
+        url = self.shard_url("books", self.books[0].pk)
+        response = await self.async_client.get(url)
+        self.assertTrue(response.is_async)
+        content = b"".join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(int(response["Content-Length"]), len(content))
+        self.assertIn(b"http://testserver/books/book-0/", content)
+
+    def test_new_books_feed(self):
+        ModelBooks.objects.filter(pk=self.books[1].pk).update(time_create=self.books[1].time_create + timedelta(days=1))
+        response = self.client.get(reverse("feed", args=["rss"]))
+        self.assertEqual(response.status_code, 200)
+        items = ElementTree.fromstring(response.content).findall("channel/item")
+        self.assertEqual(len(items), 5)  # без черновика
+        self.assertEqual(items[0].findtext("link"), "http://testserver/books/book-1/")
+        self.assertEqual(self.client.get(reverse("feed", args=["rss"]), HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+        response = self.client.get(reverse("feed", args=["atom"]))
+        entries = ElementTree.fromstring(response.content).findall("atom:entry", self.NS)
+        titles = [entry.findtext("atom:title", namespaces=self.NS) for entry in entries]
+        self.assertIn("Книга 0 | Пелевин", titles)
+        self.assertEqual(self.client.get(reverse("feed", args=["json"])).status_code, 404)
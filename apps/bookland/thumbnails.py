@@ -0,0 +1,182 @@
+# D:\Python\myProject\Bookland\apps\bookland\thumbnails.py
+
+'''Уменьшенные копии обложек (BookImage) для админки и сайта.
+
+Для каждого оригинала один раз строятся производные всех размеров THUMBNAIL_SIZES
+в исходном формате (JPEG/PNG) и в WebP. Они лежат рядом с оригиналом под
+детерминированными именами: "01-kniga-avtor.jpg" -> "01-kniga-avtor.thumb.webp".
+Генерация запускается после сохранения BookImage (bookland.signals) в фоновом
+пуле процессов; пропущенные копии достраивает manage.py thumbnails.
+
+После построения версия оригинала записывается в BookImage.thumbnail_version.
+thumbnail_url() берёт её из записи, без обращений к диску, и возвращает URL
+производной с версией (?v=...) - замена файла меняет URL, поэтому браузер может
+кэшировать копии бессрочно. Пока версии нет (копии не готовы), отдаётся оригинал.
+'''
+
+import logging
+import os
+import posixpath
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connections
+from PIL import Image, ImageOps
+
+from .models import BookImage
+
+# Имя размера -> (ширина, высота) рамки, в которую вписывается изображение
+THUMBNAIL_SIZES = {
+    'thumb': (100, 100),
+    'small': (300, 300),
+    'medium': (800, 800),
+}
+THUMBNAIL_FORMATS = ('webp', 'orig')
+JPEG_QUALITY = 85
+WEBP_QUALITY = 80
+
+_executor = None
+logger = logging.getLogger(__name__)
+
+
+def derivative_name(name, size, fmt='webp'):
+    ''' Имя производной для оригинала name (имя в storage). fmt='orig' - формат оригинала. '''
+    stem, ext = posixpath.splitext(name)
+    return f"{stem}.{size}{'.webp' if fmt == 'webp' else ext.lower()}"
+
+
+def derivative_names(name):
+    return [derivative_name(name, size, fmt) for size in THUMBNAIL_SIZES for fmt in THUMBNAIL_FORMATS]
+
+
+def is_derivative(name):
+    stem = posixpath.splitext(posixpath.basename(name))[0]
+    return '.' in stem and stem.rpartition('.')[2] in THUMBNAIL_SIZES
+
+
+def source_version(path):
+    ''' Версия оригинала для URL: меняется при замене файла. '''
+    stat_result = os.stat(path)
+    return f"{stat_result.st_mtime_ns:x}{stat_result.st_size:x}"[-12:]
+
+
+def build_derivatives(path, force=False):
+    ''' Строит недостающие производные оригинала path (абсолютный путь).
+    Без Django - выполняется в пуле процессов. Возвращает число созданных файлов.
+    '''
+    created = 0
+    name = os.path.basename(path)
+    directory = os.path.dirname(path)
+    with Image.open(path) as original:
+        original = ImageOps.exif_transpose(original)
+        for size, box in THUMBNAIL_SIZES.items():
+            image = None
+            for fmt in THUMBNAIL_FORMATS:
+                target = os.path.join(directory, derivative_name(name, size, fmt))
+                if not force and os.path.exists(target):
+                    continue
+                if image is None:
+                    image = original.copy()
+                    image.thumbnail(box, Image.LANCZOS)
+                _save(image, target, fmt)
+                created += 1
+    return created
+
+
+def _save(image, target, fmt):
+    # Запись во временный файл и rename - читатель не увидит недописанную копию
+    temporary = f"{target}.tmp"
+    if fmt == 'webp':
+        image.save(temporary, 'WEBP', quality=WEBP_QUALITY, method=4)
+    elif target.endswith('.png'):
+        image.save(temporary, 'PNG', optimize=True)
+    else:
+        image.convert('RGB').save(temporary, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    os.replace(temporary, target)
+
+
+def _build_quietly(path):
+    ''' (версия оригинала, число созданных копий); версия '' - копии построить не удалось. '''
+    try:
+        created = build_derivatives(path)
+        return source_version(path), created
+    except Exception:  # битый, слишком большой (DecompressionBombError) или удалённый файл
+        logger.exception("Не удалось построить уменьшенные копии %s", path)
+        return '', 0
+
+
+def store_version(pk, name, version):
+    ''' Записывает версию готовых копий, если изображение pk за это время не заменили. '''
+    if version:
+        BookImage.objects.filter(pk=pk, image=name).update(thumbnail_version=version)
+
+
+def _store_when_done(pk, name):
+    def callback(future):
+        # Вызывается в служебном потоке пула - своё соединение с БД закрываем сами
+        try:
+            store_version(pk, name, future.result()[0])
+        except Exception:
+            logger.exception("Не удалось записать версию копий %s", name)
+        finally:
+            connections.close_all()
+    return callback
+
+
+def schedule_derivatives(pk, name, path):
+    ''' Отправляет построение производных изображения pk (name - имя в storage, path - путь
+    к файлу) в фоновый пул; по готовности записывает версию в BookImage.thumbnail_version.
+    THUMBNAIL_WORKERS = 0 в settings - строить сразу, в текущем процессе.
+    '''
+    global _executor
+    workers = getattr(settings, 'THUMBNAIL_WORKERS', 2)
+    if not workers:
+        version, created = _build_quietly(path)
+        store_version(pk, name, version)
+        return created
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=workers)
+    future = _executor.submit(_build_quietly, path)
+    future.add_done_callback(_store_when_done(pk, name))
+    return future
+
+
+def delete_derivatives(name):
+    ''' Удаляет производные оригинала name. Возвращает число удалённых файлов. '''
+    deleted = 0
+    for derivative in derivative_names(name):
+        if default_storage.exists(derivative):
+            default_storage.delete(derivative)
+            deleted += 1
+    return deleted
+
+
+def orphaned_derivatives(directory):
+    ''' Производные в каталоге directory (имя в storage), оригинала которых больше нет. '''
+    _, files = default_storage.listdir(directory)
+    files = set(files)
+    originals = {name for name in files if not is_derivative(name)}
+    for name in sorted(files - originals):
+        if name.endswith('.tmp'):
+            continue
+        stem, ext = posixpath.splitext(name)
+        base = stem.rpartition('.')[0]
+        if not any(f"{base}{source_ext}" in originals for source_ext in _source_extensions(ext)):
+            yield posixpath.join(directory, name)
+
+
+def _source_extensions(ext):
+    if ext == '.webp':
+        return ('.jpg', '.jpeg', '.png', '.JPG', '.JPEG', '.PNG')
+    return (ext, ext.upper())
+
+
+def thumbnail_url(book_image, size='thumb', fmt='webp'):
+    ''' URL уменьшенной копии BookImage с версией оригинала; оригинал, если копии ещё не построены. '''
+    if not book_image.image:
+        return ''
+    if not book_image.thumbnail_version:
+        return book_image.image.url
+    name = derivative_name(book_image.image.name, size, fmt)
+    return f"{default_storage.url(name)}?v={book_image.thumbnail_version}"
@@ -0,0 +1,193 @@
+# D:\Python\myProject\Bookland\apps\bookland\torrent_meta.py
+
+'''Разбор метаинформации .torrent (bencode) потоком, без чтения файла целиком.
+
+Info-hash - SHA-1 исходных байтов словаря info: хешер подключается к потоку на
+время разбора info, поэтому словарь не сериализуется заново. Длинные строки
+(pieces - по 20 байт на кусок) в память не читаются: от них остаётся только длина.
+Поддерживаются торренты v1 и гибридные v1+v2 (info-hash v1); чистые v2 - нет.
+
+Модуль не зависит от Django - extract выполняется в пуле процессов
+(manage.py index_torrents).
+'''
+
+import hashlib
+from collections import namedtuple
+
+TorrentMetadata = namedtuple(
+    'TorrentMetadata', ['info_hash', 'name', 'total_size', 'piece_length', 'piece_count', 'files']
+)  # files - [(путь внутри раздачи, размер)]
+
+READ_SIZE = 64 * 1024
+STRING_LIMIT = 64 * 1024  # Строки длиннее не хранятся в памяти - только их длина
+MAX_DEPTH = 32
+PIECE_HASH_SIZE = 20
+
+
+class Skipped(namedtuple('Skipped', ['length'])):
+    ''' Строка, пропущенная без чтения в память (длиннее STRING_LIMIT). '''
+
+
+class _Stream:
+    ''' Буферизованное чтение с подсчётом SHA-1 прочитанного, пока задан hasher. '''
+
+    def __init__(self, file):
+        self.file = file
+        self.buffer = b''
+        self.pos = 0
+        self.hasher = None
+
+    def _fill(self):
+        chunk = self.file.read(READ_SIZE)
+        if not chunk:
+            raise ValueError("Неожиданный конец файла")
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+
+    def _take(self, n):
+        data = self.buffer[self.pos:self.pos + n]
+        self.pos += n
+        if self.hasher:
+            self.hasher.update(data)
+        return data
+
+    def peek(self):
+        if self.pos >= len(self.buffer):
+            self._fill()
+        return self.buffer[self.pos:self.pos + 1]
+
+    def read(self, n):
+        while len(self.buffer) - self.pos < n:
+            self._fill()
+        return self._take(n)
+
+    def skip(self, n):
+        while n:
+            if self.pos >= len(self.buffer):
+                self._fill()
+            n -= len(self._take(min(n, len(self.buffer) - self.pos)))
+
+    def read_until(self, delimiter, limit=32):
+        while True:
+            end = self.buffer.find(delimiter, self.pos)
+            if end != -1:
+                break
+            if len(self.buffer) - self.pos > limit:
+                raise ValueError("Слишком длинное число")
+            self._fill()
+        data = self._take(end - self.pos)
+        self._take(1)
+        return data
+
+
+def _integer(data):
+    if not data or data != str(int(data)).encode():  # без ведущих нулей, "-0" и пробелов
+        raise ValueError(f"Некорректное число: {data[:32]!r}")
+    return int(data)
+
+
+def _value(stream, depth=0):
+    if depth > MAX_DEPTH:
+        raise ValueError("Слишком глубокая вложенность")
+    token = stream.read(1)
+    if token == b'i':
+        return _integer(stream.read_until(b'e'))
+    if token == b'l':
+        items = []
+        while stream.peek() != b'e':
+            items.append(_value(stream, depth + 1))
+        stream.read(1)
+        return items
+    if token == b'd':
+        items = {}
+        while stream.peek() != b'e':
+            key = _value(stream, depth + 1)
+            if not isinstance(key, bytes):
+                raise ValueError("Ключ словаря - не строка")
+            if depth == 0 and key == b'info':
+                stream.hasher = hashlib.sha1()
+                items[key] = _value(stream, depth + 1)
+                stream.info_hash, stream.hasher = stream.hasher.hexdigest(), None
+            else:
+                items[key] = _value(stream, depth + 1)
+        stream.read(1)
+        return items
+    if token.isdigit():
+        length = _integer(token + stream.read_until(b':'))
+        if length > STRING_LIMIT:
+            stream.skip(length)
+            return Skipped(length)
+        return stream.read(length)
+    raise ValueError(f"Неизвестный тип bencode: {token!r}")
+
+
+def _text(value):
+    if not isinstance(value, bytes):
+        raise ValueError("Ожидалась строка")
+    return value.decode('utf-8', errors='replace')
+
+
+def _size(value):
+    if not isinstance(value, int) or value < 0:
+        raise ValueError("Некорректный размер")
+    return value
+
+
+def read_torrent(file):
+    ''' Метаинформация торрента из файлового объекта file (двоичный, читается потоком).
+    ValueError - не bencode, нет словаря info или торрент только v2.
+    '''
+    stream = _Stream(file)
+    stream.info_hash = None
+    if stream.peek() != b'd':
+        raise ValueError("Файл не является торрентом (ожидается словарь bencode)")
+    info = _value(stream).get(b'info')
+    if not isinstance(info, dict):
+        raise ValueError("В торренте нет словаря info")
+    pieces = info.get(b'pieces')
+    if pieces is None:
+        raise ValueError("Торренты только версии 2 не поддерживаются")
+    if not isinstance(pieces, (bytes, Skipped)):
+        raise ValueError("Некорректное поле pieces")
+    pieces_length = pieces.length if isinstance(pieces, Skipped) else len(pieces)
+    if pieces_length % PIECE_HASH_SIZE:
+        raise ValueError("Некорректная длина pieces")
+
+    name = _text(info.get(b'name.utf-8', info.get(b'name', b'')))
+    if b'files' in info:
+        if not isinstance(info[b'files'], list):
+            raise ValueError("Некорректный список файлов")
+        files = []
+        for entry in info[b'files']:
+            if not isinstance(entry, dict):
+                raise ValueError("Некорректный список файлов")
+            path = entry.get(b'path.utf-8', entry.get(b'path'))
+            if not isinstance(path, list) or not path:
+                raise ValueError("Некорректный путь файла")
+            attr = entry.get(b'attr', b'')
+            if isinstance(attr, bytes) and b'p' in attr:  # файлы выравнивания (BEP 47)
+                continue
+            files.append(('/'.join(_text(part) for part in path), _size(entry.get(b'length'))))
+    else:
+        files = [(name, _size(info.get(b'length')))]
+    return TorrentMetadata(
+        info_hash=stream.info_hash,
+        name=name,
+        total_size=sum(length for _, length in files),
+        piece_length=_size(info.get(b'piece length')),
+        piece_count=pieces_length // PIECE_HASH_SIZE,
+        files=files,
+    )
+
+
+def read_torrent_file(path):
+    with open(path, 'rb') as file:
+        return read_torrent(file)
+
+
+def extract(path):
+    ''' Обёртка для пула процессов: (metadata, ошибка) без исключений. '''
+    try:
+        return read_torrent_file(path), ''
+    except (OSError, ValueError) as error:
+        return None, f"{type(error).__name__}: {error}"
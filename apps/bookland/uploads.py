@@ -0,0 +1,210 @@
+# D:\Python\myProject\Bookland\apps\bookland\uploads.py
+
+'''Докачиваемая загрузка больших файлов частями (AudioFile, TorrentFile, AdditionalFile).
+
+Клиент открывает сессию (start_upload) и шлёт части по порядку (write_chunk).
+Части пишутся блоками по UPLOAD_BLOCK_SIZE прямо в "<id>.part" в каталоге
+upload_to модели - на той же файловой системе, что и итоговый файл, - поэтому
+память процесса не зависит от размера файла. SHA-256 считается по ходу записи.
+После последней части хеш сверяется с заявленным, и создаётся строка модели.
+Файл при этом переименовывается (os.rename через FileSystemStorage) - второй
+полной копии нет.
+
+Части одной сессии могут приходить в разные процессы (несколько воркеров):
+- приём части захватывает сессию в БД (writing_until - аренда на UPLOAD_LEASE,
+  условие "offset = начало части и аренды нет" проверяется тем же UPDATE),
+  поэтому две части с одного байта не пишутся в файл одновременно; аренда
+  упавшего процесса истекает сама;
+- состояние SHA-256 (hashlib не сериализуется) живёт в памяти процесса. Если
+  предыдущую часть принял другой процесс, хеш по ходу записи не ведётся, а
+  считается один раз по готовому файлу в finish_upload - перехеширования
+  на каждой части нет. Состояния брошенных сессий удаляются через UPLOAD_HASHER_TTL;
+- последняя часть тем же UPDATE, что записывает offset, переводит сессию в
+  finishing, аренда сохраняется до создания строки модели. Повтор последней
+  части или пустая часть с offset = size в это время получает 409, а не
+  вторую строку модели; если завершение не удалось, сессия снова active и
+  завершение можно повторить пустой частью.
+'''
+
+import hashlib
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ChunkedUpload, AudioFile, TorrentFile, AdditionalFile
+
+UPLOAD_BLOCK_SIZE = 64 * 1024
+UPLOAD_LEASE = timedelta(minutes=15)  # Приём одной части дольше - обработчик считается упавшим
+UPLOAD_HASHER_TTL = 3600  # с - состояние хеша сессии без новых частей удаляется
+
+UPLOAD_MODELS = {
+    'audio': AudioFile,
+    'torrent': TorrentFile,
+    'additional': AdditionalFile,
+}
+
+# id сессии -> (offset, sha256-объект, time.monotonic() последней части), см. модуль
+_hashers = {}
+
+
+class AssembledFile(File):
+    ''' Собранный на диске файл: storage перемещает его (temporary_file_path), а не копирует.
+    sha256 - уже посчитанный хеш содержимого (его берёт bookland.storage вместо повторного чтения).
+    '''
+
+    def __init__(self, path, name, sha256=None):
+        super().__init__(None, name=name)
+        self.path = path
+        self.size = os.path.getsize(path)
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self.path
+
+    def open(self, mode='rb'):
+        self.file = open(self.path, mode)
+        return self
+
+
+def part_path(upload):
+    upload_to = UPLOAD_MODELS[upload.kind]._meta.get_field('file').upload_to
+    return os.path.join(settings.MEDIA_ROOT, upload_to, f"{upload.pk}.part")
+
+
+def start_upload(kind, book, filename, size, sha256='', reader=None):
+    ''' Открывает сессию загрузки и создаёт пустой .part-файл. '''
+    if kind not in UPLOAD_MODELS:
+        raise ValidationError(f"Неизвестный тип файла: {kind}")
+    if kind == 'torrent' and reader is None:
+        raise ValidationError("Для торрент-файла нужно указать чтеца.")
+    if size < 0:
+        raise ValidationError("Размер файла не может быть отрицательным.")
+    for validator in UPLOAD_MODELS[kind]._meta.get_field('file').validators:
+        validator(File(None, name=filename))
+
+    upload = ChunkedUpload.objects.create(
+        kind=kind, book=book, reader=reader, filename=os.path.basename(filename), size=size, sha256=sha256.lower()
+    )
+    path = part_path(upload)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    _evict_hashers()
+    _hashers[upload.pk] = (0, hashlib.sha256(), time.monotonic())
+    return upload
+
+
+def _evict_hashers():
+    deadline = time.monotonic() - UPLOAD_HASHER_TTL
+    for pk in [pk for pk, (_, _, used) in _hashers.items() if used < deadline]:
+        _hashers.pop(pk, None)
+
+
+def _running_hasher(upload):
+    ''' Хеш, доведённый этим процессом до upload.offset, или None (см. модуль). '''
+    cached = _hashers.pop(upload.pk, None)
+    if cached and cached[0] == upload.offset:
+        return cached[1]
+    return None
+
+
+def _digest(upload):
+    ''' SHA-256 готового файла: из состояния процесса или одним чтением файла. '''
+    hasher = _running_hasher(upload)
+    if hasher is None:
+        hasher = hashlib.sha256()
+        with open(part_path(upload), 'rb') as part:
+            for block in iter(lambda: part.read(UPLOAD_BLOCK_SIZE), b''):
+                hasher.update(block)
+    return hasher.hexdigest()
+
+
+def write_chunk(upload, start, stream, length):
+    ''' Дописывает часть длиной length из потока stream (объект с read(n)) начиная с байта start.
+    Возвращает созданный объект модели после последней части, иначе None.
+    '''
+    if upload.status == 'complete':
+        raise ValidationError("Загрузка уже завершена.", code='complete')
+    if start != upload.offset:
+        raise ValidationError(f"Ожидалась часть с байта {upload.offset}.", code='offset')
+    if length < 0 or start + length > upload.size:
+        raise ValidationError("Часть выходит за пределы заявленного размера файла.")
+
+    now = timezone.now()
+    sessions = ChunkedUpload.objects.filter(pk=upload.pk)
+    # finishing с истёкшей арендой - завершавший процесс упал, завершение можно повторить
+    claimed = sessions.filter(status__in=['active', 'finishing'], offset=start).filter(
+        Q(writing_until__isnull=True) | Q(writing_until__lt=now)
+    ).update(writing_until=now + UPLOAD_LEASE)
+    if not claimed:
+        raise ValidationError("Часть уже записывается или записана параллельным запросом.", code='offset')
+
+    _evict_hashers()
+    hasher = _running_hasher(upload)
+    remaining = length
+    try:
+        with open(part_path(upload), 'r+b') as part:
+            part.seek(start)
+            while remaining:
+                block = stream.read(min(UPLOAD_BLOCK_SIZE, remaining))
+                if not block:  # клиент оборвал соединение - сохраняем то, что успели получить
+                    break
+                part.write(block)
+                if hasher:
+                    hasher.update(block)
+                remaining -= len(block)
+            part.truncate()
+    finally:
+        offset = start + length - remaining
+        if offset == upload.size:  # аренда остаётся у этого запроса до конца finish_upload
+            sessions.update(offset=offset, status='finishing')
+        else:
+            sessions.update(offset=offset, status='active', writing_until=None)
+    upload.offset = offset
+    if hasher:
+        _hashers[upload.pk] = (offset, hasher, time.monotonic())
+
+    if upload.offset == upload.size:
+        upload.status = 'finishing'
+        return finish_upload(upload)
+    return None
+
+
+def finish_upload(upload):
+    ''' Сверяет хеш и создаёт строку модели, перемещая собранный файл на итоговое место.
+    Вызывается только запросом, который перевёл сессию в finishing (см. модуль).
+    '''
+    try:
+        return _finish(upload)
+    except BaseException:
+        ChunkedUpload.objects.filter(pk=upload.pk, status='finishing').update(status='active', writing_until=None)
+        upload.status = 'active'
+        raise
+
+
+def _finish(upload):
+    path = part_path(upload)
+    digest = _digest(upload)
+    if upload.sha256 and digest != upload.sha256:
+        os.remove(path)
+        upload.delete()
+        raise ValidationError("Контрольная сумма SHA-256 не совпадает, загрузку нужно начать заново.", code='hash')
+
+    instance = UPLOAD_MODELS[upload.kind](book=upload.book)
+    if upload.kind == 'torrent':
+        instance.reader = upload.reader
+    instance.file = AssembledFile(path, upload.filename, sha256=digest)
+    with transaction.atomic():
+        instance.save()
+        upload.status = 'complete'
+        upload.sha256 = digest
+        upload.object_id = instance.pk
+        upload.writing_until = None
+        upload.save(update_fields=['status', 'sha256', 'object_id', 'writing_until', 'updated_at'])
+    return instance
@@ -1,11 +1,39 @@
 # D:\Python\myProject\Bookland\apps\bookland\urls.py
 
-from django.urls import path
+from django.urls import path, re_path
 from django.conf import settings
-from django.conf.urls.static import static
-from .views import index
+from .api import api_category_tree, api_detail, api_list
+from .feeds import new_books_feed
+from .media import serve_media
+from .sitemaps import sitemap_index, sitemap_section
+from .views import (
+    audio_ingest, audio_reorder, audiobook, author, cache_stats, category, cycle, index, reader, search, stats,
+    subcategory, upload_chunk, upload_start,
+)
 
 
 urlpatterns = [
     path('', index),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    path('search/', search, name='search'),
+    path('books/<slug:slug>/', audiobook, name='audiobook'),
+    path('authors/<slug:slug>/', author, name='author'),
+    path('readers/<slug:slug>/', reader, name='reader'),
+    path('cycles/<slug:cycle_slug>/', cycle, name='cycle'),
+    path('categories/<slug:cat_slug>/', category, name='category'),
+    path('categories/<slug:cat_slug>/<slug:subcat_slug>/', subcategory, name='subcategory'),
+    path('sitemap.xml', sitemap_index, name='sitemap'),
+    path('sitemap-<slug:section>-<int:shard>.xml', sitemap_section, name='sitemap_section'),
+    path('feeds/new/<slug:feed_type>/', new_books_feed, name='feed'),
+    path('uploads/', upload_start, name='upload_start'),
+    path('uploads/<uuid:pk>/', upload_chunk, name='upload_chunk'),
+    path('uploads/books/<int:book_id>/audio/', audio_ingest, name='audio_ingest'),
+    path('uploads/books/<int:book_id>/audio/order/', audio_reorder, name='audio_reorder'),
+    path('__stats__/', stats, name='stats'),
+    path('__stats__/cache/', cache_stats, name='cache_stats'),
+    path('api/category-tree/', api_category_tree, name='api_category_tree'),
+    path('api/categories/<slug:cat_slug>/<slug:slug>/', api_detail, {'resource_name': 'subcategories'},
+         name='api_subcategory'),
+    path('api/<str:resource_name>/', api_list, name='api_list'),
+    path('api/<str:resource_name>/<slug:slug>/', api_detail, name='api_detail'),
+    re_path(rf"^{settings.MEDIA_URL.lstrip('/')}(?P<path>.+)$", serve_media, name='media'),
+]
\ No newline at end of file
@@ -1,93 +1,124 @@
 # D:\Python\django\myLibrary\app\app\utilities.py
 
 import re
+from functools import lru_cache
+
+from django.utils.text import slugify
+
+# Таблица транслитерации: кириллица (и другие символы - непотребности) -> латиница
+TRANSLIT_DICT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh', 'з': 'z', 'и': 'i',
+    'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't',
+    'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch', 'ъ': '', 'ы': 'y', 'ь': '',
+    'э': 'e', 'ю': 'yu', 'я': 'ya', 'ґ': 'g', 'є': 'ie', 'ї': 'i', 'і': 'i',
+    'ç': 'c', 'ş': 's', 'ğ': 'g', 'ı': 'i',
+    'ä': 'ae', 'ö': 'oe', 'ü': 'ue', 'ß': 'ss',
+    'à': 'a', 'è': 'e', 'é': 'e', 'ê': 'e', 'ô': 'o', 'û': 'u', 'â': 'a',
+    'а̑': 'a', 'э̑': 'e', 'и̑': 'i', 'о̑': 'o', 'у̑': 'u', 'ĭ': 'y',
+    '0': '0', '1': '1', '2': '2', '3': '3', '4': '4',
+    '5': '5', '6': '6', '7': '7', '8': '8', '9': '9',
+}
+
+# Добавим символы, подлежащие замене
+TRANSLIT_DICT.update({
+    '?': '_', '<': '_', '>': '_', ' ': '_', '~': '_', '@': '_', '"': '_', "'": '_', ':': '_',
+    ';': '_', '#': '_', '$': '_', '&': '_', '*': '_', '(': '_', ')': '_', '\\': '_', '|': '_',
+    '/': '_', '.': '_',
+    '«': '_', '»': '_',
+    ',': '_', '!': '_',
+    '‐': '-', '−': '-', '–': '-', '—': '-', '-': '-',
+    '“': '_', '”': '_', '„': '_',
+    '…': '_', '№': '_', '+': '_',
+})
+
+# Серии одинаковых разделителей ("___", "---") схлопываются за один проход
+_SEPARATOR_RUNS_RE = re.compile(r'([_-])\1+')
+
+# Числа в имени - отдельные части ключа natural_key
+_DIGITS_RE = re.compile(r'(\d+)')
+
+
+class _TranslitTable(dict):
+    ''' Таблица для str.translate, заполняемая по мере встречи символов.
+    Символ заменяется по TRANSLIT_DICT с учётом регистра (ключ - char.lower()),
+    остальные символы остаются как есть. Вычисленное значение кешируется,
+    поэтому каждый кодовый пункт разбирается не более одного раза.
+    '''
+
+    def __missing__(self, code):
+        char = chr(code)
+        value = TRANSLIT_DICT.get(char.lower(), char)
+        self[code] = value
+        return value
+
+
+_TRANSLIT_TABLE = _TranslitTable()
+
 
+def _translit(input_str):
+    ''' Транслитерация без кеша: одна замена по таблице, одно регулярное выражение
+    для схлопывания разделителей и обрезка "_" и "-" по краям.
+    '''
+    output_str = input_str.translate(_TRANSLIT_TABLE)
+    if '__' in output_str or '--' in output_str:
+        output_str = _SEPARATOR_RUNS_RE.sub(r'\1', output_str)
+    return output_str.strip('_').strip('-').lower()
+
+
+@lru_cache(maxsize=65536)
 def translit_re(input_str):
-    ''' Обеспечение транслитерации кириллицы (и другие символы - непотребности) в латиницу,
-    re (регулярные выражения):
-    Преимущества:
-    Гибкость и контроль над процессом транслитерации с использованием регулярных выражений.
-    Полный контроль над символами, которые подлежат замене.
-    Недостатки:
-    Требует более длинного кода, особенно если нужно обработать много разных символов.
+    ''' Обеспечение транслитерации кириллицы (и другие символы - непотребности) в латиницу.
+    Таблица замен и регулярное выражение собираются один раз при импорте модуля,
+    результаты запоминаются (LRU), т.к. одни и те же имена авторов, чтецов и циклов
+    транслитерируются многократно (сохранение моделей, имена файлов, импорт каталога).
     '''
-    translit_dict = {
-        'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh', 'з': 'z', 'и': 'i',
-        'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't',
-        'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch', 'ъ': '', 'ы': 'y', 'ь': '',
-        'э': 'e', 'ю': 'yu', 'я': 'ya', 'ґ': 'g', 'є': 'ie', 'ї': 'i', 'і': 'i',
-        'ç': 'c', 'ş': 's', 'ğ': 'g', 'ı': 'i',
-        'ä': 'ae', 'ö': 'oe', 'ü': 'ue', 'ß': 'ss',
-        'à': 'a', 'è': 'e', 'é': 'e', 'ê': 'e', 'ô': 'o', 'û': 'u', 'â': 'a',
-        'а̑': 'a', 'э̑': 'e', 'и̑': 'i', 'о̑': 'o', 'у̑': 'u', 'ĭ': 'y',
-        '0': '0', '1': '1', '2': '2', '3': '3', '4': '4',
-        '5': '5', '6': '6', '7': '7', '8': '8', '9': '9',
-    }
-
-    # Добавим символы, подлежащие замене
-    translit_dict.update({
-        '?': '_', '<': '_', '>': '_', ' ': '_', '~': '_', '@': '_', '"': '_', "'": '_', ':': '_',
-        ';': '_', '#': '_', '$': '_', '&': '_', '*': '_', '(': '_', ')': '_', '\\': '_', '|': '_',
-        '/': '_', '.': '_',
-        '«': '_', '»': '_',
-        ',': '_', '!': '_',
-        '‐': '-', '−': '-', '–': '-', '—': '-', '-': '-',
-        '“': '_', '”': '_', '„': '_',
-        '…': '_', '№': '_', '+': '_',
-    })
-
-    # Заменяем все символы, кроме латинских букв и "-"
-    output_str = ''.join([translit_dict.get(char.lower(), char) for char in input_str])
-
-    # Заменяем множественные подчеркивания на одно
-    output_str = re.sub('_+', '_', output_str)
-
-    # Удаление подчеркиваний в начале и конце строки
-    output_str = output_str.strip('_')
-
-    # Заменяем множественные дефисы на одно
-    output_str = re.sub('-+', '-', output_str)
-
-    # Удаление дефисов в начале и конце строки
-    output_str = output_str.strip('-')
-
-    return output_str.lower()
+    return _translit(input_str)
 
 
-'''Метод формирования имен загружаемых медио-файлов'''
-def generate_file_name(instance, filename, file_type):
-    if hasattr(instance, 'book'):
-        # Это TorrentFile
-        book = instance.book
-    else:
-        # Это ModelBooks
-        book = instance
+def translit_many(iterable):
+    ''' Пакетная транслитерация: возвращает список слагов в порядке входных строк. '''
+    return [translit_re(input_str) for input_str in iterable]
 
-    authors = book.authors.all()
-    author_slugs = '-'.join(author.slug for author in authors) if authors.exists() else "unknown"
 
+SLUG_BASE_LENGTH = 110  # Слаг книги без суффикса "-N": с ним помещается в SlugField(max_length=120)
+
+
+def book_base_slug(title, max_length=SLUG_BASE_LENGTH):
+    ''' Базовый слаг книги (без суффикса "-N"). Латинские названия обрабатываются slugify как раньше,
+    кириллические предварительно транслитерируются (slugify их просто выбрасывает).
+    Длина ограничена, чтобы с суффиксом слаг помещался в SlugField(max_length=120).
+    '''
+    if not title.isascii():
+        title = translit_re(title).replace('_', '-')
+    return slugify(title)[:max_length].strip('-')
+
+
+'''Метод формирования имен загружаемых медио-файлов'''
+def build_file_name_prefix(book_slug, author_slugs, cycle_slug=None, cycle_number=None):
+    ''' Общая часть имён файлов книги: слаг книги, цикл с номером книги в нём, слаги авторов. '''
+    authors = '-'.join(author_slugs) or "unknown"
+    if cycle_slug:
+        number = translit_re(cycle_number) if cycle_number else "00"
+        return f"{book_slug}-{cycle_slug}-{number}-{authors}"
+    return f"{book_slug}-{authors}"
+
+
+def generate_file_name(prefix, filename, file_type, number=None, reader_slug=None):
+    ''' Имя файла книги. prefix - build_file_name_prefix (кэшируется в BookFileNaming),
+    number - порядковый номер аудиофайла или изображения, reader_slug - чтец торрента.
+    '''
     ext = filename.split('.')[-1]
 
-    if book.work_type == 'cycle' and book.cycle:
-        cycle_slug = book.cycle.slug
-        if book.cycle_number:
-            cycle_number = translit_re(book.cycle_number)
-        else:
-            cycle_number = "00"
-        base_name = f"{book.slug}-{cycle_slug}-{cycle_number}-{author_slugs}"
-    else:
-        base_name = f"{book.slug}-{author_slugs}"
-
-    if file_type == 'audio':
-        count = book.audio_files.count() + 1
-        new_name = f"{count:02d}-{base_name}.{ext}"
-    elif file_type == 'image':
-        count = book.book_images_set.count() + 1
-        new_name = f"{count:02d}-{base_name}.{ext}"
-    elif file_type == 'torrent':
-        reader_slug = instance.reader.slug if hasattr(instance, 'reader') else "unknown-reader"
-        new_name = f"{base_name}-({reader_slug}).{ext}"
-    else:  # 'additional'
-        new_name = f"{base_name}.{ext}"
-
-    return new_name
\ No newline at end of file
+    if file_type in ('audio', 'image'):
+        return f"{number:02d}-{prefix}.{ext}"
+    if file_type == 'torrent':
+        return f"{prefix}-({reader_slug or 'unknown-reader'}).{ext}"
+    return f"{prefix}.{ext}"  # 'additional'
+
+
+def natural_key(name):
+    ''' Ключ сортировки имён с числами по значению чисел: "Part 2" < "Part 10". '''
+    return tuple(
+        (0, int(part), '') if part.isdigit() else (1, 0, part.casefold())
+        for part in _DIGITS_RE.split(name) if part
+    )
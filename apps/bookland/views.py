@@ -1,8 +1,191 @@
 # D:\Python\myProject\Bookland\apps\bookland\views.py
 
-from django.http import HttpResponse
-from django.shortcuts import render
+import json
+import re
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.views.decorators.http import require_http_methods
 
-def index(request):
+from . import cache, profiling
+from .api import api_detail
+from .audio_ingest import ingest_audio, open_parts, reorder_audio
+from .models import ChunkedUpload, ModelBooks, Reader
+from .search import search_books
+from .uploads import start_upload, write_chunk
+
+SEARCH_MAX_LIMIT = 100
+
+
+async def index(request):
     return HttpResponse('<a href="http://127.0.0.1:8000/admin/"> Админ-панель </a>')
+
+
+async def search(request):
+    ''' JSON-поиск по опубликованным книгам: ?q=<запрос>&limit=<1..100>. '''
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), SEARCH_MAX_LIMIT)
+    except ValueError:
+        limit = 20
+    # FTS-запрос через raw() - у RawQuerySet нет async API
+    books = await sync_to_async(search_books)(query, limit)
+    results = [
+        {'id': book.pk, 'title': book.title, 'slug': book.slug, 'year': book.year}
+        for book in books
+    ]
+    return JsonResponse({'query': query, 'results': results})
+
+
+# Страницы каталога (get_absolute_url моделей). HTML-шаблонов пока нет - отдаётся
+# то же представление, что и в API (кэш, ETag, ?fields=)
+
+async def audiobook(request, slug):
+    return await api_detail(request, 'books', slug)
+
+
+async def author(request, slug):
+    return await api_detail(request, 'authors', slug)
+
+
+async def reader(request, slug):
+    return await api_detail(request, 'readers', slug)
+
+
+async def cycle(request, cycle_slug):
+    return await api_detail(request, 'cycles', cycle_slug)
+
+
+async def category(request, cat_slug):
+    return await api_detail(request, 'categories', cat_slug)
+
+
+async def subcategory(request, cat_slug, subcat_slug):
+    return await api_detail(request, 'subcategories', subcat_slug, cat_slug)
+
+
+_CONTENT_RANGE_RE = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+
+
+def _staff_only(request):
+    if not (request.user.is_authenticated and request.user.is_staff):
+        return JsonResponse({'error': 'Требуется вход в админ-панель.'}, status=403)
+    return None
+
+
+def _upload_state(upload, instance=None):
+    return {
+        'id': str(upload.pk),
+        'offset': upload.offset,
+        'size': upload.size,
+        'status': upload.status,
+        'object_id': instance.pk if instance else upload.object_id,
+    }
+
+
+@require_http_methods(["POST"])
+def upload_start(request):
+    ''' Открытие сессии загрузки частями: JSON {kind, book, filename, size, sha256?, reader?}. '''
+    denied = _staff_only(request)
+    if denied:
+        return denied
+    try:
+        data = json.loads(request.body)
+        book = get_object_or_404(ModelBooks, pk=data['book'])
+        reader = get_object_or_404(Reader, pk=data['reader']) if data.get('reader') else None
+        upload = start_upload(
+            data['kind'], book, data['filename'], int(data['size']), data.get('sha256', ''), reader
+        )
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Ожидается JSON с полями kind, book, filename, size.'}, status=400)
+    except ValidationError as error:
+        return JsonResponse({'error': error.messages}, status=400)
+    return JsonResponse(_upload_state(upload), status=201)
+
+
+@require_http_methods(["GET", "HEAD", "PUT"])
+def upload_chunk(request, pk):
+    ''' GET/HEAD - сколько байт уже получено (для докачки); PUT - очередная часть.
+    Начало части берётся из заголовка Content-Range ("bytes 0-1048575/5000000").
+    Тело читается из потока запроса блоками, в память целиком не попадает.
+    '''
+    denied = _staff_only(request)
+    if denied:
+        return denied
+    upload = get_object_or_404(ChunkedUpload, pk=pk)
+    if request.method != "PUT":
+        return JsonResponse(_upload_state(upload))
+
+    length = int(request.META.get('CONTENT_LENGTH') or 0)
+    match = _CONTENT_RANGE_RE.fullmatch(request.headers.get('Content-Range', ''))
+    start = int(match.group(1)) if match else upload.offset
+    if match and int(match.group(2)) - start + 1 != length:
+        return JsonResponse({'error': 'Content-Range не совпадает с Content-Length.'}, status=400)
+    try:
+        instance = write_chunk(upload, start, request, length)
+    except ValidationError as error:
+        status = 409 if error.code in ('offset', 'complete') else 400
+        return JsonResponse({'error': error.messages, **_upload_state(upload)}, status=status)
+    return JsonResponse(_upload_state(upload, instance))
+
+
+@require_http_methods(["POST"])
+def audio_ingest(request, book_id):
+    ''' Пакетная загрузка частей книги: multipart "files" (несколько файлов или каталог)
+    либо "archive" (zip/tar). Части сортируются по именам и добавляются в конец книги.
+    '''
+    denied = _staff_only(request)
+    if denied:
+        return denied
+    book = get_object_or_404(ModelBooks, pk=book_id)
+    source = request.FILES.getlist('files') or request.FILES.get('archive')
+    if not source:
+        return JsonResponse({'error': 'Ожидаются файлы "files" или архив "archive".'}, status=400)
+    try:
+        with open_parts(source) as parts:
+            created = ingest_audio(book, parts)
+    except ValidationError as error:
+        return JsonResponse({'error': error.messages}, status=400)
+    return JsonResponse({'files': [
+        {'id': audio.pk, 'order': audio.order, 'file': audio.file.name} for audio in created
+    ]}, status=201)
+
+
+@require_http_methods(["POST"])
+def audio_reorder(request, book_id):
+    ''' Новый порядок частей книги (перетаскивание): JSON {"order": [id, ...]} - все части. '''
+    denied = _staff_only(request)
+    if denied:
+        return denied
+    book = get_object_or_404(ModelBooks, pk=book_id)
+    try:
+        order = json.loads(request.body)['order']
+        reorder_audio(book, order)
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Ожидается JSON с полем order - списком id аудиофайлов.'}, status=400)
+    except ValidationError as error:
+        return JsonResponse({'error': error.messages}, status=400)
+    return JsonResponse({'order': [int(pk) for pk in order]})
+
+
+def cache_stats(request):
+    ''' Попадания и промахи кэша каталога (bookland.cache) в этом процессе - для мониторинга. '''
+    denied = _staff_only(request)
+    if denied:
+        return denied
+    return JsonResponse({'cache': cache.stats()})
+
+
+def stats(request):
+    ''' Профиль запросов (bookland.profiling, при BOOKLAND_PROFILING) и кэш каталога этого процесса. '''
+    denied = _staff_only(request)
+    if denied:
+        return denied
+    return JsonResponse({
+        'profiling': settings.BOOKLAND_PROFILING,
+        **profiling.stats(),
+        'cache': cache.stats(),
+    })